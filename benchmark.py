@@ -0,0 +1,200 @@
+import argparse
+import csv
+import json
+import math
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from solver import solve
+
+LAYOUTS = ('uniform', 'clustered')
+FLEETS = ('uniform', 'mixed')
+DEFAULT_SIZES = (10, 100, 1000, 10000)
+
+def _solve_sa(instance, time_limit, seed, stats):
+    return solve(instance, 'sa', time_limit=time_limit, seed=seed, stats=stats)
+
+
+def _solve_ga(instance, time_limit, seed, stats):
+    return solve(instance, 'ga', time_limit=time_limit, seed=seed, stats=stats)
+
+
+# Solvers timed by the benchmark: name -> function(instance, time_limit, seed, stats) returning a solve() result.
+# New solvers are benchmarked by adding them here (module-level functions, they run in a child process).
+SOLVERS = {'sa': _solve_sa, 'ga': _solve_ga}
+
+SUMMARY_FIELDS = ('solver', 'n', 'layout', 'fleet', 'seed', 'wall_time', 'evaluations', 'evals_per_sec',
+                  'peak_memory_mb', 'distance', 'priority_score', 'unassigned')
+
+
+# Seeded random instance with n packages on the 0-100 km grid.
+# layout: 'uniform' destinations or 'clustered' around a few centres.
+# fleet: 'uniform' capacities or 'mixed' small/medium/large vans; total capacity is ~20% above total weight.
+def generate_instance(n, layout='uniform', fleet='uniform', seed=None):
+    if layout not in LAYOUTS:
+        raise ValueError(f"Unknown layout '{layout}' (expected one of {', '.join(LAYOUTS)})")
+    if fleet not in FLEETS:
+        raise ValueError(f"Unknown fleet '{fleet}' (expected one of {', '.join(FLEETS)})")
+    rng = random.Random(seed)
+
+    if layout == 'clustered':
+        centres = [(rng.uniform(10, 90), rng.uniform(10, 90)) for _ in range(max(1, round(math.sqrt(n) / 2)))]
+    packages = []
+    for i in range(1, n + 1):
+        if layout == 'uniform':
+            x, y = rng.uniform(0, 100), rng.uniform(0, 100)
+        else:
+            cx, cy = rng.choice(centres)
+            x = min(100.0, max(0.0, rng.gauss(cx, 5)))
+            y = min(100.0, max(0.0, rng.gauss(cy, 5)))
+        packages.append({'id': i, 'x': round(x, 2), 'y': round(y, 2), 'weight': float(rng.randint(1, 20)),
+                         'priority': rng.randint(1, 5)})
+
+    needed = sum(p['weight'] for p in packages) * 1.2
+    vehicles = []
+    while needed > 0:
+        capacity = 100.0 if fleet == 'uniform' else rng.choice((50.0, 100.0, 200.0))
+        vehicles.append({'id': len(vehicles) + 1, 'capacity': capacity})
+        needed -= capacity
+    return {'vehicles': vehicles, 'packages': packages}
+
+
+def _peak_rss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+
+
+def _measure(solver_name, instance, time_limit, seed):
+    stats = {}
+    if resource is None:
+        tracemalloc.start()  # slows the solve down, only used where peak RSS is unavailable
+    else:
+        rss_before = _peak_rss()
+    start = time.perf_counter()
+    result = SOLVERS[solver_name](instance, time_limit, seed, stats)
+    wall_time = time.perf_counter() - start
+    if resource is None:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    else:
+        peak = _peak_rss() - rss_before
+    return result, stats, wall_time, peak
+
+
+# Solve one instance in a fresh process and measure wall time, evaluations per second,
+# peak memory growth and the best cost over time
+def run_case(solver_name, instance, time_limit=None, seed=None):
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        result, stats, wall_time, peak = executor.submit(_measure, solver_name, instance, time_limit, seed).result()
+    return {
+        'solver': solver_name,
+        'wall_time': wall_time,
+        'evaluations': result['evaluations'],
+        'evals_per_sec': result['evaluations'] / wall_time if wall_time > 0 else 0.0,
+        'peak_memory_mb': peak / 2**20,
+        'distance': result['distance'],
+        'priority_score': result['priority_score'],
+        'unassigned': len(result['unassigned']),
+        'trace': stats.get('trace', []),
+    }
+
+
+def run_benchmark(sizes=DEFAULT_SIZES, layouts=LAYOUTS, fleets=FLEETS, solvers=tuple(SOLVERS), time_limit=None,
+                  repeats=1, seed=0, progress=print):
+    records = []
+    for n in sizes:
+        for layout in layouts:
+            for fleet in fleets:
+                for r in range(repeats):
+                    case_seed = seed + r
+                    instance = generate_instance(n, layout, fleet, case_seed)
+                    for name in solvers:
+                        record = {'n': n, 'layout': layout, 'fleet': fleet, 'seed': case_seed}
+                        record.update(run_case(name, instance, time_limit, case_seed))
+                        records.append(record)
+                        if progress:
+                            progress(f"{name:>3} n={n:<6} {layout:<9} {fleet:<7} seed={case_seed} "
+                                     f"{record['wall_time']:8.2f} s {record['evals_per_sec']:10.0f} eval/s "
+                                     f"{record['peak_memory_mb']:8.1f} MB distance={record['distance']:.1f}")
+    return records
+
+
+# Full report (with traces) as JSON, plus a CSV summary next to it when csv_path is given
+def write_report(records, json_path, csv_path=None):
+    report = {'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+              'machine': platform.machine(), 'records': records}
+    with open(json_path, 'w') as f:
+        json.dump(report, f, indent=1)
+    if csv_path:
+        with open(csv_path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, SUMMARY_FIELDS, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(records)
+
+
+def _case_key(record):
+    return record['solver'], record['n'], record['layout'], record['fleet'], record['seed']
+
+
+# Cases of current that got slower (wall time or evaluations per second) or worse (distance)
+# than in baseline by more than tolerance (a fraction). Returns a list of readable messages.
+def compare_reports(baseline_path, current_path, tolerance=0.1):
+    with open(baseline_path) as f:
+        baseline = {_case_key(r): r for r in json.load(f)['records']}
+    with open(current_path) as f:
+        current = json.load(f)['records']
+
+    regressions = []
+    for record in current:
+        old = baseline.get(_case_key(record))
+        if old is None:
+            continue
+        case = '{} n={} {} {} seed={}'.format(*_case_key(record))
+        if old['evals_per_sec'] > 0 and record['evals_per_sec'] < old['evals_per_sec'] * (1 - tolerance):
+            regressions.append(f"{case}: {record['evals_per_sec']:.0f} eval/s, was {old['evals_per_sec']:.0f}")
+        if record['distance'] > old['distance'] * (1 + tolerance):
+            regressions.append(f"{case}: distance {record['distance']:.1f}, was {old['distance']:.1f}")
+        if record['wall_time'] > old['wall_time'] * (1 + tolerance) and record['wall_time'] - old['wall_time'] > 0.05:
+            regressions.append(f"{case}: {record['wall_time']:.2f} s, was {old['wall_time']:.2f} s")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the solvers on generated instances.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES))
+    parser.add_argument('--layouts', nargs='+', choices=LAYOUTS, default=list(LAYOUTS))
+    parser.add_argument('--fleets', nargs='+', choices=FLEETS, default=list(FLEETS))
+    parser.add_argument('--solvers', nargs='+', choices=sorted(SOLVERS), default=sorted(SOLVERS))
+    parser.add_argument('-t', '--time-limit', type=float, default=10.0, help="budget per solve in seconds")
+    parser.add_argument('-r', '--repeats', type=int, default=1)
+    parser.add_argument('-s', '--seed', type=int, default=0)
+    parser.add_argument('-o', '--output', default='benchmark.json', help="JSON report (a .csv summary is written "
+                                                                         "next to it)")
+    parser.add_argument('--compare', metavar='BASELINE', help="report regressions against an earlier JSON report")
+    parser.add_argument('--tolerance', type=float, default=0.1)
+    args = parser.parse_args(argv)
+
+    records = run_benchmark(args.sizes, args.layouts, args.fleets, args.solvers, args.time_limit, args.repeats,
+                            args.seed)
+    csv_path = args.output[:-5] + '.csv' if args.output.endswith('.json') else args.output + '.csv'
+    write_report(records, args.output, csv_path)
+    print(f"Report written to {args.output} and {csv_path}")
+
+    if args.compare:
+        regressions = compare_reports(args.compare, args.output, args.tolerance)
+        for message in regressions:
+            print("REGRESSION", message)
+        if regressions:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import argparse
+import os
+import struct
+
+import numpy as np
+
+from models import Instance
+
+# File layout: a 64-byte header (magic, then little-endian uint64 counts) followed by the columns,
+# each stored contiguously as little-endian 8-byte values, so every column starts 8-byte aligned
+# and can be mapped straight into a NumPy array.
+HEADER_SIZE = 64
+INSTANCE_MAGIC = b'PKGINST1'
+SOLUTION_MAGIC = b'PKGSOLN1'
+# (Instance attribute, dtype) in file order; package columns first, then vehicle columns
+PACKAGE_COLUMNS = (('package_ids', '<i8'), ('x', '<f8'), ('y', '<f8'), ('weight', '<f8'), ('priority', '<i8'))
+VEHICLE_COLUMNS = (('vehicle_ids', '<i8'), ('capacity', '<f8'))
+
+
+def _write_header(f, magic, *counts):
+    header = magic + struct.pack(f'<{len(counts)}Q', *counts)
+    f.write(header.ljust(HEADER_SIZE, b'\0'))
+
+
+def _read_header(data, magic, path):
+    if len(data) < HEADER_SIZE or bytes(data[:len(magic)]) != magic:
+        raise ValueError(f"{path} does not start with {magic.decode()}")
+    return struct.unpack_from('<2Q', data, len(magic))
+
+
+# Write a models.Instance (or a solver-style dict instance) in the binary columnar format
+def write_instance(path, instance):
+    if isinstance(instance, dict):
+        instance = Instance.from_dicts(instance['vehicles'], instance['packages'])
+    with open(path, 'wb') as f:
+        _write_header(f, INSTANCE_MAGIC, instance.n_packages, instance.n_vehicles)
+        for name, dtype in PACKAGE_COLUMNS + VEHICLE_COLUMNS:
+            np.ascontiguousarray(getattr(instance, name), dtype=dtype).tofile(f)
+
+
+# Map a binary instance file into a models.Instance without copying: every column is a view of
+# one read-only memory map, so worker processes that open the same file share its pages through
+# the OS page cache instead of each holding a copy. mode='c' gives private copy-on-write columns
+# for callers that edit the instance (e.g. replanning.Replanner).
+def load_instance(path, mode='r'):
+    data = np.memmap(path, dtype=np.uint8, mode=mode)
+    n_packages, n_vehicles = _read_header(data, INSTANCE_MAGIC, path)
+    columns = {}
+    offset = HEADER_SIZE
+    for (name, dtype), count in zip(PACKAGE_COLUMNS + VEHICLE_COLUMNS,
+                                    [n_packages] * len(PACKAGE_COLUMNS) + [n_vehicles] * len(VEHICLE_COLUMNS)):
+        columns[name] = np.frombuffer(data, dtype=dtype, count=count, offset=offset)
+        offset += count * 8
+    return Instance(**columns)
+
+
+# Write routes (one list or array of package indices per vehicle) as route offsets + package indices
+def write_solution(path, routes):
+    lengths = np.fromiter((len(route) for route in routes), dtype=np.int64, count=len(routes))
+    offsets = np.zeros(len(routes) + 1, dtype='<i8')
+    np.cumsum(lengths, out=offsets[1:])
+    with open(path, 'wb') as f:
+        _write_header(f, SOLUTION_MAGIC, len(routes), int(offsets[-1]))
+        offsets.tofile(f)
+        for route in routes:
+            np.asarray(route, dtype='<i8').tofile(f)
+
+
+# Map a binary solution: (offsets, indices), where the route of vehicle k is indices[offsets[k]:offsets[k + 1]]
+def load_solution(path):
+    data = np.memmap(path, dtype=np.uint8, mode='r')
+    n_routes, n_indices = _read_header(data, SOLUTION_MAGIC, path)
+    offsets = np.frombuffer(data, dtype='<i8', count=n_routes + 1, offset=HEADER_SIZE)
+    indices = np.frombuffer(data, dtype='<i8', count=n_indices, offset=HEADER_SIZE + (n_routes + 1) * 8)
+    return offsets, indices
+
+
+# Routes as lists of package indices, the form the solvers work on
+def solution_routes(offsets, indices):
+    return [indices[a:b].tolist() for a, b in zip(offsets[:-1].tolist(), offsets[1:].tolist())]
+
+
+# Convert a JSON/CSV instance file to the binary format
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert a JSON or CSV instance to the binary columnar format.")
+    parser.add_argument('source', help="instance file (.json or .csv)")
+    parser.add_argument('output', help="binary instance file to write")
+    args = parser.parse_args(argv)
+
+    from solver import load_instance as load_text_instance
+    write_instance(args.output, load_text_instance(args.source))
+    print(f"Wrote {args.output} ({os.path.getsize(args.output)} bytes)")
+
+
+if __name__ == "__main__":
+    main()
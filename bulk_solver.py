@@ -0,0 +1,125 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from solver import solve
+
+INSTANCE_EXTENSIONS = ('.json', '.csv')
+
+
+# Lazily yield (instance_id, instance) from a JSON Lines file (one instance per line, optional "id")
+# or from a directory of .json/.csv instance files (id = file name). A line that does not hold a
+# JSON object yields (line number, the ValueError) instead.
+def iter_instances(source):
+    if os.path.isdir(source):
+        for name in sorted(os.listdir(source)):
+            if os.path.splitext(name)[1].lower() in INSTANCE_EXTENSIONS:
+                yield name, os.path.join(source, name)
+        return
+    with open(source) as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                instance = json.loads(line)
+                if not isinstance(instance, dict):
+                    raise ValueError(f"Line {line_number} is a JSON {type(instance).__name__}, not an object")
+            except ValueError as e:
+                yield str(line_number), e
+                continue
+            yield str(instance.get('id', line_number)), instance
+
+
+# Ids solved successfully in an output file, and whether it ends in the middle of a line
+def completed_ids(output):
+    done = set()
+    if not os.path.exists(output):
+        return done, False
+    line = b''
+    with open(output, 'rb') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # line cut short by a crash
+            if record.get('status') == 'ok':
+                done.add(record['instance_id'])
+    return done, bool(line) and not line.endswith(b'\n')
+
+
+def _solve_one(instance_id, instance, algorithm, params, time_limit, seed):
+    start = time.time()
+    record = {'instance_id': instance_id, 'algorithm': algorithm}
+    try:
+        result = solve(instance, algorithm, params, time_limit, seed)
+        record.update(status='ok', distance=result['distance'], priority_score=result['priority_score'],
+                      unassigned=len(result['unassigned']), solve_time=result['elapsed'], routes=result['routes'])
+    except Exception as e:
+        record.update(status='error', error=f"{type(e).__name__}: {e}")
+    record['wall_time'] = time.time() - start
+    return record
+
+
+# Solve every instance of source on a process pool and append one JSON line per instance to output.
+# At most 2 * workers instances are held in memory; instances already solved in output are skipped,
+# so an interrupted run continues where it stopped (failed ones are retried). Unreadable lines of a JSON Lines
+# source are written as failed records and the run goes on. Returns (solved, skipped, failed) counts.
+def solve_bulk(source, output, algorithm='sa', params=None, time_limit=None, seed=None, workers=None):
+    workers = workers or os.cpu_count()
+    done, cut_short = completed_ids(output)
+    solved = skipped = failed = 0
+
+    with open(output, 'a') as out, ProcessPoolExecutor(max_workers=workers) as executor:
+        if cut_short:
+            out.write('\n')
+        pending = set()
+
+        def drain(return_when):
+            nonlocal pending, solved, failed
+            finished, pending = wait(pending, return_when=return_when)
+            for future in finished:
+                record = future.result()
+                out.write(json.dumps(record) + '\n')
+                solved += record['status'] == 'ok'
+                failed += record['status'] != 'ok'
+            out.flush()
+
+        for instance_id, instance in iter_instances(source):
+            if instance_id in done:
+                skipped += 1
+                continue
+            if isinstance(instance, ValueError):
+                out.write(json.dumps({'instance_id': instance_id, 'algorithm': algorithm, 'status': 'error',
+                                      'error': f"{type(instance).__name__}: {instance}", 'wall_time': 0.0}) + '\n')
+                failed += 1
+                continue
+            pending.add(executor.submit(_solve_one, instance_id, instance, algorithm, params, time_limit, seed))
+            if len(pending) >= 2 * workers:
+                drain(FIRST_COMPLETED)
+        if pending:
+            drain('ALL_COMPLETED')
+
+    return solved, skipped, failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Solve many instances and stream the results to a JSONL file.")
+    parser.add_argument('source', help="JSON Lines file or directory of instance files")
+    parser.add_argument('output', help="results file (JSON Lines, appended to and resumed from)")
+    parser.add_argument('-a', '--algorithm', choices=['sa', 'ga'], default='sa')
+    parser.add_argument('-p', '--params', default='{}', help="solver parameters as a JSON object")
+    parser.add_argument('-t', '--time-limit', type=float, help="wall-clock budget per instance in seconds")
+    parser.add_argument('-s', '--seed', type=int)
+    parser.add_argument('-w', '--workers', type=int)
+    args = parser.parse_args(argv)
+
+    start = time.time()
+    solved, skipped, failed = solve_bulk(args.source, args.output, args.algorithm, json.loads(args.params),
+                                         args.time_limit, args.seed, args.workers)
+    print(f"Solved {solved}, skipped {skipped} already done, failed {failed} in {time.time() - start:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
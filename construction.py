@@ -0,0 +1,199 @@
+import heapq
+import math
+import random
+from collections import deque
+from itertools import islice
+from distance_matrix import DistanceMatrix
+from spatial_index import GridIndex
+
+# Neighbors per package considered for Clarke-Wright savings
+SAVINGS_NEIGHBORS = 20
+
+
+# Construction heuristics over a models.Instance. Each returns one route per vehicle of the instance,
+# as lists of package indices in delivery order (the form both solvers search on); packages that fit
+# no vehicle are left out, like assign_packages_randomly does.
+
+
+# Visit order for a set of package indices by repeatedly going to the nearest one, starting at the shop
+def nearest_neighbor_order(instance, packages, depot=(0, 0)):
+    xs, ys = instance.x.tolist(), instance.y.tolist()
+    index = GridIndex([xs[p] for p in packages], [ys[p] for p in packages])
+    x, y = depot
+    order = []
+    while len(index):
+        i = index.nearest(x, y)[0]
+        index.remove(i)
+        order.append(packages[i])
+        x, y = index.xs[i], index.ys[i]
+    return order
+
+
+# Fill the vehicles one after another, each time driving to the nearest package that still fits
+def nearest_neighbor_routes(instance, depot=(0, 0), index=None):
+    weights = instance.weight.tolist()
+    if index is None:
+        index = GridIndex(instance.x, instance.y)
+    # Lightest package left, to close a vehicle as soon as nothing fits any more
+    lightest = [(w, p) for p, w in enumerate(weights)]
+    heapq.heapify(lightest)
+    visited = [False] * len(weights)
+    # Packages by distance from the shop: every route starts near the shop, where the earlier
+    # routes have emptied the grid, so those first picks are read from this list instead
+    by_shop = sorted(range(len(weights)), key=lambda p: math.hypot(index.xs[p] - depot[0], index.ys[p] - depot[1]))
+    closest = 0
+
+    routes = []
+    for capacity in instance.capacity.tolist():
+        route = []
+        free = capacity
+        x, y = depot
+        while len(index):
+            while visited[lightest[0][1]]:
+                heapq.heappop(lightest)
+            if lightest[0][0] > free:
+                break
+            if route:
+                p = index.nearest(x, y, accept=lambda i: weights[i] <= free)[0]
+            else:
+                while visited[by_shop[closest]]:
+                    closest += 1
+                p = next(p for p in islice(by_shop, closest, None) if not visited[p] and weights[p] <= free)
+            index.remove(p)
+            visited[p] = True
+            route.append(p)
+            free -= weights[p]
+            x, y = index.xs[p], index.ys[p]
+        routes.append(route)
+    return routes
+
+
+# Sweep: sort the packages by polar angle around the shop and cut the circle into one sector per
+# vehicle, each filled up to its share of the total weight (or its capacity when that is smaller).
+# Each sector is then visited in nearest-neighbor order.
+def sweep_routes(instance, depot=(0, 0), start_angle=0.0, clockwise=False):
+    weights = instance.weight.tolist()
+    capacities = instance.capacity.tolist()
+    angles = [(math.atan2(y - depot[1], x - depot[0]) - start_angle) % (2 * math.pi)
+              for x, y in zip(instance.x.tolist(), instance.y.tolist())]
+    order = sorted(range(len(weights)), key=angles.__getitem__, reverse=clockwise)
+
+    total_weight = sum(weights)
+    total_capacity = sum(capacities) or 1
+    targets = [min(cap, cap * total_weight / total_capacity) for cap in capacities]
+    if targets:
+        targets[-1] = capacities[-1]
+
+    routes = [[] for _ in capacities]
+    loads = [0] * len(capacities)
+    leftover = []
+    k = 0
+    for p in order:
+        while k < len(routes) and loads[k] + weights[p] > capacities[k]:
+            k += 1
+        if k == len(routes):
+            leftover.append(p)
+            continue
+        routes[k].append(p)
+        loads[k] += weights[p]
+        if loads[k] >= targets[k]:
+            k += 1
+    place_leftovers(leftover, routes, loads, weights, capacities)
+    return [nearest_neighbor_order(instance, route, depot) if route else route for route in routes]
+
+
+# Clarke-Wright savings: start with one route per package and merge route ends in order of the
+# saving d(0, i) + d(0, j) - d(i, j). Only the nearest neighbors of every package are paired, so
+# building the savings list stays O(n * neighbors) instead of O(n^2).
+# Merged routes are limited to the largest capacity and then packed into the vehicles.
+def savings_routes(instance, distance_matrix=None, neighbors=SAVINGS_NEIGHBORS, index=None):
+    n = instance.n_packages
+    weights = instance.weight.tolist()
+    capacities = instance.capacity.tolist()
+    if distance_matrix is None:
+        distance_matrix = DistanceMatrix.from_instance(instance)
+    if index is None:
+        index = GridIndex(instance.x, instance.y)
+    distance = distance_matrix.distance
+    to_shop = [distance(0, p + 1) for p in range(n)]
+
+    pairs = {(min(i, j), max(i, j)) for i, near in enumerate(index.neighbor_lists(neighbors)) for j in near}
+    savings = []
+    for i, j in pairs:
+        saving = to_shop[i] + to_shop[j] - distance(i + 1, j + 1)
+        if saving > 0:
+            savings.append((saving, i, j))
+    savings.sort(reverse=True)
+
+    max_capacity = max(capacities, default=0)
+    route_of = list(range(n))
+    members = [deque([p]) for p in range(n)]
+    loads = list(weights)
+    for _, i, j in savings:
+        a, b = route_of[i], route_of[j]
+        if a == b or loads[a] + loads[b] > max_capacity:
+            continue
+        A, B = members[a], members[b]
+        if i not in (A[0], A[-1]) or j not in (B[0], B[-1]):
+            continue
+        # Merge the shorter route into the longer one so relabelling stays cheap
+        if len(A) < len(B):
+            a, b, A, B, i, j = b, a, B, A, j, i
+        tail = list(B) if B[0] == j else list(reversed(B))
+        if A[-1] == i:
+            A.extend(tail)
+        else:
+            A.extendleft(tail)
+        for p in tail:
+            route_of[p] = a
+        loads[a] += loads[b]
+        members[b] = None
+
+    # Packages heavier than every vehicle stay single and are dropped here
+    merged = sorted((r for r in set(route_of) if loads[r] <= max_capacity), key=lambda r: -loads[r])
+    routes = [[] for _ in capacities]
+    free = list(capacities)
+    leftover = []
+    for r in merged:
+        route, load = members[r], loads[r]
+        # Best fit: the vehicle with the least room left that still takes the whole route
+        fits = [k for k in range(len(free)) if free[k] >= load]
+        if fits:
+            k = min(fits, key=free.__getitem__)
+            routes[k].extend(route)
+            free[k] -= load
+        else:
+            leftover.extend(route)
+    place_leftovers(leftover, routes, [cap - room for cap, room in zip(capacities, free)], weights, capacities)
+    return routes
+
+
+# Append packages that found no place to the first vehicle with room (largest first)
+def place_leftovers(leftover, routes, loads, weights, capacities):
+    for p in sorted(leftover, key=lambda p: -weights[p]):
+        for k, route in enumerate(routes):
+            if loads[k] + weights[p] <= capacities[k]:
+                route.append(p)
+                loads[k] += weights[p]
+                break
+
+
+HEURISTICS = {
+    'savings': savings_routes,
+    'sweep': sweep_routes,
+    'nearest_neighbor': nearest_neighbor_routes,
+}
+
+
+# Routes from the named heuristic ('savings', 'sweep' or 'nearest_neighbor')
+def construct_routes(instance, method='savings', distance_matrix=None):
+    if method not in HEURISTICS:
+        raise ValueError(f"Unknown construction heuristic '{method}' (expected one of {', '.join(HEURISTICS)})")
+    if method == 'savings':
+        return savings_routes(instance, distance_matrix)
+    return HEURISTICS[method](instance)
+
+
+# A randomized variant for seeding populations: a sweep from a random angle and direction
+def random_sweep_routes(instance):
+    return sweep_routes(instance, start_angle=random.uniform(0, 2 * math.pi), clockwise=random.random() < 0.5)
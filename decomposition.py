@@ -0,0 +1,252 @@
+import argparse
+import heapq
+import json
+import math
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import binary_format
+from construction import construct_routes
+from distance_matrix import DistanceMatrix
+from models import Instance, decode_routes
+from replanning import Replanner
+from simulated_annealing_module import anneal_routes
+from genetic_algorithm_module import initialize_population, evolve
+from solver import ALGORITHMS
+
+# Packages per cluster aimed for when partitioning
+CLUSTER_SIZE = 1000
+# k-means runs on a sample of the destinations; only the final labelling visits every package
+KMEANS_SAMPLE = 50000
+KMEANS_ITERATIONS = 10
+# Rows of the package/center distance block worked on at once
+KMEANS_CHUNK = 8192
+# Boundary packages are found on a grid with about this many packages per cell
+BOUNDARY_CELL_PACKAGES = 8
+# Share of the time limit kept for the boundary repair
+REPAIR_SHARE = 0.1
+# SA moves per boundary package in the repair
+REPAIR_EVALUATIONS_PER_PACKAGE = 50
+
+# Instance of the current worker process, set once by _init_worker
+_problem = {}
+
+
+# Cluster-first, route-second for large depots: the packages are cut into geographic clusters, each
+# with its own group of vehicles sized to the cluster's weight, every cluster is solved on its own
+# with SA or GA on a process pool, and a repair pass then moves packages across the cluster borders.
+
+
+# Split the vehicles into groups whose capacities follow demands (one group per demand). First every
+# group with demand gets one vehicle, the largest vehicles going to the largest demands, as far as
+# the fleet goes; then each other vehicle, largest first, goes to the group with the most demand
+# still uncovered.
+def vehicle_groups(capacities, demands):
+    vehicles = sorted(range(len(capacities)), key=lambda v: -capacities[v])
+    wanted = sorted((g for g, demand in enumerate(demands) if demand > 0), key=lambda g: -demands[g])
+    groups = [[] for _ in demands]
+    uncovered = list(demands)
+    for g, v in zip(wanted, vehicles):
+        groups[g].append(v)
+        uncovered[g] -= capacities[v]
+    heap = [(-demand, g) for g, demand in enumerate(uncovered)]
+    heapq.heapify(heap)
+    for v in vehicles[len(wanted):]:
+        remaining, g = heapq.heappop(heap)
+        groups[g].append(v)
+        heapq.heappush(heap, (remaining + capacities[v], g))
+    return [sorted(group) for group in groups]
+
+
+# Sweep: k sectors around the depot holding equal shares of the total weight
+def sweep_labels(instance, k, depot=(0, 0), seed=None):
+    angles = np.arctan2(instance.y - depot[1], instance.x - depot[0])
+    order = np.argsort(angles, kind='stable')
+    weight = np.cumsum(instance.weight[order])
+    labels = np.empty(instance.n_packages, dtype=np.int64)
+    labels[order] = np.minimum(((weight - instance.weight[order] / 2) * k / weight[-1]).astype(np.int64), k - 1)
+    return labels
+
+
+def _nearest_center(points, centers):
+    labels = np.empty(len(points), dtype=np.int64)
+    squared = (centers ** 2).sum(axis=1)
+    for a in range(0, len(points), KMEANS_CHUNK):
+        block = points[a:a + KMEANS_CHUNK]
+        labels[a:a + KMEANS_CHUNK] = np.argmin(squared[None, :] - 2 * block @ centers.T, axis=1)
+    return labels
+
+
+# k-means: k compact clusters of destinations, fitted on a sample with Lloyd's algorithm
+def kmeans_labels(instance, k, depot=(0, 0), seed=None):
+    rng = np.random.default_rng(seed)
+    points = np.column_stack((instance.x, instance.y))
+    sample = points[rng.choice(len(points), min(len(points), KMEANS_SAMPLE), replace=False)]
+    centers = sample[rng.choice(len(sample), k, replace=False)]
+    for _ in range(KMEANS_ITERATIONS):
+        labels = _nearest_center(sample, centers)
+        counts = np.bincount(labels, minlength=k)
+        sums = np.column_stack([np.bincount(labels, sample[:, axis], minlength=k) for axis in (0, 1)])
+        empty = counts == 0
+        centers = np.where(empty[:, None], sample[rng.choice(len(sample), k)], sums / np.maximum(counts, 1)[:, None])
+    return _nearest_center(points, centers)
+
+
+PARTITIONS = {'sweep': sweep_labels, 'kmeans': kmeans_labels}
+
+
+# Partition an instance into clusters of about cluster_size packages (never more clusters than
+# vehicles), each with a group of vehicles whose capacity covers the cluster's weight as far as
+# the fleet allows. Returns (package index array, vehicle index list) per cluster.
+def partition(instance, method='sweep', cluster_size=CLUSTER_SIZE, depot=(0, 0), seed=None):
+    if method not in PARTITIONS:
+        raise ValueError(f"Unknown partition method '{method}' (expected one of {', '.join(PARTITIONS)})")
+    k = max(1, min(math.ceil(instance.n_packages / cluster_size), instance.n_vehicles))
+    labels = PARTITIONS[method](instance, k, depot, seed)
+    groups = vehicle_groups(instance.capacity.tolist(), np.bincount(labels, instance.weight, minlength=k).tolist())
+    order = np.argsort(labels, kind='stable')
+    bounds = np.searchsorted(labels[order], np.arange(k + 1))
+    return [(order[bounds[c]:bounds[c + 1]], groups[c]) for c in range(k)]
+
+
+# Packages in grid cells shared by more than one cluster, i.e. near the cluster borders
+def boundary_packages(instance, labels):
+    n = instance.n_packages
+    x0, y0 = instance.x.min(), instance.y.min()
+    width, height = instance.x.max() - x0, instance.y.max() - y0
+    cell_size = max(math.sqrt(max(width, 1e-9) * max(height, 1e-9) * BOUNDARY_CELL_PACKAGES / max(n, 1)), 1e-9)
+    rows = int(height // cell_size) + 1
+    cells = ((instance.x - x0) // cell_size).astype(np.int64) * rows + ((instance.y - y0) // cell_size).astype(np.int64)
+    k = int(labels.max()) + 1
+    # Distinct (cell, cluster) pairs, counted per cell
+    pairs = np.unique(cells * k + labels)
+    shared = np.bincount(pairs // k, minlength=(int(width // cell_size) + 1) * rows) > 1
+    return np.nonzero(shared[cells])[0]
+
+
+def _init_worker(source):
+    _problem['instance'] = binary_format.load_instance(source) if isinstance(source, str) else source
+
+
+# Solve one cluster; returns its routes as global package indices, one per vehicle of the cluster
+def _solve_cluster(cluster, packages, vehicles, algorithm, params, time_limit, seed):
+    start = time.time()
+    random.seed(seed)
+    full = _problem['instance']
+    instance = Instance(full.package_ids[packages], full.x[packages], full.y[packages], full.weight[packages],
+                        full.priority[packages], full.vehicle_ids[vehicles], full.capacity[vehicles])
+    params = dict(params)
+    distance_matrix = DistanceMatrix.from_instance(instance)
+    if algorithm == 'sa':
+        routes = construct_routes(instance, params.pop('initial', 'savings'), distance_matrix)
+        weights = instance.weight.tolist()
+        loads = [sum(weights[p] for p in route) for route in routes]
+    else:
+        population = initialize_population(instance, params.pop('population_size', 30),
+                                           params.pop('seed_fraction', 0.2), distance_matrix)
+    # The time spent building the start comes out of the cluster's budget
+    if time_limit is not None:
+        time_limit = max(time_limit - (time.time() - start), 0.0)
+    if algorithm == 'sa':
+        best_routes, _, _ = anneal_routes(instance, routes, loads, distance_matrix, time_limit=time_limit, **params)
+        routes = decode_routes(best_routes)
+    else:
+        routes = evolve(population, instance, distance_matrix=distance_matrix, time_limit=time_limit, **params)
+    routes = [packages[route].tolist() for route in routes]
+    return {'cluster': cluster, 'worker': os.getpid(), 'packages': len(packages), 'vehicles': len(vehicles),
+            'elapsed': time.time() - start, 'routes': routes}
+
+
+# Solve a large instance by decomposition. instance is a models.Instance or the path of a binary
+# instance file (binary_format); with a path every worker maps the same file instead of receiving
+# a copy. Clusters come from partition (method 'sweep' or 'kmeans') and are solved in parallel with
+# SA ('sa', from a savings start) or the GA ('ga'); params go to anneal_routes / evolve. A cluster
+# left without vehicles (more clusters with demand than vehicles) is not solved: its packages wait
+# for the repair. time_limit
+# is split between the clusters, keeping REPAIR_SHARE for the repair: the clusters' routes are joined
+# and replanning.Replanner inserts the packages no cluster could take and runs a focused SA over the
+# packages near cluster borders, where moves can cross between neighboring clusters' routes.
+# Returns the routes (package indices, one list per vehicle) with distance and per-cluster stats.
+def solve_decomposed(instance, algorithm='sa', method='sweep', cluster_size=CLUSTER_SIZE, workers=None,
+                     time_limit=None, seed=None, repair=True, **params):
+    if algorithm not in ALGORITHMS:
+        raise ValueError(f"Unknown algorithm '{algorithm}' (expected one of {', '.join(ALGORITHMS)})")
+    start = time.time()
+    source = instance
+    if isinstance(instance, (str, os.PathLike)):
+        source = os.fspath(instance)
+        instance = binary_format.load_instance(source)
+    rng = random.Random(seed)
+    workers = workers or os.cpu_count()
+
+    clusters = partition(instance, method, cluster_size, seed=seed)
+    cluster_time = None
+    if time_limit is not None:
+        rounds = math.ceil(len(clusters) / workers)
+        cluster_time = time_limit * (1 - REPAIR_SHARE if repair else 1) / rounds
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(clusters)), initializer=_init_worker,
+                             initargs=(source,)) as executor:
+        futures = [executor.submit(_solve_cluster, c, packages, vehicles, algorithm, params, cluster_time,
+                                   rng.randrange(2**32))
+                   for c, (packages, vehicles) in enumerate(clusters) if len(packages) and vehicles]
+        stats = [f.result() for f in futures]
+
+    routes = [[] for _ in range(instance.n_vehicles)]
+    labels = np.empty(instance.n_packages, dtype=np.int64)
+    for c, (packages, _) in enumerate(clusters):
+        labels[packages] = c
+    for r in stats:
+        _, vehicles = clusters[r['cluster']]
+        for v, route in zip(vehicles, r.pop('routes')):
+            routes[v] = route
+
+    distance_matrix = DistanceMatrix.from_instance(instance)
+    repair_stats = None
+    if repair:
+        repair_start = time.time()
+        planner = Replanner(instance, routes, distance_matrix)
+        border = boundary_packages(instance, labels)
+        planner.changed.update(p for p in border.tolist() if planner.route_of[p] >= 0)
+        remaining = None if time_limit is None else max(time_limit - (time.time() - start), 0.0)
+        repair_params = {'max_evaluations': REPAIR_EVALUATIONS_PER_PACKAGE * max(len(planner.changed), 1),
+                         'polish': remaining is None}
+        inserted = planner.refine('sa', remaining, **repair_params)
+        routes = planner.routes
+        repair_stats = {'boundary': len(border), 'inserted': inserted, 'elapsed': time.time() - repair_start}
+
+    assigned = sum(len(route) for route in routes)
+    distance = sum(distance_matrix.distance(0, route[0] + 1) + distance_matrix.distance(route[-1] + 1, 0)
+                   + sum(distance_matrix.distance(a + 1, b + 1) for a, b in zip(route, route[1:]))
+                   for route in routes if route)
+    return {'routes': routes, 'distance': distance, 'unassigned': instance.n_packages - assigned,
+            'elapsed': time.time() - start, 'clusters': stats, 'repair': repair_stats}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Solve a large binary instance cluster by cluster.")
+    parser.add_argument('instance', help="binary instance file (see binary_format.py)")
+    parser.add_argument('output', help="binary solution file to write")
+    parser.add_argument('-a', '--algorithm', choices=['sa', 'ga'], default='sa')
+    parser.add_argument('-m', '--method', choices=list(PARTITIONS), default='sweep')
+    parser.add_argument('-c', '--cluster-size', type=int, default=CLUSTER_SIZE)
+    parser.add_argument('-p', '--params', default='{}', help="solver parameters as a JSON object")
+    parser.add_argument('-t', '--time-limit', type=float, help="wall-clock budget in seconds")
+    parser.add_argument('-s', '--seed', type=int)
+    parser.add_argument('-w', '--workers', type=int)
+    parser.add_argument('--no-repair', action='store_true', help="skip the boundary repair")
+    args = parser.parse_args(argv)
+
+    result = solve_decomposed(args.instance, args.algorithm, args.method, args.cluster_size, args.workers,
+                              args.time_limit, args.seed, not args.no_repair, **json.loads(args.params))
+    binary_format.write_solution(args.output, result['routes'])
+    print(f"{len(result['clusters'])} clusters, distance {result['distance']:.1f}, "
+          f"{result['unassigned']} unassigned, {result['elapsed']:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+import math
+import numpy as np
+from models import swap_remove_plan
+
+# Largest number of nodes (depot included) stored as a dense matrix, about 128 MB of float64
+DENSE_LIMIT = 4000
+# Largest number of distances kept by the lazy cache
+CACHE_LIMIT = 1_000_000
+
+
+# Coordinates of a package in any of the forms used by the solvers
+def package_point(package):
+    if isinstance(package, dict):
+        return package['x'], package['y']
+    if hasattr(package, 'destination'):
+        return package.destination
+    return package.x, package.y
+
+# Key used to look a package up in the matrix (its id, or its destination when it has none)
+def package_key(package):
+    if isinstance(package, dict):
+        return package['id']
+    if hasattr(package, 'id'):
+        return package.id
+    return package.destination
+
+
+# Distances between the shop (index 0) and every package (index 1..n).
+# Small instances get a dense NumPy matrix built once; large ones fill a bounded
+# cache on demand. A precomputed matrix (e.g. road distances) can be supplied instead.
+# Nodes can be added and removed later (add_points / remove_nodes) without rebuilding.
+class DistanceMatrix:
+    def __init__(self, points, keys=None, matrix=None, dense=None, cache_size=CACHE_LIMIT):
+        self.xs = [float(p[0]) for p in points]
+        self.ys = [float(p[1]) for p in points]
+        self.size = len(points)
+        keys = keys if keys is not None else range(1, self.size)
+        self.keys = [None] + list(keys)
+        self.index = {key: i for i, key in enumerate(self.keys)}
+
+        # Distances worked out from the coordinates (so new nodes can be added), or supplied
+        self.euclidean = matrix is None
+        if matrix is not None:
+            matrix = np.array(matrix, dtype=float)
+            if matrix.shape != (self.size, self.size):
+                raise ValueError(f"Distance matrix must be {self.size}x{self.size}, got {matrix.shape}")
+        elif dense if dense is not None else self.size <= DENSE_LIMIT:
+            xs, ys = np.array(self.xs), np.array(self.ys)
+            dx = xs[:, None] - xs[None, :]
+            dy = ys[:, None] - ys[None, :]
+            matrix = np.sqrt(dx * dx + dy * dy)
+        # Worked out once here for the move code (see moves.MoveContext); removing nodes keeps it
+        self.symmetric = self.euclidean or bool(np.allclose(matrix, matrix.T))
+        # A dense matrix is a view of the top-left corner of _buffer, which has room to grow
+        self._buffer = matrix
+        self.matrix = matrix
+        self.cache = {}
+        self.cache_size = cache_size
+
+    @classmethod
+    def from_packages(cls, packages, depot=(0, 0), matrix=None, dense=None):
+        return cls([depot] + [package_point(p) for p in packages], [package_key(p) for p in packages],
+                   matrix=matrix, dense=dense)
+
+    # Matrix over a models.Instance: node i + 1 is package index i, keyed by package id
+    @classmethod
+    def from_instance(cls, instance, depot=(0, 0), matrix=None, dense=None):
+        points = [depot] + list(zip(instance.x.tolist(), instance.y.tolist()))
+        return cls(points, instance.package_ids.tolist(), matrix=matrix, dense=dense)
+
+    @property
+    def is_dense(self):
+        return self.matrix is not None
+
+    # Matrix index of a package key (None is the shop)
+    def node(self, key):
+        return self.index[key]
+
+    # Distance between two matrix indices
+    def distance(self, i, j):
+        if self.matrix is not None:
+            return self.matrix.item(i, j)
+        if i == j:
+            return 0.0
+        pair = (i, j) if i < j else (j, i)
+        d = self.cache.get(pair)
+        if d is None:
+            d = math.sqrt((self.xs[j] - self.xs[i])**2 + (self.ys[j] - self.ys[i])**2)
+            if len(self.cache) >= self.cache_size:
+                del self.cache[next(iter(self.cache))]
+            self.cache[pair] = d
+        return d
+
+    # Append nodes for new points (keyed by keys). A dense matrix grows inside a buffer with
+    # spare room, so usually only the rows and columns of the new nodes are computed.
+    def add_points(self, points, keys):
+        if not self.euclidean:
+            raise ValueError("Cannot add points to a precomputed distance matrix")
+        old = self.size
+        for key, (x, y) in zip(keys, points):
+            self.index[key] = self.size
+            self.keys.append(key)
+            self.xs.append(float(x))
+            self.ys.append(float(y))
+            self.size += 1
+
+        if self.matrix is not None:
+            if self.size > self._buffer.shape[0]:
+                buffer = np.empty((self.size + self.size // 2,) * 2)
+                buffer[:old, :old] = self.matrix
+                self._buffer = buffer
+            xs, ys = np.array(self.xs), np.array(self.ys)
+            new = np.sqrt((xs[old:, None] - xs[None, :]) ** 2 + (ys[old:, None] - ys[None, :]) ** 2)
+            self._buffer[old:self.size, :self.size] = new
+            self._buffer[:self.size, old:self.size] = new.T
+            self.matrix = self._buffer[:self.size, :self.size]
+
+    # Remove nodes (never the shop). As in models.swap_remove_plan the last nodes move into the
+    # freed indices; returns {old node: new node} for them. The lazy cache is dropped and refills.
+    def remove_nodes(self, nodes):
+        if 0 in nodes:
+            raise ValueError("The shop (node 0) cannot be removed")
+        moves, size = swap_remove_plan(self.size, nodes)
+        for node in nodes:
+            del self.index[self.keys[node]]
+        for old, new in moves.items():
+            self.keys[new] = self.keys[old]
+            self.index[self.keys[new]] = new
+            self.xs[new] = self.xs[old]
+            self.ys[new] = self.ys[old]
+        del self.keys[size:], self.xs[size:], self.ys[size:]
+
+        if self.matrix is not None:
+            src, dst = list(moves), list(moves.values())
+            buffer = self._buffer
+            buffer[dst, :self.size] = buffer[src, :self.size]
+            buffer[:self.size, dst] = buffer[:self.size, src]
+            self.matrix = buffer[:size, :size]
+        self.cache.clear()
+        self.size = size
+        return moves
+
+    # Distance between two package keys (None is the shop)
+    def between(self, a, b):
+        return self.distance(self.index[a], self.index[b])
+
+    # Length of a closed tour shop -> nodes -> shop, nodes given as matrix indices
+    def route_distance(self, nodes):
+        if not nodes:
+            return 0.0
+        if self.matrix is not None:
+            stops = np.fromiter(nodes, dtype=np.intp, count=len(nodes))
+            return float(self.matrix[0, stops[0]] + self.matrix[stops[:-1], stops[1:]].sum() + self.matrix[stops[-1], 0])
+        total = 0.0
+        prev = 0
+        for node in nodes:
+            total += self.distance(prev, node)
+            prev = node
+        return total + self.distance(prev, 0)
+
+    # Length of a closed tour over package keys
+    def route_distance_keys(self, keys):
+        index = self.index
+        return self.route_distance([index[k] for k in keys])
@@ -1,43 +1,102 @@
-from utils import TotalRouteDistance
-import random, math
+import random
+import time
+from bisect import bisect_left
+from collections import OrderedDict, deque
+from itertools import chain
+import numpy as np
+from distance_matrix import DistanceMatrix
+from models import Instance, encode_routes
+from construction import HEURISTICS, construct_routes, random_sweep_routes, place_leftovers
+from moves import MoveContext, granular_neighbors, polish_routes
+from instrumentation import phase_timer
+from utils import run_steps
 from simulated_annealing_module import draw_solution
 
 
-def initialize_population(packages, vehicles, population_size):
+# Individuals are lists of routes, one per vehicle of the instance, each a list of package indices.
+# seed_fraction of the population comes from the construction heuristics (one of each, then sweeps
+# from random angles); the rest are random first-fit assignments.
+def initialize_population(instance, population_size, seed_fraction=0.0, distance_matrix=None):
     pop = []  # create a list
-    for _ in range(population_size):
-        random.shuffle(packages)
-        individual = assign_packages(packages[:], vehicles)
+    seeded = min(round(population_size * seed_fraction), population_size)
+    for method in list(HEURISTICS)[:seeded]:
+        pop.append(construct_routes(instance, method, distance_matrix))
+    while len(pop) < seeded:
+        pop.append(random_sweep_routes(instance))
+
+    order = list(range(instance.n_packages))
+    while len(pop) < population_size:
+        random.shuffle(order)
+        individual = assign_packages(order, instance)
         pop.append(individual)
     return pop
 
 
-def assign_packages(packages, vehicles):
-    assignments = [[] for _ in vehicles]
-    capacities = [v.capacity for v in vehicles]
-    for pkg in packages:
+def assign_packages(order, instance):
+    weights = instance.weight.tolist()
+    capacities = instance.capacity.tolist()
+    assignments = [[] for _ in capacities]
+    for pkg in order:
         for i, capacity in enumerate(capacities):
-            if capacity >= pkg.weight:
+            if capacity >= weights[pkg]:
                 assignments[i].append(pkg)
-                capacities[i] -= pkg.weight
+                capacities[i] -= weights[pkg]
                 break
     return assignments
 
 
 def Cross_Over(parent1, parent2):
-    child = [p1 if random.random() > 0.5 else p2 for p1, p2 in zip(parent1, parent2)]
+    # Routes are copied so mutating/repairing the child never touches the parents
+    child = [list(p1) if random.random() > 0.5 else list(p2) for p1, p2 in zip(parent1, parent2)]
     return child
 
 
-def FitnessFunction(individual, all_packages):
-    assigned_ids = {p.id for route in individual for p in route}
-    unassigned = [p for p in all_packages if p.id not in assigned_ids]
+def FitnessFunction(individual, instance, distance_matrix=None):
+    if distance_matrix is None:
+        distance_matrix = DistanceMatrix.from_instance(instance, dense=False)
+    weights = instance.weight.tolist()
+    priorities = instance.priority.tolist()
+    assigned = {p for route in individual for p in route}
+    unassigned = [p for p in range(instance.n_packages) if p not in assigned]
 
-    total_distance = sum(TotalRouteDistance(route) for route in individual)
+    total_distance = sum(TotalRouteDistance(route, distance_matrix) for route in individual)
 
     # Penalize unassigned packages, reward high-priority ones
-    penalty = sum(p.weight for p in unassigned) * 10  # weight penalty
-    priority_bonus = sum(p.priority for route in individual for p in route)
+    penalty = sum(weights[p] for p in unassigned) * 10  # weight penalty
+    priority_bonus = sum(priorities[p] for route in individual for p in route)
+
+    return total_distance + penalty - priority_bonus
+
+
+# Weight and priority of every distance-matrix node (shop = 0, package index i = node i + 1)
+def package_arrays(instance):
+    return np.concatenate(([0.0], instance.weight)), np.concatenate(([0], instance.priority))
+
+
+# One row of matrix nodes per individual: every route followed by a return to the shop (0),
+# rows padded with extra shop visits which add no distance
+def encode_population(population):
+    tours = [encode_routes(individual) + 1 for individual in population]
+    width = max(len(tour) for tour in tours) + 1
+    encoded = np.zeros((len(tours), width), dtype=np.intp)
+    for row, tour in zip(encoded, tours):
+        row[1:len(tour) + 1] = tour
+    return encoded
+
+
+# FitnessFunction for a whole population in one NumPy pass
+def batch_fitness(population, weights, priorities, distance_matrix):
+    tours = encode_population(population)
+    if distance_matrix.is_dense:
+        total_distance = distance_matrix.matrix[tours[:, :-1], tours[:, 1:]].sum(axis=1)
+    else:
+        total_distance = np.array([sum(map(distance_matrix.distance, row[:-1], row[1:]))
+                                   for row in tours.tolist()])
+
+    present = np.zeros((len(tours), distance_matrix.size), dtype=bool)
+    present[np.arange(len(tours))[:, None], tours] = True
+    penalty = (~present) @ weights * 10
+    priority_bonus = priorities[tours].sum(axis=1)
 
     return total_distance + penalty - priority_bonus
 
@@ -47,96 +106,379 @@ def mutation(individual, mutationRate=0.1):
         if random.random() < mutationRate and len(route) > 1:
             a, b = random.sample(range(len(route)), 2)
             route[a], route[b] = route[b], route[a]
-        return individual
+    return individual
 
 
-def repair_solution(individual, all_packages, vehicles):
+def repair_solution(individual, instance):
     seen = set()
     for route in individual:
-        route[:] = [p for p in route if p.id not in seen and not seen.add(p.id)]
+        route[:] = [p for p in route if p not in seen and not seen.add(p)]
 
-    assigned_ids = {p.id for route in individual for p in route}
-    unassigned = [p for p in all_packages if p.id not in assigned_ids]
+    weights = instance.weight.tolist()
+    priorities = instance.priority.tolist()
+    unassigned = [p for p in range(instance.n_packages) if p not in seen]
 
-    capacities = [v.capacity - sum(p.weight for p in route) for v, route in zip(vehicles, individual)]
+    capacities = [cap - sum(weights[p] for p in route) for cap, route in zip(instance.capacity.tolist(), individual)]
 
-    for pkg in sorted(unassigned, key=lambda x: -x.priority):  # prioritize higher priority
+    for pkg in sorted(unassigned, key=lambda p: -priorities[p]):  # prioritize higher priority
         for i, cap in enumerate(capacities):
-            if cap >= pkg.weight:
+            if cap >= weights[pkg]:
                 individual[i].append(pkg)
-                capacities[i] -= pkg.weight
+                capacities[i] -= weights[pkg]
                 break
     return individual
 
 
-def evolve(population, packages, vehicles, generations=50, mutation_rate=0.1):
-    for _ in range(generations):
-        population = sorted(population, key=lambda ind: FitnessFunction(ind, packages))
+# Giant-tour encoding: an individual is one permutation of all packages, cut into routes by
+# TourDecoder. Order-based crossover keeps every package exactly once, so no repair is needed.
+
+# Attempts with a growing per-route cost when Split uses more routes than there are vehicles
+SPLIT_RETRIES = 8
+# Most Split rounds per tour on mixed fleets, each for the largest vehicles still free
+SPLIT_ROUNDS = 4
+# Recently decoded tours whose routes and fitness are kept for children that repeat them: at most
+# TOUR_CACHE_SIZE tours, and at most TOUR_CACHE_STOPS stops over all of them (each tour is kept as
+# a tuple and as routes, about 16 bytes per stop)
+TOUR_CACHE_SIZE = 4096
+TOUR_CACHE_STOPS = 2_000_000
+
+
+# Split (Prins; linear version of Vidal 2016): the optimal cut of a tour into consecutive routes of at
+# most a given capacity, found with a sliding-window minimum over route start points in O(n).
+# The fleet is fixed, so when Split needs more routes than there are vehicles it is rerun with a
+# cost per route, doubled until the routes fit. Routes then go, heaviest first, to the smallest
+# free vehicle that can take them. On mixed fleets the packages of routes no free vehicle can take
+# are split again for the largest vehicle still free, and whatever is left after SPLIT_ROUNDS is
+# placed wherever there is room. Packages heavier than every vehicle stay unassigned.
+class TourDecoder:
+    def __init__(self, instance, distance_matrix):
+        self.weights = instance.weight.tolist()
+        self.capacities = instance.capacity.tolist()
+        self.distance_matrix = distance_matrix
+        self.weight_array = np.asarray(instance.weight, dtype=float)
+        self.to_shop = np.array([distance_matrix.distance(0, p + 1) for p in range(instance.n_packages)])
+        self.route_cost = 2 * float(self.to_shop.mean()) if instance.n_packages else 0.0
+
+    # (start, end, load) of the routes of the optimal split, start/end being positions in tour;
+    # every package must weigh at most capacity
+    def split(self, tour, capacity, route_cost=0.0):
+        n = len(tour)
+        if not n:
+            return []
+        tour_array = np.asarray(tour, dtype=np.intp)
+        if self.distance_matrix.is_dense:
+            legs = self.distance_matrix.matrix[tour_array[:-1] + 1, tour_array[1:] + 1]
+        else:
+            d = self.distance_matrix.distance
+            legs = np.array([d(a + 1, b + 1) for a, b in zip(tour[:-1], tour[1:])])
+        along = np.concatenate(([0.0], np.cumsum(legs)))  # distance along the tour from its first package
+        to_shop = self.to_shop[tour_array]
+        load = np.concatenate(([0.0], np.cumsum(self.weight_array[tour_array]))).tolist()
+        # The best split of tour[:j] costs cost[j] = min over feasible i of start[i] + end[j - 1],
+        # with start[i] = cost[i] + head[i]
+        head = (to_shop - along).tolist()
+        end = (along + to_shop + route_cost).tolist()
+
+        cost = [0.0] * (n + 1)
+        pred = [0] * (n + 1)
+        start = [0.0] * n
+        start[0] = head[0]
+        window = deque([0])  # candidate starts, increasing start[]
+        popleft, pop, append = window.popleft, window.pop, window.append
+        for j in range(1, n + 1):
+            # The tolerance keeps start j - 1 (a single package always fits) despite rounding in load
+            lowest = load[j] - capacity - 1e-9
+            while load[window[0]] < lowest:
+                popleft()
+            i = window[0]
+            c = start[i] + end[j - 1]
+            cost[j] = c
+            pred[j] = i
+            if j < n:
+                s = c + head[j]
+                while window and start[window[-1]] >= s:
+                    pop()
+                append(j)
+                start[j] = s
+
+        bounds = []
+        j = n
+        while j > 0:
+            i = pred[j]
+            bounds.append((i, j, load[j] - load[i]))
+            j = i
+        return bounds[::-1]
+
+    # Routes, one per vehicle, for a tour
+    def __call__(self, tour):
+        weights, capacities = self.weights, self.capacities
+        routes = [[] for _ in capacities]
+        loads = [0.0] * len(capacities)
+        free = sorted(range(len(capacities)), key=capacities.__getitem__)
+        free_capacities = [capacities[k] for k in free]
+        leftover = []
+
+        for _ in range(SPLIT_ROUNDS):
+            if not tour or not free:
+                break
+            capacity = free_capacities[-1]
+            leftover = [p for p in tour if weights[p] > capacity]
+            tour = [p for p in tour if weights[p] <= capacity]
+            bounds = self.split(tour, capacity)
+            route_cost = self.route_cost
+            for _ in range(SPLIT_RETRIES):
+                if len(bounds) <= len(free):
+                    break
+                bounds = self.split(tour, capacity, route_cost)
+                route_cost *= 2
+
+            # Heaviest route first, each to the smallest free vehicle that takes it
+            unplaced = []
+            for i, j, load in sorted(bounds, key=lambda b: -b[2]):
+                slot = bisect_left(free_capacities, load)
+                if slot == len(free):
+                    unplaced.append((i, j))
+                    continue
+                k = free.pop(slot)
+                del free_capacities[slot]
+                routes[k] = tour[i:j]
+                loads[k] = load
+            tour = leftover + [p for i, j in sorted(unplaced) for p in tour[i:j]]
+            leftover = tour
+
+        place_leftovers(leftover, routes, loads, weights, capacities)
+        return routes
+
+
+# Tour of a routes individual: its routes one after another, then the packages it leaves out
+def routes_to_tour(individual, n_packages):
+    tour = [p for route in individual for p in route]
+    assigned = set(tour)
+    tour.extend(p for p in range(n_packages) if p not in assigned)
+    return tour
+
+
+# Order crossover (OX): a slice of parent1 in place, the other packages in parent2's order
+def order_crossover(parent1, parent2):
+    n = len(parent1)
+    if n < 2:
+        return list(parent1)
+    a, b = sorted(random.sample(range(n + 1), 2))
+    segment = parent1[a:b]
+    taken = set(segment)
+    rest = [p for p in chain(parent2[b:], parent2[:b]) if p not in taken]
+    return rest[n - b:] + segment + rest[:n - b]
+
+
+# Partially mapped crossover (PMX): a slice of parent1 in place, the rest from parent2 with the
+# packages of the slice mapped to the ones they displaced
+def pmx_crossover(parent1, parent2):
+    n = len(parent1)
+    if n < 2:
+        return list(parent1)
+    a, b = sorted(random.sample(range(n + 1), 2))
+    child = list(parent2)
+    child[a:b] = parent1[a:b]
+    mapping = {parent1[k]: parent2[k] for k in range(a, b)}
+    for k in chain(range(a), range(b, n)):
+        p = parent2[k]
+        while p in mapping:
+            p = mapping[p]
+        child[k] = p
+    return child
+
+
+CROSSOVERS = {'ox': order_crossover, 'pmx': pmx_crossover}
+
+
+# Reverse a random stretch of the tour, with probability mutationRate
+def tour_mutation(tour, mutationRate=0.1):
+    if random.random() < mutationRate and len(tour) > 1:
+        a, b = sorted(random.sample(range(len(tour) + 1), 2))
+        tour[a:b] = tour[a:b][::-1]
+    return tour
+
+
+# Run the GA one generation at a time. After every generation is scored it yields a progress dict
+# with the best individual so far; sending True back stops the run. Returns the final population
+# sorted by fitness, with the matching scores.
+# The run also stops once time_limit seconds or max_evaluations fitness evaluations are used up
+# (checked between generations), or after stagnation_limit generations without a better best.
+# polish_rate is the chance that a child is improved by moves.polish_routes before it is scored.
+# encoding 'giant_tour' evolves single permutations (see TourDecoder) bred with crossover 'ox' or
+# 'pmx' instead of route lists; population may be given in either form, and the returned population
+# and progress dicts always hold routes. As the population converges most children repeat a recent
+# tour, so the routes and fitness of the last decoded tours are kept and reused (see TOUR_CACHE_SIZE).
+# stats, when a dict, receives the number of fitness evaluations and a (seconds, best fitness) trace.
+# instrument (instrumentation.Instrumentation) times scoring, sorting, crossover, mutation, repair
+# and polish and records one trace row per generation.
+# engine (time_windows.RouteEngine) adds the lateness and trip overload penalty of an individual's
+# routes to its fitness, and is used by the polish as well.
+def iter_evolve_population(population, instance, generations=50, mutation_rate=0.1, distance_matrix=None,
+                           time_limit=None, max_evaluations=None, stagnation_limit=None, stats=None,
+                           instrument=None, polish_rate=0.0, encoding='routes', crossover='ox', engine=None):
+    start = time.time()
+    if encoding not in ('routes', 'giant_tour'):
+        raise ValueError(f"Unknown encoding '{encoding}' (expected 'routes' or 'giant_tour')")
+    if crossover not in CROSSOVERS:
+        raise ValueError(f"Unknown crossover '{crossover}' (expected one of {', '.join(CROSSOVERS)})")
+    if distance_matrix is None:
+        distance_matrix = DistanceMatrix.from_instance(instance)
+    weights, priorities = package_arrays(instance)
+    if polish_rate:
+        ctx = MoveContext(instance, distance_matrix, granular_neighbors(instance))
+        package_weights = ctx.weights
+
+    deadline = None if time_limit is None else start + time_limit
+    giant_tour = encoding == 'giant_tour'
+    if giant_tour:
+        decoder = TourDecoder(instance, distance_matrix)
+        cross = CROSSOVERS[crossover]
+        population = [ind if not ind or isinstance(ind[0], int) else routes_to_tour(ind, instance.n_packages)
+                      for ind in population]
+
+    # Fitness (and decoded routes for giant tours) by individual identity;
+    # elites carried into the next generation keep their score
+    fitness = {}
+    decoded = {}
+    tour_cache = OrderedDict()  # tuple(tour) -> (routes, fitness)
+    tour_cache_size = max(1, min(TOUR_CACHE_SIZE, TOUR_CACHE_STOPS // max(instance.n_packages, 1)))
+    evaluations = 0
+    trace = []
+
+    def routes(ind):
+        return decoded[id(ind)] if giant_tour else ind
+
+    def score(individuals):
+        nonlocal evaluations
+        new = [ind for ind in individuals if id(ind) not in fitness]
+        if not new:
+            return
+        evaluations += len(new)
+        if instrument is not None:
+            instrument.count_evaluations(len(new))
+        if giant_tour:
+            fresh = []
+            for ind in new:
+                key = tuple(ind)
+                cached = tour_cache.get(key)
+                if cached is None:
+                    fresh.append(ind)
+                    continue
+                tour_cache.move_to_end(key)
+                decoded[id(ind)] = [list(route) for route in cached[0]]
+                fitness[id(ind)] = cached[1]
+            new = fresh
+            if not new:
+                return
+            with phase_timer(instrument, 'split'):
+                decoded.update((id(ind), decoder(ind)) for ind in new)
+        with phase_timer(instrument, 'score'):
+            scores = batch_fitness([routes(ind) for ind in new], weights, priorities, distance_matrix)
+            if engine is not None:
+                scores += [engine.routes_penalty(routes(ind)) for ind in new]
+            fitness.update(zip(map(id, new), scores.tolist()))
+        if giant_tour:
+            for ind in new:
+                tour_cache[tuple(ind)] = (decoded[id(ind)], fitness[id(ind)])
+            while len(tour_cache) > tour_cache_size:
+                tour_cache.popitem(last=False)
+
+    best_fitness = None
+    stagnant_generations = 0
+
+    for generation in range(generations):
+        if time_limit is not None and time.time() - start >= time_limit:
+            break
+        if max_evaluations is not None and evaluations >= max_evaluations:
+            break
+        score(population)
+        with phase_timer(instrument, 'sort'):
+            population = sorted(population, key=lambda ind: fitness[id(ind)])
+        trace.append((time.time() - start, fitness[id(population[0])]))
+        if instrument is not None:
+            scores = [fitness[id(ind)] for ind in population]
+            instrument.record(generation=generation, elapsed=trace[-1][0], best_fitness=scores[0],
+                              mean_fitness=sum(scores) / len(scores), evaluations=evaluations)
+
+        if best_fitness is None or trace[-1][1] < best_fitness:
+            best_fitness = trace[-1][1]
+            stagnant_generations = 0
+        else:
+            stagnant_generations += 1
+        stop = yield {'generation': generation, 'elapsed': trace[-1][0], 'evaluations': evaluations,
+                      'best': routes(population[0]), 'best_fitness': best_fitness}
+        if stop or (stagnation_limit is not None and stagnant_generations >= stagnation_limit):
+            break
+
         nextGen = population[:2]
+        fitness = {id(ind): fitness[id(ind)] for ind in nextGen}
+        if giant_tour:
+            decoded = {id(ind): decoded[id(ind)] for ind in nextGen}
         while len(nextGen) < len(population):
             parent1, parent2 = random.choices(population[:10], k=2)
-            child = Cross_Over(parent1, parent2)
-            child = mutation(child, mutation_rate)
-            child = repair_solution(child, packages, vehicles)
+            if giant_tour:
+                with phase_timer(instrument, 'crossover'):
+                    child = cross(parent1, parent2)
+                with phase_timer(instrument, 'mutation'):
+                    child = tour_mutation(child, mutation_rate)
+            else:
+                with phase_timer(instrument, 'crossover'):
+                    child = Cross_Over(parent1, parent2)
+                with phase_timer(instrument, 'mutation'):
+                    child = mutation(child, mutation_rate)
+                with phase_timer(instrument, 'repair'):
+                    child = repair_solution(child, instance)
+            if polish_rate and random.random() < polish_rate:
+                with phase_timer(instrument, 'polish'):
+                    child_routes = decoder(child) if giant_tour else child
+                    polish_routes(child_routes, [sum(package_weights[p] for p in route) for route in child_routes],
+                                  ctx, engine=engine, deadline=deadline)
+                    if giant_tour:
+                        child = routes_to_tour(child_routes, instance.n_packages)
             nextGen.append(child)
         population = nextGen
-    return min(population, key=lambda ind: FitnessFunction(ind, packages))
-
-
-class Package:
-    def __init__(self, id, x, y, weight, priority):
-        self.id = id
-        self.x = x
-        self.y = y
-        self.weight = weight
-        self.priority = priority
-
-
-class Vehicle:
-    def __init__(self, id, capacity):
-        self.id = id
-        self.capacity = capacity
+    score(population)
+    population = sorted(population, key=lambda ind: fitness[id(ind)])
+    trace.append((time.time() - start, fitness[id(population[0])]))
+    if stats is not None:
+        stats['evaluations'] = evaluations
+        stats['trace'] = trace
+    return [routes(ind) for ind in population], [fitness[id(ind)] for ind in population]
+
+
+# Run the GA to completion; see iter_evolve_population for the arguments.
+# callback(progress) is called after every generation and can return True to stop.
+def evolve_population(population, instance, generations=50, mutation_rate=0.1, distance_matrix=None,
+                      time_limit=None, stats=None, instrument=None, max_evaluations=None, stagnation_limit=None,
+                      callback=None, polish_rate=0.0, encoding='routes', crossover='ox', engine=None):
+    return run_steps(iter_evolve_population(population, instance, generations, mutation_rate, distance_matrix,
+                                            time_limit, max_evaluations, stagnation_limit, stats, instrument,
+                                            polish_rate, encoding, crossover, engine), callback)
+
+
+def evolve(population, instance, generations=50, mutation_rate=0.1, distance_matrix=None, time_limit=None,
+           stats=None, instrument=None, max_evaluations=None, stagnation_limit=None, callback=None, polish_rate=0.0,
+           encoding='routes', crossover='ox', engine=None):
+    population, _ = evolve_population(population, instance, generations, mutation_rate, distance_matrix, time_limit,
+                                      stats, instrument, max_evaluations, stagnation_limit, callback, polish_rate,
+                                      encoding, crossover, engine)
+    return population[0]
+
+
+def TotalRouteDistance(route, distance_matrix):
+    # Assuming shop is at (0, 0)
+    return distance_matrix.route_distance([p + 1 for p in route])
 
 
-def TotalRouteDistance(packages):
-    # Assuming shop is at (0, 0)
-    if not packages:
-        return 0
-    dist = 0
-    prev_x, prev_y = 0, 0
-    for p in packages:
-        dist += math.sqrt((p.x - prev_x) ** 2 + (p.y - prev_y) ** 2)
-        prev_x, prev_y = p.x, p.y
-    dist += math.sqrt(prev_x ** 2 + prev_y ** 2)  # return to shop
-    return dist
-
-
-def convert_solution_to_vehicles(vehicle_templates, solution):
-    vehicles = []
-    for i, pkg_list in enumerate(solution):
-        vehicle = {
-            'id': vehicle_templates[i].id,
-            'capacity': vehicle_templates[i].capacity,
-            'current_load': 0,
-            'assigned_packages': []
-        }
-        for p in pkg_list:
-            vehicle['assigned_packages'].append({
-                'id': p.id,
-                'x': p.x,
-                'y': p.y,
-                'weight': p.weight,
-                'priority': p.priority
-            })
-            vehicle['current_load'] += p.weight
-        vehicles.append(vehicle)
-    return vehicles
+def convert_solution_to_vehicles(instance, solution):
+    return instance.vehicle_dicts(solution)
 
 
 def run_genetic_algorithm():
     # test case 2
     # Define vehicles and packages
-    vehicles = [Vehicle(1, 60), Vehicle(2, 75)]
+    vehicle_dicts = [{'id': 1, 'capacity': 60}, {'id': 2, 'capacity': 75}]
 
     package_dicts = [
         {'id': 1, 'x': 5.0, 'y': 10.0, 'weight': 10.0, 'priority': 1},
@@ -165,11 +507,13 @@ def run_genetic_algorithm():
 
      '''
 
-    packages = [Package(**p) for p in package_dicts]
+    instance = Instance.from_dicts(vehicle_dicts, package_dicts)
+    distance_matrix = DistanceMatrix.from_instance(instance)
     # Genetic Algorithm Execution
-    population = initialize_population(packages, vehicles, population_size=30)
-    best_solution = evolve(population, packages, vehicles, generations=100, mutation_rate=0.1)
-    final_vehicles = convert_solution_to_vehicles(vehicles, best_solution)
+    population = initialize_population(instance, population_size=30)
+    best_solution = evolve(population, instance, generations=100, mutation_rate=0.1,
+                           distance_matrix=distance_matrix)
+    final_vehicles = convert_solution_to_vehicles(instance, best_solution)
 
     # Display result
     for v in final_vehicles:
@@ -178,7 +522,7 @@ def run_genetic_algorithm():
             print(f"  Package {p['id']} at ({p['x']},{p['y']}) weight={p['weight']} priority={p['priority']}")
         print()
 
-    total_distance = sum(TotalRouteDistance([Package(**p) for p in v['assigned_packages']]) for v in final_vehicles)
+    total_distance = sum(TotalRouteDistance(route, distance_matrix) for route in best_solution)
     total_priority = sum(p['priority'] for v in final_vehicles for p in v['assigned_packages'])
 
     print(f"Total Traveled Distance: {total_distance:.2f}")
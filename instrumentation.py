@@ -0,0 +1,153 @@
+import csv
+import json
+import os
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager, nullcontext
+
+TRACE_FORMATS = ('.json', '.jsonl', '.csv')
+
+
+# Optional counters, phase timers and a per-step trace for the solvers.
+# Pass an instance as `instrument=` to simulated_annealing / evolve; without one the solvers
+# skip all of this. callback(row) is called with every trace row as it is recorded.
+class Instrumentation:
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.proposed = Counter()
+        self.accepted = Counter()
+        self.evaluations = 0
+        self.phase_times = defaultdict(float)
+        self.trace = []
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phase_times[name] += time.perf_counter() - start
+
+    def add_time(self, name, seconds):
+        self.phase_times[name] += seconds
+
+    def count_move(self, move_type, accepted):
+        self.proposed[move_type] += 1
+        if accepted:
+            self.accepted[move_type] += 1
+
+    def count_evaluations(self, n=1):
+        self.evaluations += n
+
+    # One trace row per temperature step (SA) or generation (GA)
+    def record(self, **row):
+        self.trace.append(row)
+        if self.callback is not None:
+            self.callback(row)
+
+    @property
+    def rejected(self):
+        return self.proposed - self.accepted
+
+    def summary(self):
+        proposed = sum(self.proposed.values())
+        accepted = sum(self.accepted.values())
+        return {
+            'evaluations': self.evaluations,
+            'moves_proposed': dict(self.proposed),
+            'moves_accepted': dict(self.accepted),
+            'moves_rejected': dict(self.rejected),
+            'acceptance_rate': accepted / proposed if proposed else None,
+            'phase_times': dict(self.phase_times),
+            'trace_rows': len(self.trace),
+        }
+
+    def write_trace(self, path):
+        write_trace(self.trace, path)
+
+
+# Timer for a phase that costs nothing when instrumentation is off
+def phase_timer(instrument, name):
+    return instrument.phase(name) if instrument is not None else nullcontext()
+
+
+def _trace_format(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in TRACE_FORMATS:
+        raise ValueError(f"Unsupported trace format '{ext}' (expected one of {', '.join(TRACE_FORMATS)})")
+    return ext
+
+
+def write_trace(rows, path):
+    ext = _trace_format(path)
+    with open(path, 'w', newline='') as f:
+        if ext == '.json':
+            json.dump(rows, f, indent=1)
+        elif ext == '.jsonl':
+            for row in rows:
+                f.write(json.dumps(row) + '\n')
+        else:
+            fields = list(dict.fromkeys(k for row in rows for k in row))
+            writer = csv.DictWriter(f, fields)
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+def load_trace(path):
+    ext = _trace_format(path)
+    with open(path, newline='') as f:
+        if ext == '.json':
+            return json.load(f)
+        if ext == '.jsonl':
+            return [json.loads(line) for line in f if line.strip()]
+        return [{k: float(v) if v not in ('', None) else None for k, v in row.items()} for row in csv.DictReader(f)]
+
+
+# Instrumentation callback that appends every trace row to a JSON Lines file as the solve runs.
+# Close it when the solve is done, or use it as a context manager:
+#     with jsonl_sink('trace.jsonl') as sink:
+#         solve(instance, instrument=Instrumentation(sink))
+class JsonlSink:
+    def __init__(self, path):
+        self.file = open(path, 'a')
+
+    def __call__(self, row):
+        self.file.write(json.dumps(row) + '\n')
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def jsonl_sink(path):
+    return JsonlSink(path)
+
+
+# Convergence plot (best cost against elapsed time) from a recorded trace or trace file
+def plot_trace(trace, filename='convergence.png', show=False):
+    import matplotlib.pyplot as plt
+
+    if isinstance(trace, (str, os.PathLike)):
+        trace = load_trace(trace)
+    key = 'best_cost' if trace and 'best_cost' in trace[0] else 'best_fitness'
+    fig, ax = plt.subplots(figsize=(10, 6))
+    ax.plot([row['elapsed'] for row in trace], [row[key] for row in trace], label=key.replace('_', ' '))
+    if trace and 'current_cost' in trace[0]:
+        ax.plot([row['elapsed'] for row in trace], [row['current_cost'] for row in trace], alpha=0.5,
+                label='current cost')
+    ax.set_xlabel('Elapsed time (s)')
+    ax.set_ylabel('Cost')
+    ax.set_title('Convergence')
+    ax.legend()
+    ax.grid(True, linestyle='--', alpha=0.3)
+    fig.savefig(filename)
+    if show:
+        plt.show()
+    else:
+        plt.close(fig)
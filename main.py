@@ -1,9 +1,13 @@
 #1221124 Rand Saleh and 1221636 Roa Makhtoub
-from simulated_annealing_module import run_simulated_annealing
-from genetic_algorithm_module import run_genetic_algorithm
+import argparse
+import json
+import sys
 
 
-def main():
+def menu():
+    from simulated_annealing_module import run_simulated_annealing
+    from genetic_algorithm_module import run_genetic_algorithm
+
     print("Which algorithm do you want to run?")
     print("1 - Simulated Annealing")
     print("2 - Genetic Algorithm")
@@ -12,12 +16,75 @@ def main():
 
     if choice == '1':
         run_simulated_annealing()
-    if choice == '2':
+    elif choice == '2':
         run_genetic_algorithm()
+    else:
+        print("Invalid choice.")
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Assign packages to vehicles and route them with SA or GA. "
+                                                 "Without an instance file the interactive menu is shown.")
+    parser.add_argument('instance', nargs='?', help="instance file (.json or .csv)")
+    parser.add_argument('-a', '--algorithm', choices=['sa', 'ga'], default='sa')
+    parser.add_argument('-p', '--params', default='{}', help="solver parameters as a JSON object")
+    parser.add_argument('-t', '--time-limit', type=float, help="wall-clock budget in seconds")
+    parser.add_argument('--max-evaluations', type=int, help="stop after this many objective evaluations")
+    parser.add_argument('--stagnation', type=int, metavar='STEPS',
+                        help="stop after this many temperature steps/generations without improvement")
+    parser.add_argument('-s', '--seed', type=int)
+    parser.add_argument('-o', '--output', help="write the result JSON here instead of stdout")
+    parser.add_argument('--plot', metavar='FILE', help="save a route plot (imports matplotlib)")
+    parser.add_argument('--cache', metavar='FILE', help="SQLite solution cache: reuse the result of an identical "
+                                                        "instance, or warm-start from a near match")
+    parser.add_argument('--trace', metavar='FILE', help="record a per-step trace (.json, .jsonl or .csv) and add "
+                                                        "move/phase statistics to the result")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    if args.instance is None:
+        menu()
+        return
 
+    from solver import load_instance, solve, result_vehicles
 
+    instrument = None
+    if args.trace:
+        from instrumentation import Instrumentation
+        instrument = Instrumentation()
+
+    params = json.loads(args.params)
+    if args.max_evaluations is not None:
+        params['max_evaluations'] = args.max_evaluations
+    if args.stagnation is not None:
+        params['stagnation_limit'] = args.stagnation
+
+    instance = load_instance(args.instance)
+    if args.cache:
+        from solution_cache import SolutionCache, cached_solve
+        cache = SolutionCache(args.cache)
+        result = cached_solve(cache, instance, args.algorithm, params, args.time_limit, args.seed,
+                              instrument=instrument)
+        cache.close()
     else:
-        print("Invalid choice.")
+        result = solve(instance, args.algorithm, params, args.time_limit, args.seed,
+                       instrument=instrument)
+    # Only a full solve is instrumented: a cache hit or warm start leaves nothing to trace
+    if instrument is not None and result.get('cache', 'miss') == 'miss':
+        instrument.write_trace(args.trace)
+        result['profile'] = instrument.summary()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+    else:
+        print(json.dumps(result, indent=2))
+
+    if args.plot:
+        from simulated_annealing_module import draw_solution
+        draw_solution(result_vehicles(result, instance), args.plot, show=False)
 
 
 if __name__ == "__main__":
@@ -1,4 +1,5 @@
 from dataclasses import dataclass
+import numpy as np
 
 @dataclass
 class Package:
@@ -9,4 +10,178 @@ class Package:
 @dataclass
 class Vehicle:
     capacity: float
-    packages: list
\ No newline at end of file
+    packages: list
+
+
+# A delivery problem stored as columns (structure of arrays).
+# Packages and vehicles are referred to by their position (index) in these arrays;
+# the solvers keep routes as lists of package indices, never as per-package objects.
+class Instance:
+    __slots__ = ('package_ids', 'x', 'y', 'weight', 'priority', 'vehicle_ids', 'capacity', '_index')
+
+    def __init__(self, package_ids, x, y, weight, priority, vehicle_ids, capacity):
+        self.package_ids = np.asarray(package_ids, dtype=np.int64)
+        self.x = np.asarray(x, dtype=float)
+        self.y = np.asarray(y, dtype=float)
+        self.weight = np.asarray(weight, dtype=float)
+        self.priority = np.asarray(priority, dtype=np.int64)
+        self.vehicle_ids = np.asarray(vehicle_ids, dtype=np.int64)
+        self.capacity = np.asarray(capacity, dtype=float)
+        self._index = None
+
+    # Adapter for the dict format of simulated_annealing_module / solver
+    @classmethod
+    def from_dicts(cls, vehicles, packages):
+        return cls([p['id'] for p in packages], [p['x'] for p in packages], [p['y'] for p in packages],
+                   [p['weight'] for p in packages], [p['priority'] for p in packages],
+                   [v['id'] for v in vehicles], [v['capacity'] for v in vehicles])
+
+    # Adapter for package/vehicle objects: x/y or destination attributes, ids default to position + 1
+    @classmethod
+    def from_objects(cls, vehicles, packages):
+        points = [p.destination if hasattr(p, 'destination') else (p.x, p.y) for p in packages]
+        return cls([getattr(p, 'id', i) for i, p in enumerate(packages, start=1)],
+                   [pt[0] for pt in points], [pt[1] for pt in points],
+                   [p.weight for p in packages], [p.priority for p in packages],
+                   [getattr(v, 'id', i) for i, v in enumerate(vehicles, start=1)], [v.capacity for v in vehicles])
+
+    @property
+    def n_packages(self):
+        return len(self.package_ids)
+
+    @property
+    def n_vehicles(self):
+        return len(self.vehicle_ids)
+
+    # Position of a package id in the arrays
+    def index_of(self, package_id):
+        if self._index is None:
+            self._index = {pid: i for i, pid in enumerate(self.package_ids.tolist())}
+        return self._index[package_id]
+
+    def package(self, i):
+        return PackageView(self, i)
+
+    def vehicle(self, k):
+        return VehicleView(self, k)
+
+    @property
+    def packages(self):
+        return [PackageView(self, i) for i in range(self.n_packages)]
+
+    @property
+    def vehicles(self):
+        return [VehicleView(self, k) for k in range(self.n_vehicles)]
+
+    def package_dict(self, i):
+        return {'id': self.package_ids.item(i), 'x': self.x.item(i), 'y': self.y.item(i),
+                'weight': self.weight.item(i), 'priority': self.priority.item(i)}
+
+    # Append packages (columns given as sequences) at the end of the arrays
+    def add_packages(self, package_ids, x, y, weight, priority):
+        start = self.n_packages
+        self.package_ids = np.concatenate((self.package_ids, np.asarray(package_ids, dtype=np.int64)))
+        self.x = np.concatenate((self.x, np.asarray(x, dtype=float)))
+        self.y = np.concatenate((self.y, np.asarray(y, dtype=float)))
+        self.weight = np.concatenate((self.weight, np.asarray(weight, dtype=float)))
+        self.priority = np.concatenate((self.priority, np.asarray(priority, dtype=np.int64)))
+        if self._index is not None:
+            self._index.update((pid, i) for i, pid in enumerate(package_ids, start=start))
+
+    # Remove the packages at the given indices. The last packages move into the freed slots
+    # (see swap_remove_plan), so only they change index; returns {old index: new index} for them.
+    def remove_packages(self, indices):
+        moves, size = swap_remove_plan(self.n_packages, indices)
+        if self._index is not None:
+            for i in indices:
+                del self._index[self.package_ids.item(i)]
+            for old, new in moves.items():
+                self._index[self.package_ids.item(old)] = new
+        src, dst = list(moves), list(moves.values())
+        for name in ('package_ids', 'x', 'y', 'weight', 'priority'):
+            column = getattr(self, name)
+            column[dst] = column[src]
+            setattr(self, name, column[:size].copy())
+        return moves
+
+    def add_vehicles(self, vehicle_ids, capacity):
+        self.vehicle_ids = np.concatenate((self.vehicle_ids, np.asarray(vehicle_ids, dtype=np.int64)))
+        self.capacity = np.concatenate((self.capacity, np.asarray(capacity, dtype=float)))
+
+    # Remove the vehicles at the given indices, keeping the order of the others
+    def remove_vehicles(self, indices):
+        keep = np.ones(self.n_vehicles, dtype=bool)
+        keep[list(indices)] = False
+        self.vehicle_ids = self.vehicle_ids[keep]
+        self.capacity = self.capacity[keep]
+
+    # Routes (one list of package indices per vehicle) in the vehicle-dict format.
+    # package_dicts, when given, are reused instead of building new dicts.
+    def vehicle_dicts(self, routes, package_dicts=None):
+        weights = self.weight.tolist()
+        vehicles = []
+        for k, route in enumerate(routes):
+            assigned = [package_dicts[i] if package_dicts is not None else self.package_dict(i) for i in route]
+            vehicles.append({'id': self.vehicle_ids.item(k), 'capacity': self.capacity.item(k),
+                             'assigned_packages': assigned, 'current_load': sum(weights[i] for i in route)})
+        return vehicles
+
+
+# Read-only views of one package / vehicle of an Instance. They expose the attributes of the
+# older Package/Vehicle classes (id, x, y, destination, weight, priority / id, capacity).
+class PackageView:
+    __slots__ = ('instance', 'index')
+
+    def __init__(self, instance, index):
+        self.instance = instance
+        self.index = index
+
+    id = property(lambda self: self.instance.package_ids.item(self.index))
+    x = property(lambda self: self.instance.x.item(self.index))
+    y = property(lambda self: self.instance.y.item(self.index))
+    destination = property(lambda self: (self.x, self.y))
+    weight = property(lambda self: self.instance.weight.item(self.index))
+    priority = property(lambda self: self.instance.priority.item(self.index))
+
+
+class VehicleView:
+    __slots__ = ('instance', 'index')
+
+    def __init__(self, instance, index):
+        self.instance = instance
+        self.index = index
+
+    id = property(lambda self: self.instance.vehicle_ids.item(self.index))
+    capacity = property(lambda self: self.instance.capacity.item(self.index))
+
+
+# Removing indices from an array of length n by moving the last surviving entries into the holes.
+# Returns ({old index: new index} for the moved entries, new length); everything else keeps its index.
+def swap_remove_plan(n, removed):
+    removed = set(removed)
+    size = n - len(removed)
+    holes = sorted(i for i in removed if i < size)
+    movers = [i for i in range(size, n) if i not in removed]
+    return dict(zip(movers, holes)), size
+
+
+# A whole solution as one int array: the package indices of every route, each route closed by -1.
+# Adding 1 turns it into distance-matrix nodes with 0 (the shop) between routes.
+def encode_routes(routes):
+    encoded = np.empty(sum(len(r) for r in routes) + len(routes), dtype=np.int32)
+    pos = 0
+    for route in routes:
+        encoded[pos:pos + len(route)] = route
+        encoded[pos + len(route)] = -1
+        pos += len(route) + 1
+    return encoded
+
+
+def decode_routes(encoded):
+    routes = [[]]
+    for i in encoded.tolist():
+        if i < 0:
+            routes.append([])
+        else:
+            routes[-1].append(i)
+    return routes[:-1]
@@ -0,0 +1,480 @@
+import random
+import time
+from spatial_index import GridIndex
+
+# Nearest neighbors per package in the granular neighborhood
+GRANULAR_NEIGHBORS = 10
+# Share of granular proposals replaced by a uniformly random move (propose_move), which can also
+# reach empty vehicles
+RANDOM_MOVE_RATE = 0.1
+# Most passes over all packages made by polish_routes
+POLISH_PASSES = 10
+
+# Total distance of routes given as lists of package indices
+def routes_distance(routes, distance_matrix):
+    return sum(distance_matrix.route_distance([p + 1 for p in route]) for route in routes)
+
+# Priority score of routes given as lists of package indices
+def routes_priority(routes, priorities):
+    return sum((idx + 1) * priorities[p] for route in routes for idx, p in enumerate(route))
+
+# The k nearest other packages of every package of instance, by destination
+def granular_neighbors(instance, k=GRANULAR_NEIGHBORS):
+    return GridIndex(instance.x, instance.y).neighbor_lists(min(k, max(instance.n_packages - 1, 0)))
+
+# Neighbor lists worked out on first use, for when only a few packages will ever be asked for
+class LazyNeighbors:
+    def __init__(self, index, k=GRANULAR_NEIGHBORS):
+        self.index = index
+        self.k = k
+        self.lists = {}
+
+    def __getitem__(self, i):
+        found = self.lists.get(i)
+        if found is None:
+            found = self.index.nearest(self.index.xs[i], self.index.ys[i], self.k + 1)
+            if i in found:
+                found.remove(i)
+            found = self.lists[i] = found[:self.k]
+        return found
+
+# Instance columns as plain lists, read by the move functions in the inner loop.
+# Granular moves also need the neighbor lists (granular_neighbors or LazyNeighbors) and the route
+# and position of every package, set by locate and kept up to date by apply_move.
+# focus, when set, is the list of packages granular moves start from (see replanning.py).
+class MoveContext:
+    __slots__ = ('weights', 'priorities', 'capacities', 'distance_matrix', 'distance', 'symmetric', 'neighbors',
+                 'route_of', 'position', 'focus')
+
+    def __init__(self, instance, distance_matrix, neighbors=None, focus=None):
+        self.weights = instance.weight.tolist()
+        self.priorities = instance.priority.tolist()
+        self.capacities = instance.capacity.tolist()
+        self.distance_matrix = distance_matrix
+        self.distance = distance_matrix.distance
+        # Reversing a segment only changes its two end edges when distances are symmetric
+        self.symmetric = distance_matrix.symmetric
+        self.neighbors = neighbors
+        self.route_of = None
+        self.position = None
+        self.focus = focus
+
+    # Record where every package sits in routes (route -1 for unassigned packages)
+    def locate(self, routes):
+        self.route_of = [-1] * len(self.weights)
+        self.position = [0] * len(self.weights)
+        self.reindex(routes, range(len(routes)))
+
+    def reindex(self, routes, vehicles):
+        route_of, position = self.route_of, self.position
+        for v in vehicles:
+            for k, p in enumerate(routes[v]):
+                route_of[p] = v
+                position[p] = k
+
+# Distance-matrix node of the stop at pos (0, the shop, before the first and after the last package)
+def _node(route, pos):
+    return route[pos] + 1 if 0 <= pos < len(route) else 0
+
+# Change in distance and priority when the package at index i leaves the route
+def removal_delta(route, i, ctx):
+    d = ctx.distance
+    package = route[i]
+    prev, node, nxt = _node(route, i - 1), package + 1, _node(route, i + 1)
+    distance_change = d(prev, nxt) - d(prev, node) - d(node, nxt)
+    priorities = ctx.priorities
+    priority_change = -(i + 1) * priorities[package] - sum(priorities[p] for p in route[i + 1:])
+    return distance_change, priority_change
+
+# Change in distance and priority when package is appended after the node last (0 if the route is empty)
+def append_delta(last, position, package, ctx):
+    d = ctx.distance
+    node = package + 1
+    distance_change = d(last, node) + d(node, 0) - d(last, 0)
+    return distance_change, position * ctx.priorities[package]
+
+# Change when the package at index i is removed and new_package is appended to the same route
+def replace_delta(route, i, new_package, ctx):
+    removed_distance, removed_priority = removal_delta(route, i, ctx)
+    last = route[-1] + 1 if i != len(route) - 1 else _node(route, i - 1)
+    added_distance, added_priority = append_delta(last, len(route), new_package, ctx)
+    return removed_distance + added_distance, removed_priority + added_priority
+
+# Change when the packages at indices i and j of the same route trade places
+def reorder_delta(route, i, j, ctx):
+    d = ctx.distance
+
+    def swapped(pos):
+        return _node(route, j if pos == i else i if pos == j else pos)
+
+    edges = {i, i + 1, j, j + 1}
+    old = sum(d(_node(route, e - 1), _node(route, e)) for e in edges)
+    new = sum(d(swapped(e - 1), swapped(e)) for e in edges)
+    priorities = ctx.priorities
+    return new - old, (j - i) * (priorities[route[i]] - priorities[route[j]])
+
+# Pick a random move and evaluate it from the touched route edges only.
+# routes holds one list of package indices per vehicle, loads the matching vehicle loads.
+# Returns (move, distance_change, priority_change); move is None when nothing changes.
+def propose_move(routes, loads, ctx):
+    move_type = random.choice(['move', 'swap_between', 'reorder'])
+    m = len(routes)
+    weights, capacities = ctx.weights, ctx.capacities
+
+    if move_type == 'move':
+        if not any(routes):
+            return None, 0.0, 0
+        while True:
+            s = random.randrange(m)
+            if routes[s]:
+                break
+
+        route = routes[s]
+        i = random.randrange(len(route))
+        package = route[i]
+
+        for t in range(m):
+            if t != s and loads[t] + weights[package] <= capacities[t]:
+                removed_distance, removed_priority = removal_delta(route, i, ctx)
+                target_route = routes[t]
+                last = target_route[-1] + 1 if target_route else 0
+                added_distance, added_priority = append_delta(last, len(target_route) + 1, package, ctx)
+                return ('move', s, i, t), removed_distance + added_distance, removed_priority + added_priority
+
+    elif move_type == 'swap_between':
+        attempts = 0
+        while attempts < 10:
+            v1 = random.randrange(m)
+            v2 = random.randrange(m)
+            if v1 != v2 and routes[v1] and routes[v2]:
+                break
+            attempts += 1
+
+        if routes[v1] and routes[v2]:
+            route1, route2 = routes[v1], routes[v2]
+            i1 = random.randrange(len(route1))
+            i2 = random.randrange(len(route2))
+            p1, p2 = route1[i1], route2[i2]
+
+            new_load_v1 = loads[v1] - weights[p1] + weights[p2]
+            new_load_v2 = loads[v2] - weights[p2] + weights[p1]
+
+            if new_load_v1 <= capacities[v1] and new_load_v2 <= capacities[v2]:
+                if v1 == v2:
+                    # All attempts failed: both packages go to the back of the same route
+                    if i1 == i2:
+                        return None, 0.0, 0
+                    new_route = [p for k, p in enumerate(route1) if k != i1 and k != i2] + [p2, p1]
+                    distance_change = (routes_distance([new_route], ctx.distance_matrix)
+                                       - routes_distance([route1], ctx.distance_matrix))
+                    priority_change = routes_priority([new_route], ctx.priorities) - routes_priority([route1], ctx.priorities)
+                    return ('swap_within', v1, i1, i2), distance_change, priority_change
+
+                distance1, priority1 = replace_delta(route1, i1, p2, ctx)
+                distance2, priority2 = replace_delta(route2, i2, p1, ctx)
+                return ('swap_between', v1, i1, v2, i2), distance1 + distance2, priority1 + priority2
+
+    elif move_type == 'reorder':
+        v = random.randrange(m)
+        route = routes[v]
+        if len(route) >= 2:
+            i, j = random.sample(range(len(route)), 2)
+            distance_change, priority_change = reorder_delta(route, i, j, ctx)
+            return ('reorder', v, i, j), distance_change, priority_change
+
+    return None, 0.0, 0
+
+# Granular moves. Each pairs a package p (route s, index i) with one of its nearest neighbors q
+# (route t, index j) and tries to put the two next to each other:
+#   '2opt'      reverse the stretch between p and q of their route
+#   'or_opt'    move a run of 1-3 packages starting at p to just after q
+#   'relocate'  move p to just before or after q in q's route
+#   'swap'      exchange p and q between their routes
+#   '2opt_star' cut both routes and continue p's route with q and the rest of q's route
+# The builders return (move, distance_change), or None when the move changes nothing or breaks a
+# capacity; the priority change is only worked out when needed, by move_priority_change.
+
+def two_opt_move(route, v, i, j, ctx):
+    lo, hi = (i + 1, j + 1) if i < j else (j, i)
+    if hi - lo < 2:
+        return None
+    d = ctx.distance
+    prev, first, last, nxt = _node(route, lo - 1), route[lo] + 1, route[hi - 1] + 1, _node(route, hi)
+    if ctx.symmetric:
+        distance_change = d(prev, last) + d(first, nxt) - d(prev, first) - d(last, nxt)
+    else:
+        old = [prev] + [p + 1 for p in route[lo:hi]] + [nxt]
+        new = [prev] + [p + 1 for p in reversed(route[lo:hi])] + [nxt]
+        distance_change = sum(map(d, new[:-1], new[1:])) - sum(map(d, old[:-1], old[1:]))
+    return ('2opt', v, lo, hi), distance_change
+
+def or_opt_move(route, v, i, length, j, ctx):
+    length = min(length, len(route) - i)
+    if i - 1 <= j < i + length:
+        return None
+    d = ctx.distance
+    prev, first, last, nxt = _node(route, i - 1), route[i] + 1, route[i + length - 1] + 1, _node(route, i + length)
+    after = route[j] + 1
+    before = _node(route, j + 1)
+    distance_change = (d(prev, nxt) - d(prev, first) - d(last, nxt)
+                       + d(after, first) + d(last, before) - d(after, before))
+    return ('or_opt', v, i, length, j), distance_change
+
+def relocate_move(routes, loads, s, i, t, pos, ctx):
+    package = routes[s][i]
+    if loads[t] + ctx.weights[package] > ctx.capacities[t]:
+        return None
+    d = ctx.distance
+    route, target = routes[s], routes[t]
+    prev, node, nxt = _node(route, i - 1), package + 1, _node(route, i + 1)
+    before, after = _node(target, pos - 1), _node(target, pos)
+    distance_change = d(prev, nxt) - d(prev, node) - d(node, nxt) + d(before, node) + d(node, after) - d(before, after)
+    return ('relocate', s, i, t, pos), distance_change
+
+def swap_move(routes, loads, s, i, t, j, ctx):
+    weights, capacities = ctx.weights, ctx.capacities
+    p, q = routes[s][i], routes[t][j]
+    if loads[s] - weights[p] + weights[q] > capacities[s] or loads[t] - weights[q] + weights[p] > capacities[t]:
+        return None
+    d = ctx.distance
+
+    def replaced(route, k, old, new):
+        prev, nxt = _node(route, k - 1), _node(route, k + 1)
+        return d(prev, new) + d(new, nxt) - d(prev, old) - d(old, nxt)
+
+    distance_change = replaced(routes[s], i, p + 1, q + 1) + replaced(routes[t], j, q + 1, p + 1)
+    return ('swap', s, i, t, j), distance_change
+
+def two_opt_star_move(routes, loads, s, i, t, j, ctx):
+    weights, capacities = ctx.weights, ctx.capacities
+    route, other = routes[s], routes[t]
+    head = sum(weights[p] for p in route[:i + 1])
+    other_head = sum(weights[p] for p in other[:j])
+    if (head + loads[t] - other_head > capacities[s]
+            or other_head + loads[s] - head > capacities[t]):
+        return None
+    d = ctx.distance
+    p, q = route[i] + 1, other[j] + 1
+    nxt, prev = _node(route, i + 1), _node(other, j - 1)
+    distance_change = d(p, q) + d(prev, nxt) - d(p, nxt) - d(prev, q)
+    return ('2opt_star', s, i, t, j), distance_change
+
+# Every granular move pairing package p with one of its neighbors, as (move, distance_change)
+def package_moves(p, routes, loads, ctx):
+    s = ctx.route_of[p]
+    if s < 0:
+        return
+    i = ctx.position[p]
+    for q in ctx.neighbors[p]:
+        t = ctx.route_of[q]
+        if t < 0:
+            continue
+        j = ctx.position[q]
+        if s == t:
+            candidates = [two_opt_move(routes[s], s, i, j, ctx)]
+            candidates += [or_opt_move(routes[s], s, i, length, j, ctx) for length in (1, 2, 3)]
+        else:
+            candidates = [relocate_move(routes, loads, s, i, t, j, ctx),
+                          relocate_move(routes, loads, s, i, t, j + 1, ctx),
+                          swap_move(routes, loads, s, i, t, j, ctx),
+                          two_opt_star_move(routes, loads, s, i, t, j, ctx)]
+        for candidate in candidates:
+            if candidate is not None:
+                yield candidate
+
+# Priority change of a granular move, read from the routes before it is applied
+def move_priority_change(move, routes, ctx):
+    priorities = ctx.priorities
+    move_type = move[0]
+
+    if move_type == '2opt':
+        _, v, lo, hi = move
+        return sum((hi - lo - 1 - 2 * k) * priorities[p] for k, p in enumerate(routes[v][lo:hi]))
+
+    if move_type == 'or_opt':
+        _, v, i, length, j = move
+        route = routes[v]
+        segment = route[i:i + length]
+        if j < i:
+            lo, new = j + 1, segment + route[j + 1:i]
+        else:
+            lo, new = i, route[i + length:j + 1] + segment
+        old = route[lo:lo + len(new)]
+        return sum((lo + k + 1) * (priorities[a] - priorities[b]) for k, (a, b) in enumerate(zip(new, old)))
+
+    if move_type == 'relocate':
+        _, s, i, t, pos = move
+        _, removed = removal_delta(routes[s], i, ctx)
+        return removed + (pos + 1) * priorities[routes[s][i]] + sum(priorities[p] for p in routes[t][pos:])
+
+    if move_type == 'swap':
+        _, s, i, t, j = move
+        p, q = routes[s][i], routes[t][j]
+        return (i - j) * (priorities[q] - priorities[p])
+
+    _, s, i, t, j = move  # '2opt_star'
+    return ((i + 1 - j) * sum(priorities[p] for p in routes[t][j:])
+            + (j - i - 1) * sum(priorities[p] for p in routes[s][i + 1:]))
+
+# Granular counterpart of propose_move: a random package (from ctx.focus when set), one of its
+# nearest neighbors and a random move between them. Needs ctx.neighbors and ctx.locate(routes).
+def propose_granular_move(routes, loads, ctx):
+    if ctx.focus:
+        p = random.choice(ctx.focus)
+    elif random.random() < RANDOM_MOVE_RATE:
+        return propose_move(routes, loads, ctx)
+    else:
+        p = random.randrange(len(ctx.route_of))
+    s = ctx.route_of[p]
+    if s < 0 or not ctx.neighbors[p]:
+        return None, 0.0, 0
+    q = random.choice(ctx.neighbors[p])
+    t = ctx.route_of[q]
+    if t < 0:
+        return None, 0.0, 0
+    i, j = ctx.position[p], ctx.position[q]
+
+    if s == t:
+        if random.random() < 0.5:
+            candidate = two_opt_move(routes[s], s, i, j, ctx)
+        else:
+            candidate = or_opt_move(routes[s], s, i, random.randint(1, 3), j, ctx)
+    else:
+        kind = random.randrange(3)
+        if kind == 0:
+            candidate = relocate_move(routes, loads, s, i, t, j + random.randrange(2), ctx)
+        elif kind == 1:
+            candidate = swap_move(routes, loads, s, i, t, j, ctx)
+        else:
+            candidate = two_opt_star_move(routes, loads, s, i, t, j, ctx)
+
+    if candidate is None:
+        return None, 0.0, 0
+    move, distance_change = candidate
+    return move, distance_change, move_priority_change(move, routes, ctx)
+
+# Apply a move returned by propose_move or propose_granular_move in place; returns the vehicles
+# whose routes changed
+def apply_move(move, routes, loads, ctx):
+    if move is None:
+        return ()
+    move_type = move[0]
+    weights = ctx.weights
+
+    if move_type == 'move':
+        _, s, i, t = move
+        package = routes[s].pop(i)
+        loads[s] -= weights[package]
+        routes[t].append(package)
+        loads[t] += weights[package]
+        touched = (s, t)
+
+    elif move_type == 'swap_between':
+        _, v1, i1, v2, i2 = move
+        p1, p2 = routes[v1][i1], routes[v2][i2]
+        loads[v1] = loads[v1] - weights[p1] + weights[p2]
+        loads[v2] = loads[v2] - weights[p2] + weights[p1]
+        del routes[v1][i1]
+        del routes[v2][i2]
+        routes[v1].append(p2)
+        routes[v2].append(p1)
+        touched = (v1, v2)
+
+    elif move_type == 'swap_within':
+        _, v, i1, i2 = move
+        route = routes[v]
+        p1, p2 = route[i1], route[i2]
+        route[:] = [p for k, p in enumerate(route) if k != i1 and k != i2] + [p2, p1]
+        touched = (v,)
+
+    elif move_type == 'reorder':
+        _, v, i, j = move
+        route = routes[v]
+        route[i], route[j] = route[j], route[i]
+        touched = (v,)
+
+    elif move_type == '2opt':
+        _, v, lo, hi = move
+        routes[v][lo:hi] = routes[v][lo:hi][::-1]
+        touched = (v,)
+
+    elif move_type == 'or_opt':
+        _, v, i, length, j = move
+        route = routes[v]
+        segment = route[i:i + length]
+        if j < i:
+            route[j + 1:i + length] = segment + route[j + 1:i]
+        else:
+            route[i:j + 1] = route[i + length:j + 1] + segment
+        touched = (v,)
+
+    elif move_type == 'relocate':
+        _, s, i, t, pos = move
+        package = routes[s].pop(i)
+        routes[t].insert(pos, package)
+        loads[s] -= weights[package]
+        loads[t] += weights[package]
+        touched = (s, t)
+
+    elif move_type == 'swap':
+        _, s, i, t, j = move
+        p, q = routes[s][i], routes[t][j]
+        routes[s][i], routes[t][j] = q, p
+        loads[s] += weights[q] - weights[p]
+        loads[t] += weights[p] - weights[q]
+        touched = (s, t)
+
+    elif move_type == '2opt_star':
+        _, s, i, t, j = move
+        route, other = routes[s], routes[t]
+        route[i + 1:], other[j:] = other[j:], route[i + 1:]
+        loads[s] = sum(weights[p] for p in route)
+        loads[t] = sum(weights[p] for p in other)
+        touched = (s, t)
+
+    if ctx.route_of is not None:
+        ctx.reindex(routes, touched)
+    return touched
+
+# Steepest-descent polish over the granular neighborhood: every package in turn (or only those in
+# packages) makes the move that shortens the routes the most among all moves with its neighbors,
+# until a whole pass finds nothing better or max_passes is reached. routes and loads are edited in
+# place; returns the total distance change.
+# engine (time_windows.RouteEngine), when given, adds its penalty change to the distance change of
+# every move that could still beat the best one, so only moves that pay off including lateness and
+# trip overloads are made. The polish stops early once time.time() reaches deadline.
+# located says ctx already records where every package of routes sits, saving the pass of ctx.locate.
+def polish_routes(routes, loads, ctx, max_passes=POLISH_PASSES, packages=None, engine=None, deadline=None,
+                  located=False):
+    if ctx.neighbors is None:
+        raise ValueError("polish_routes needs a MoveContext with neighbor lists (granular_neighbors)")
+    if not located:
+        ctx.locate(routes)
+    if engine is not None:
+        engine.load(routes)
+    if packages is None:
+        packages = range(len(ctx.weights))
+    total_change = 0.0
+    for _ in range(max_passes):
+        improved = False
+        for p in packages:
+            if deadline is not None and time.time() >= deadline:
+                return total_change
+            best_move, best_change, best_distance = None, -1e-9, 0.0
+            for move, distance_change in package_moves(p, routes, loads, ctx):
+                change = distance_change
+                if engine is not None:
+                    if change - engine.penalty_at_stake(move) >= best_change:
+                        continue
+                    change += engine.penalty_change(move, routes)
+                if change < best_change:
+                    best_move, best_change, best_distance = move, change, distance_change
+            if best_move is not None:
+                touched = apply_move(best_move, routes, loads, ctx)
+                if engine is not None:
+                    engine.update(routes, touched)
+                total_change += best_distance
+                improved = True
+        if not improved:
+            break
+    return total_change
@@ -0,0 +1,138 @@
+import copy
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from distance_matrix import DistanceMatrix
+from models import Instance
+from simulated_annealing_module import assign_packages_randomly, simulated_annealing
+from genetic_algorithm_module import initialize_population, evolve_population
+
+# Problem data of the current worker process, set once by _init_worker
+_problem = {}
+
+
+def _init_worker(instance, vehicles, packages):
+    _problem['instance'] = instance
+    _problem['vehicles'] = vehicles
+    _problem['packages'] = packages
+    _problem['distance_matrix'] = DistanceMatrix.from_instance(instance)
+
+
+def _remaining(deadline):
+    return None if deadline is None else max(0.0, deadline - time.time())
+
+
+def _executor(workers, instance, vehicles=None, packages=None):
+    return ProcessPoolExecutor(max_workers=workers or os.cpu_count(), initializer=_init_worker,
+                               initargs=(instance, vehicles, packages))
+
+
+# Multi-start SA
+
+# The time left is taken when the chain starts, not when it was submitted, so chains queued
+# behind busy workers share the run's deadline. Optional chains that start after it are skipped.
+def _sa_chain(seed, params, deadline, optional=True):
+    start = time.time()
+    time_limit = _remaining(deadline)
+    if optional and time_limit == 0.0:
+        return None
+    random.seed(seed)
+    vehicles, _ = assign_packages_randomly(copy.deepcopy(_problem['vehicles']), _problem['packages'])
+    solution, cost, priority_score = simulated_annealing(vehicles, _problem['packages'],
+                                                         distance_matrix=_problem['distance_matrix'],
+                                                         time_limit=time_limit, **params)
+    routes = [(v['id'], [p['id'] for p in v['assigned_packages']]) for v in solution]
+    return {'seed': seed, 'worker': os.getpid(), 'cost': cost, 'priority_score': priority_score,
+            'elapsed': time.time() - start, 'routes': routes}
+
+
+# Run independent SA chains (one seed each) on a process pool and keep the best one.
+# vehicles/packages use the dict format of simulated_annealing_module.
+def run_multistart_sa(vehicles, packages, chains=None, workers=None, seed=None, time_limit=None, **params):
+    deadline = None if time_limit is None else time.time() + time_limit
+    chains = chains or workers or os.cpu_count()
+    rng = random.Random(seed)
+    seeds = [rng.randrange(2**32) for _ in range(chains)]
+
+    with _executor(workers, Instance.from_dicts(vehicles, packages), vehicles, packages) as executor:
+        futures = [executor.submit(_sa_chain, s, params, deadline, i > 0) for i, s in enumerate(seeds)]
+        stats = [r for r in (f.result() for f in futures) if r is not None]
+
+    best = min(stats, key=lambda r: (r['cost'], r['priority_score']))
+    by_id = {p['id']: p for p in packages}
+    templates = {v['id']: v for v in vehicles}
+    best_solution = []
+    for vehicle_id, ids in best['routes']:
+        route = [by_id[i] for i in ids]
+        best_solution.append(dict(templates[vehicle_id], assigned_packages=route,
+                                  current_load=sum(p['weight'] for p in route)))
+
+    for r in stats:
+        del r['routes']
+    return {'solution': best_solution, 'cost': best['cost'], 'priority_score': best['priority_score'],
+            'chains': stats}
+
+
+# Island-model GA
+
+def _island_init(seed, population_size):
+    random.seed(seed)
+    return initialize_population(_problem['instance'], population_size)
+
+
+# Like _sa_chain, an epoch that starts after the deadline only scores its population
+def _island_epoch(island, population, seed, generations, mutation_rate, deadline):
+    start = time.time()
+    random.seed(seed)
+    run = {}
+    population, scores = evolve_population(population, _problem['instance'], generations, mutation_rate,
+                                           _problem['distance_matrix'], _remaining(deadline), run)
+    return {'island': island, 'worker': os.getpid(), 'population': population, 'scores': scores,
+            'generations': len(run['trace']) - 1, 'elapsed': time.time() - start}
+
+
+# Ring migration: the best `migrants` of each island replace the worst of the next one
+def _migrate(results, migrants):
+    populations = [list(r['population']) for r in results]
+    if migrants <= 0 or len(populations) < 2:
+        return populations
+    for i, r in enumerate(results):
+        target = populations[(i + 1) % len(populations)]
+        target[-migrants:] = copy.deepcopy(r['population'][:migrants])
+    return populations
+
+
+# Run one GA population per island on a process pool, exchanging the best individuals
+# every migration_interval generations. instance is a models.Instance; the solution is
+# the best individual (one list of package indices per vehicle).
+def run_island_ga(instance, islands=None, population_size=30, generations=100, migration_interval=10,
+                  migrants=2, mutation_rate=0.1, workers=None, seed=None, time_limit=None):
+    deadline = None if time_limit is None else time.time() + time_limit
+    islands = islands or workers or os.cpu_count()
+    rng = random.Random(seed)
+    stats = [{'island': i, 'generations': 0, 'elapsed': 0.0, 'best': None} for i in range(islands)]
+
+    with _executor(workers, instance) as executor:
+        populations = list(executor.map(_island_init, [rng.randrange(2**32) for _ in range(islands)],
+                                        [population_size] * islands))
+        done = 0
+        results = None
+        while done < generations and (deadline is None or time.time() < deadline):
+            step = min(migration_interval, generations - done)
+            futures = [executor.submit(_island_epoch, i, pop, rng.randrange(2**32), step, mutation_rate, deadline)
+                       for i, pop in enumerate(populations)]
+            results = [f.result() for f in futures]
+            for r in results:
+                stats[r['island']]['generations'] += r['generations']
+                stats[r['island']]['elapsed'] += r['elapsed']
+                stats[r['island']]['best'] = r['scores'][0]
+                stats[r['island']]['worker'] = r['worker']
+            populations = _migrate(results, migrants)
+            done += step
+
+    if results is None:
+        return {'solution': None, 'fitness': None, 'islands': stats}
+    best = min(results, key=lambda r: r['scores'][0])
+    return {'solution': best['population'][0], 'fitness': best['scores'][0], 'islands': stats}
@@ -0,0 +1,187 @@
+import numpy as np
+
+from models import decode_routes
+
+COLORS = ['red', 'cyan', 'lime', 'yellow', 'orange', 'magenta', 'white', 'pink']
+# Stops drawn with direction arrows / "Pkg id" labels only up to these numbers of packages
+ARROW_LIMIT = 500
+LABEL_LIMIT = 100
+# Share of the data range added around the routes
+MARGIN = 0.05
+
+
+# Batched route plots: one LineCollection and one scatter per vehicle instead of an arrow and a
+# scatter per package, bounds taken from the data, and in headless mode a bare Agg figure that never
+# touches pyplot or a GUI backend. Drawing again on the same renderer only replaces the data of the
+# vehicles whose route changed, so a run can be rendered frame by frame (see progress_frames).
+# max_points, when set, decimates long routes by drawing every k-th stop so that about max_points
+# stops are drawn in total (the route shape is kept, single stops may be skipped).
+class RouteRenderer:
+    def __init__(self, headless=True, figsize=(12, 10), max_points=None, depot=(0, 0),
+                 title='Vehicle Delivery Routes'):
+        from matplotlib.collections import LineCollection
+
+        if headless:
+            from matplotlib.backends.backend_agg import FigureCanvasAgg
+            from matplotlib.figure import Figure
+            self.figure = Figure(figsize=figsize)
+            FigureCanvasAgg(self.figure)
+        else:
+            import matplotlib.pyplot as plt
+            self.figure = plt.figure(figsize=figsize)
+        self._line_collection = LineCollection
+        self.headless = headless
+        self.max_points = max_points
+        self.depot = depot
+        self.title = title
+        self.ax = None
+        self.routes = []  # per vehicle: (ids, xs, ys) last drawn
+        self.artists = []  # per vehicle: (lines, points, arrows or None, labels)
+        self.mode = None  # (decimation stride, arrows, labels) of the drawn artists
+
+    def _setup(self):
+        fig = self.figure
+        fig.patch.set_facecolor('black')
+        ax = self.ax = fig.add_subplot()
+        ax.set_facecolor('black')
+        ax.scatter(*self.depot, c='white', marker='s', s=150, label=f'Shop {self.depot}', zorder=3)
+        ax.text(self.depot[0], self.depot[1], ' Shop', fontsize=10, color='white')
+        ax.set_title(self.title, fontsize=16, color='white')
+        ax.set_xlabel('X Coordinate (km)', fontsize=14, color='white')
+        ax.set_ylabel('Y Coordinate (km)', fontsize=14, color='white')
+        ax.tick_params(colors='white')
+        ax.grid(True, color='gray', linestyle='--', alpha=0.3)
+        ax.legend(facecolor='black', edgecolor='white', labelcolor='white')
+
+    def _stride(self, total):
+        if self.max_points is None or total <= self.max_points:
+            return 1
+        return -(-total // self.max_points)
+
+    def _clear(self):
+        for lines, points, arrows, texts in self.artists:
+            for artist in [lines, points] + ([arrows] if arrows is not None else []) + texts:
+                artist.remove()
+        self.artists = []
+        self.routes = []
+
+    # Draw routes given as (ids, xs, ys) per vehicle; vehicles whose stops are unchanged keep their artists
+    def _draw(self, routes, title=None):
+        if self.ax is None:
+            self._setup()
+        ax = self.ax
+        total = sum(len(xs) for _, xs, _ in routes)
+        stride = self._stride(total)
+        arrows = total <= ARROW_LIMIT
+        labels = total <= LABEL_LIMIT
+        # Decimation, arrows and labels depend on the total, so a change there redraws every vehicle
+        if (stride, arrows, labels) != self.mode:
+            self._clear()
+            self.mode = (stride, arrows, labels)
+        rescale = len(routes) != len(self.routes)
+
+        for k, (ids, xs, ys) in enumerate(routes):
+            if k < len(self.routes):
+                old = self.routes[k]
+                if np.array_equal(old[1], xs) and np.array_equal(old[2], ys):
+                    continue
+            rescale = True
+            if stride > 1 and len(xs) > 2:
+                keep = np.unique(np.r_[np.arange(0, len(xs), stride), len(xs) - 1])
+                xs_drawn, ys_drawn = xs[keep], ys[keep]
+            else:
+                xs_drawn, ys_drawn = xs, ys
+            path = np.column_stack((np.r_[self.depot[0], xs_drawn, self.depot[0]],
+                                    np.r_[self.depot[1], ys_drawn, self.depot[1]]))
+            segments = np.stack((path[:-1], path[1:]), axis=1) if len(xs) else np.empty((0, 2, 2))
+            color = COLORS[k % len(COLORS)]
+
+            if k < len(self.artists):
+                lines, points, route_arrows, texts = self.artists[k]
+                lines.set_segments(segments)
+                points.set_offsets(np.column_stack((xs_drawn, ys_drawn)))
+                for artist in ([route_arrows] if route_arrows is not None else []) + texts:
+                    artist.remove()
+            else:
+                lines = self._line_collection(segments, colors=color, linewidths=1.2, alpha=0.8)
+                ax.add_collection(lines)
+                points = ax.scatter(xs_drawn, ys_drawn, color=color, s=70 if labels else 12, zorder=2)
+            route_arrows = None
+            if arrows and len(segments):
+                # One quiver per vehicle: every leg as an arrow ending at the next stop
+                delta = segments[:, 1] - segments[:, 0]
+                route_arrows = ax.quiver(segments[:, 0, 0], segments[:, 0, 1], delta[:, 0], delta[:, 1],
+                                         color=color, angles='xy', scale_units='xy', scale=1, width=0.002,
+                                         headwidth=5, headlength=6, alpha=0.8)
+            texts = [ax.text(x, y, f" Pkg {i}", fontsize=8, color='white')
+                     for i, x, y in zip(ids, xs, ys)] if labels else []
+            if k < len(self.artists):
+                self.artists[k] = (lines, points, route_arrows, texts)
+            else:
+                self.artists.append((lines, points, route_arrows, texts))
+        for lines, points, route_arrows, texts in self.artists[len(routes):]:
+            for artist in [lines, points] + ([route_arrows] if route_arrows is not None else []) + texts:
+                artist.remove()
+        del self.artists[len(routes):]
+        self.routes = list(routes)
+
+        if rescale:
+            xs = np.concatenate([[self.depot[0]]] + [xs for _, xs, _ in routes])
+            ys = np.concatenate([[self.depot[1]]] + [ys for _, _, ys in routes])
+            dx = (xs.max() - xs.min()) * MARGIN or 1.0
+            dy = (ys.max() - ys.min()) * MARGIN or 1.0
+            ax.set_xlim(xs.min() - dx, xs.max() + dx)
+            ax.set_ylim(ys.min() - dy, ys.max() + dy)
+        if title is not None:
+            ax.set_title(title, fontsize=16, color='white')
+
+    # Routes in the vehicle-dict format of simulated_annealing_module
+    def draw_vehicles(self, vehicles, title=None):
+        routes = []
+        for vehicle in vehicles:
+            packages = vehicle['assigned_packages']
+            routes.append(([p['id'] for p in packages], np.array([p['x'] for p in packages], dtype=float),
+                           np.array([p['y'] for p in packages], dtype=float)))
+        self._draw(routes, title)
+
+    # Routes as package indices (one list per vehicle) of a models.Instance, e.g. solver progress
+    def draw_routes(self, instance, routes, title=None):
+        self._draw([(instance.package_ids[route], instance.x[route], instance.y[route])
+                    for route in (np.asarray(route, dtype=np.int64) for route in routes)], title)
+
+    def save(self, filename):
+        self.figure.savefig(filename, facecolor='black')
+
+    # The current frame as an RGBA array (height x width x 4)
+    def frame(self):
+        self.figure.canvas.draw()
+        return np.asarray(self.figure.canvas.buffer_rgba())
+
+    def close(self):
+        if not self.headless:
+            import matplotlib.pyplot as plt
+            plt.close(self.figure)
+
+
+# A callback for iter_anneal_routes / iter_evolve_population progress (via solve(..., callback=...))
+# that saves every `every`-th step as pattern.format(step) through one incremental renderer, e.g.
+# progress_frames(instance, 'frames/{:05d}.png'). Never stops the run.
+def progress_frames(instance, pattern, every=1, renderer=None):
+    renderer = renderer or RouteRenderer()
+    count = [0]
+
+    def callback(progress):
+        step = count[0]
+        count[0] += 1
+        if step % every:
+            return False
+        if 'best_routes' in progress:
+            routes = decode_routes(progress['best_routes'])
+            cost = progress['best_cost']
+        else:
+            routes = progress['best']
+            cost = progress['best_fitness']
+        renderer.draw_routes(instance, routes, f"Step {step}: {cost:.1f}")
+        renderer.save(pattern.format(step))
+        return False
+    return callback
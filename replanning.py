@@ -0,0 +1,370 @@
+import bisect
+import copy
+import os
+import random
+import time
+
+from distance_matrix import DistanceMatrix
+from models import Instance, decode_routes
+from moves import LazyNeighbors, MoveContext
+from simulated_annealing_module import anneal_routes
+from genetic_algorithm_module import evolve, mutation
+from solver import ALGORITHMS, load_instance, normalize_instance
+from spatial_index import GridIndex
+
+# SA moves spent per changed package in a warm restart
+EVALUATIONS_PER_CHANGE = 300
+# Temperatures of the warm restart: low, so the existing routes are refined rather than scrambled
+WARM_TEMPERATURE = 10.0
+WARM_STOPPING_TEMPERATURE = 0.1
+# Nearest assigned packages next to which a new package is tried for insertion
+INSERTION_NEIGHBORS = 8
+
+
+# Re-planning during the day: holds a solution (one route of package indices per vehicle) together
+# with the instance, distance matrix and spatial index it was built on, and updates them in place as
+# packages and vehicles come and go. reoptimize() then puts the new or displaced packages in by
+# cheapest insertion and runs a short SA restart whose moves all start from the packages around the
+# change, so re-planning time follows the size of the change rather than the size of the instance.
+# The distance and result row of every route are kept too and worked out again only for the routes
+# a change touches.
+class Replanner:
+    def __init__(self, instance, routes, distance_matrix=None, depot=(0, 0)):
+        self.instance = instance
+        if distance_matrix is None:
+            distance_matrix = DistanceMatrix.from_instance(instance, depot)
+        self.distance_matrix = distance_matrix
+        self.routes = [list(route) for route in routes]
+        self.routes += [[] for _ in range(instance.n_vehicles - len(self.routes))]
+        weights = instance.weight.tolist()
+        self.loads = [sum(weights[p] for p in route) for route in self.routes]
+        self.route_of = [-1] * instance.n_packages
+        for k, route in enumerate(self.routes):
+            for p in route:
+                self.route_of[p] = k
+        self.index = GridIndex(instance.x, instance.y)
+        self.neighbors = LazyNeighbors(self.index)
+        # Instance columns and package locations of the move code, updated with every change rather
+        # than rebuilt for every search
+        self.context = MoveContext(instance, distance_matrix, self.neighbors)
+        self.context.locate(self.routes)
+        # Packages waiting for a route, and assigned packages next to a change
+        self.pending = [p for p, k in enumerate(self.route_of) if k < 0]
+        self.changed = set()
+        # Per route: distance, and (result row, priority score) or None; both are out of date for
+        # the routes in _stale
+        self._distances = [0.0] * len(self.routes)
+        self._rows = [None] * len(self.routes)
+        self._stale = set(range(len(self.routes)))
+
+    # Replanner for the result of solver.solve on instance (dict or path)
+    @classmethod
+    def from_result(cls, instance, result, depot=(0, 0)):
+        if isinstance(instance, (str, os.PathLike)):
+            instance = load_instance(instance)
+        else:
+            instance = normalize_instance(instance)
+        columns = Instance.from_dicts(instance['vehicles'], instance['packages'])
+        vehicle_index = {vid: k for k, vid in enumerate(columns.vehicle_ids.tolist())}
+        routes = [[] for _ in range(columns.n_vehicles)]
+        for r in result['routes']:
+            routes[vehicle_index[r['vehicle_id']]] = [columns.index_of(pid) for pid in r['packages']]
+        return cls(columns, routes, depot=depot)
+
+    def _vehicle(self, vehicle_id):
+        matches = (self.instance.vehicle_ids == vehicle_id).nonzero()[0]
+        if not len(matches):
+            raise ValueError(f"Unknown vehicle id {vehicle_id}")
+        return matches.item(0)
+
+    def _package(self, package_id):
+        try:
+            return self.instance.index_of(package_id)
+        except KeyError:
+            raise ValueError(f"Unknown package id {package_id}") from None
+
+    # Take packages out of their routes; their route neighbors are marked as changed
+    def _unassign(self, packages):
+        weights = self.instance.weight.tolist()
+        by_route = {}
+        for p in packages:
+            if self.route_of[p] >= 0:
+                by_route.setdefault(self.route_of[p], set()).add(p)
+                self.route_of[p] = -1
+        for k, removed in by_route.items():
+            route = self.routes[k]
+            for i, p in enumerate(route):
+                if p in removed:
+                    self.changed.update(q for q in route[max(i - 1, 0):i + 2] if q not in removed)
+            self.routes[k] = [p for p in route if p not in removed]
+            # Summed again rather than subtracted, so rounding cannot leave load on an emptied route
+            self.loads[k] = sum(weights[p] for p in self.routes[k])
+            self._stale.add(k)
+            for p in removed:
+                self.context.route_of[p] = -1
+        self.context.reindex(self.routes, by_route)
+
+    # New packages (dicts with id, x, y, weight, priority), waiting for the next reoptimize
+    def add_packages(self, packages):
+        packages = normalize_instance({'vehicles': [{'id': 0, 'capacity': 0}], 'packages': packages})['packages']
+        for p in packages:
+            if p['id'] in self.distance_matrix.index:
+                raise ValueError(f"Package id {p['id']} is already in the instance")
+        start = self.instance.n_packages
+        columns = {name: [p[name] for p in packages] for name in ('id', 'x', 'y', 'weight', 'priority')}
+        self.instance.add_packages(columns['id'], columns['x'], columns['y'], columns['weight'], columns['priority'])
+        self.distance_matrix.add_points(list(zip(columns['x'], columns['y'])), columns['id'])
+        context = self.context
+        context.weights += self.instance.weight[start:].tolist()
+        context.priorities += self.instance.priority[start:].tolist()
+        context.route_of += [-1] * len(packages)
+        context.position += [0] * len(packages)
+        for i, p in enumerate(packages, start=start):
+            self.index.insert(i, p['x'], p['y'])
+            self.route_of.append(-1)
+            self.pending.append(i)
+
+    # Cancelled packages by id. The last packages move into the freed indices (models.swap_remove_plan),
+    # so the instance, distance matrix, index and routes are renumbered only for those.
+    def remove_packages(self, package_ids):
+        removed = [self._package(pid) for pid in package_ids]
+        gone = set(removed)
+        self._unassign(removed)
+        self.changed -= gone
+        self.pending = [p for p in self.pending if p not in gone]
+        for p in removed:
+            self.index.remove(p)
+
+        moves = self.instance.remove_packages(removed)
+        self.distance_matrix.remove_nodes([p + 1 for p in removed])
+        context = self.context
+        for column in (context.weights, context.priorities, context.route_of, context.position):
+            for old, new in moves.items():
+                column[new] = column[old]
+            del column[self.instance.n_packages:]
+        for old, new in moves.items():
+            self.index.remove(old)
+            self.index.insert(new, self.index.xs[old], self.index.ys[old])
+            k = self.route_of[new] = self.route_of[old]
+            if k >= 0:
+                route = self.routes[k]
+                i = route.index(old)
+                route[i] = new
+                context.position[new] = i
+                self._stale.add(k)
+        del self.route_of[self.instance.n_packages:]
+        self.changed = {moves.get(p, p) for p in self.changed}
+        self.pending = [moves.get(p, p) for p in self.pending]
+        # Cached neighbor lists may name removed or renumbered packages
+        self.neighbors = context.neighbors = LazyNeighbors(self.index)
+
+    # New vehicles (dicts with id, capacity), empty until reoptimize fills them
+    def add_vehicles(self, vehicles):
+        vehicles = normalize_instance({'vehicles': vehicles, 'packages': []})['vehicles']
+        ids = set(self.instance.vehicle_ids.tolist())
+        for v in vehicles:
+            if v['id'] in ids:
+                raise ValueError(f"Vehicle id {v['id']} is already in the instance")
+        self.instance.add_vehicles([v['id'] for v in vehicles], [v['capacity'] for v in vehicles])
+        self._stale.update(range(len(self.routes), len(self.routes) + len(vehicles)))
+        self.routes += [[] for _ in vehicles]
+        self.loads += [0] * len(vehicles)
+        self._distances += [0.0] * len(vehicles)
+        self._rows += [None] * len(vehicles)
+        self.context.capacities = self.instance.capacity.tolist()
+
+    # Vehicles taken off the road; their packages wait for another vehicle
+    def remove_vehicles(self, vehicle_ids):
+        removed = sorted({self._vehicle(vid) for vid in vehicle_ids})
+        for k in removed:
+            for p in self.routes[k]:
+                self.route_of[p] = self.context.route_of[p] = -1
+            self.pending.extend(self.routes[k])
+        self.instance.remove_vehicles(removed)
+        self.context.capacities = self.instance.capacity.tolist()
+        for k in reversed(removed):
+            del self.routes[k], self.loads[k], self._distances[k], self._rows[k]
+        self._stale = {k - bisect.bisect(removed, k) for k in self._stale if k not in removed}
+        shifted = range(removed[0] if removed else len(self.routes), len(self.routes))
+        for k in shifted:
+            for p in self.routes[k]:
+                self.route_of[p] = k
+        self.context.reindex(self.routes, shifted)
+
+    # New capacity for a vehicle. When its load no longer fits, packages come off the route, each time
+    # the one whose removal saves the most distance, and wait for another vehicle.
+    def set_capacity(self, vehicle_id, capacity):
+        k = self._vehicle(vehicle_id)
+        capacity = float(capacity)
+        self.instance.capacity[k] = capacity
+        self.context.capacities[k] = capacity
+        self._stale.add(k)
+        d = self.distance_matrix.distance
+        route = self.routes[k]
+        while route and self.loads[k] > capacity:
+            nodes = [0] + [p + 1 for p in route] + [0]
+            i = max(range(len(route)),
+                    key=lambda i: d(nodes[i], nodes[i + 1]) + d(nodes[i + 1], nodes[i + 2]) - d(nodes[i], nodes[i + 2]))
+            p = route[i]
+            self._unassign([p])
+            route = self.routes[k]
+            self.pending.append(p)
+
+    # Apply a whole change at once: a dict with any of 'add_packages', 'remove_packages' (ids),
+    # 'add_vehicles', 'remove_vehicles' (ids) and 'capacities' ({vehicle id: capacity})
+    def apply(self, delta):
+        if delta.get('remove_packages'):
+            self.remove_packages(delta['remove_packages'])
+        if delta.get('remove_vehicles'):
+            self.remove_vehicles(delta['remove_vehicles'])
+        if delta.get('add_vehicles'):
+            self.add_vehicles(delta['add_vehicles'])
+        for vehicle_id, capacity in (delta.get('capacities') or {}).items():
+            self.set_capacity(int(vehicle_id), capacity)
+        if delta.get('add_packages'):
+            self.add_packages(delta['add_packages'])
+
+    # Cheapest insertion of package p: positions next to its nearest packages on routes with room,
+    # then empty vehicles. The neighbor search only runs while some non-empty route has room, so a
+    # package that fits nowhere does not scan the whole instance.
+    def _insert(self, p, weights, capacities):
+        d = self.distance_matrix.distance
+        node = p + 1
+        w = weights[p]
+        route_of, loads = self.route_of, self.loads
+
+        def fits(k):
+            return loads[k] + w <= capacities[k]
+
+        open_routes = [k for k in range(len(self.routes)) if fits(k)]
+        candidates = set()
+        if any(self.routes[k] for k in open_routes):
+            near = self.index.nearest(self.index.xs[p], self.index.ys[p], INSERTION_NEIGHBORS,
+                                      accept=lambda q: route_of[q] >= 0 and fits(route_of[q]))
+            for q in near:
+                i = self.routes[route_of[q]].index(q)
+                candidates.update(((route_of[q], i), (route_of[q], i + 1)))
+        best, best_cost = None, None
+        for k, i in candidates:
+            route = self.routes[k]
+            prev = route[i - 1] + 1 if i else 0
+            nxt = route[i] + 1 if i < len(route) else 0
+            cost = d(prev, node) + d(node, nxt) - d(prev, nxt)
+            if best_cost is None or cost < best_cost:
+                best, best_cost = (k, i), cost
+        # An empty vehicle is only worth it when it beats every insertion next to a neighbor
+        empty = [k for k in open_routes if not self.routes[k]]
+        if empty:
+            cost = d(0, node) + d(node, 0)
+            if best_cost is None or cost < best_cost:
+                best = (min(empty, key=capacities.__getitem__), 0)
+        if best is None:
+            return False
+        k, i = best
+        self.routes[k].insert(i, p)
+        loads[k] += w
+        route_of[p] = k
+        self.context.reindex(self.routes, (k,))
+        self._stale.add(k)
+        return True
+
+    # Insert the pending packages (heaviest first) and improve the routes around every change with a
+    # warm SA restart ('sa'), or a short GA run seeded with the current routes ('ga'; the GA scores
+    # whole solutions, so its cost grows with the instance). params go to anneal_routes / evolve;
+    # by default SA gets EVALUATIONS_PER_CHANGE moves per changed package, cooling from
+    # WARM_TEMPERATURE to WARM_STOPPING_TEMPERATURE over them. Returns a result like solver.solve.
+    def reoptimize(self, algorithm='sa', time_limit=None, seed=None, stats=None, **params):
+        if seed is not None:
+            random.seed(seed)
+        if stats is None:
+            stats = {}
+        start = time.time()
+        inserted = self.refine(algorithm, time_limit, stats, **params)
+
+        elapsed = time.time() - start
+        self._refresh()
+        instance = self.instance
+        for k, route in enumerate(self.routes):
+            if self._rows[k] is None:
+                row = {'vehicle_id': instance.vehicle_ids.item(k), 'capacity': instance.capacity.item(k),
+                       'load': float(sum(instance.weight.item(p) for p in route)),
+                       'packages': [instance.package_ids.item(p) for p in route]}
+                self._rows[k] = (row, sum((i + 1) * instance.priority.item(p) for i, p in enumerate(route)))
+        return {'algorithm': algorithm,
+                'routes': [dict(row, packages=list(row['packages'])) for row, _ in self._rows],
+                'distance': float(sum(self._distances)),
+                'priority_score': sum(score for _, score in self._rows),
+                'unassigned': [instance.package_ids.item(p) for p in sorted(self.pending)],
+                'elapsed': elapsed, 'evaluations': stats.get('evaluations', 0), 'inserted': inserted}
+
+    # Distance of the routes changed since the last call; their result rows are dropped
+    def _refresh(self):
+        for k in self._stale:
+            self._distances[k] = self.distance_matrix.route_distance([p + 1 for p in self.routes[k]])
+            self._rows[k] = None
+        self._stale = set()
+
+    # The search of reoptimize on self.routes alone, without building a result; returns the number
+    # of pending packages inserted
+    def refine(self, algorithm='sa', time_limit=None, stats=None, **params):
+        if algorithm not in ALGORITHMS:
+            raise ValueError(f"Unknown algorithm '{algorithm}' (expected one of {', '.join(ALGORITHMS)})")
+        instance = self.instance
+        weights = instance.weight.tolist()
+        capacities = instance.capacity.tolist()
+
+        pending = sorted(self.pending, key=lambda p: -weights[p])
+        inserted = [p for p in pending if self._insert(p, weights, capacities)]
+        self.pending = [p for p in pending if self.route_of[p] < 0]
+        focus = sorted(self.changed.union(inserted))
+        self.changed = set()
+
+        if focus and algorithm == 'sa':
+            max_evaluations = params.pop('max_evaluations', EVALUATIONS_PER_CHANGE * len(focus))
+            initial_temperature = params.pop('initial_temperature', WARM_TEMPERATURE)
+            stopping_temperature = params.pop('stopping_temperature', WARM_STOPPING_TEMPERATURE)
+            # 100 moves per temperature step, cooled to reach the stopping temperature on the last one
+            steps = max(max_evaluations // 100, 1)
+            cooling_rate = params.pop('cooling_rate', (stopping_temperature / initial_temperature) ** (1 / steps))
+            params.setdefault('polish', True)
+            # The search edits the routes it is given; self.routes stays as it was for _set_routes
+            self._refresh()
+            routes = [list(route) for route in self.routes]
+            best_routes, _, _ = anneal_routes(instance, routes, list(self.loads), self.distance_matrix,
+                                              initial_temperature, cooling_rate, stopping_temperature, time_limit,
+                                              max_evaluations, stats=stats, neighbors=self.neighbors, focus=focus,
+                                              initial_cost=sum(self._distances), ctx=self.context, **params)
+            best = decode_routes(best_routes)
+            # The context follows the search's last routes: relocate the ones that differ from the best
+            self.context.reindex(best, [k for k, route in enumerate(routes) if route != best[k]])
+            self._set_routes(best)
+        elif focus:
+            population_size = params.pop('population_size', 10)
+            params.setdefault('generations', 20)
+            population = [copy.deepcopy(self.routes)]
+            population += [mutation(copy.deepcopy(self.routes), 0.5) for _ in range(population_size - 1)]
+            best = evolve(population, instance, distance_matrix=self.distance_matrix, time_limit=time_limit,
+                          stats=stats, **params)
+            self._set_routes(best)
+        return len(inserted)
+
+    # Take the routes found by a search, updating only the ones that differ
+    def _set_routes(self, routes):
+        weights = self.instance.weight.tolist()
+        changed = [k for k, route in enumerate(routes) if list(route) != self.routes[k]]
+        dropped = []
+        for k in changed:
+            for p in self.routes[k]:
+                self.route_of[p] = -1
+            dropped += self.routes[k]
+        for k in changed:
+            route = self.routes[k] = list(routes[k])
+            self.loads[k] = sum(weights[p] for p in route)
+            for p in route:
+                self.route_of[p] = k
+        dropped = [p for p in dropped if self.route_of[p] < 0]
+        for p in dropped:
+            self.context.route_of[p] = -1
+        self.context.reindex(self.routes, changed)
+        self.pending += dropped
+        self._stale.update(changed)
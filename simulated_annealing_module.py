@@ -1,7 +1,34 @@
 import math
 import random
 import copy
-import matplotlib.pyplot as plt
+import sys
+import time
+from distance_matrix import DistanceMatrix
+from models import Instance, encode_routes, decode_routes
+from construction import construct_routes
+from moves import (MoveContext, granular_neighbors, routes_distance, routes_priority, propose_move,
+                   propose_granular_move, apply_move, polish_routes)
+from utils import run_steps
+
+# Adaptive schedule (schedule='adaptive'): the initial temperature accepts about INITIAL_ACCEPTANCE
+# of the worsening moves among CALIBRATION_MOVES sampled ones, and the run cools to
+# FINAL_TEMPERATURE_RATIO of it
+CALIBRATION_MOVES = 200
+INITIAL_ACCEPTANCE = 0.1
+FINAL_TEMPERATURE_RATIO = 1e-3
+# Moves per temperature step per package, within these bounds
+MOVES_PER_PACKAGE = 0.5
+MIN_MOVES_PER_STEP = 100
+MAX_MOVES_PER_STEP = 5000
+# While more than HOT_ACCEPTANCE of the worsening moves pass, each step cools HOT_SPEEDUP steps' worth
+HOT_ACCEPTANCE = 0.6
+HOT_SPEEDUP = 4
+# Reheat to REHEAT_FRACTION of the initial temperature after REHEAT_AFTER steps without a new best
+# while fewer than FROZEN_ACCEPTANCE of the worsening moves pass, at most MAX_REHEATS times
+FROZEN_ACCEPTANCE = 0.02
+REHEAT_AFTER = 10
+REHEAT_FRACTION = 0.1
+MAX_REHEATS = 3
 
 # Input vehicles and packages
 def input_vehicles():
@@ -44,20 +71,26 @@ def assign_packages_randomly(vehicles, packages):
             unassigned_packages.append(package)
     return vehicles, unassigned_packages
 
+# Heuristic assignment ('savings', 'sweep' or 'nearest_neighbor', see construction.py),
+# returned the same way as assign_packages_randomly
+def assign_packages_constructed(vehicles, packages, method='savings', distance_matrix=None):
+    instance = Instance.from_dicts(vehicles, packages)
+    routes = construct_routes(instance, method, distance_matrix)
+    assigned = set()
+    for vehicle, route in zip(vehicles, routes):
+        vehicle['assigned_packages'] = [packages[p] for p in route]
+        vehicle['current_load'] = sum(packages[p]['weight'] for p in route)
+        assigned.update(route)
+    unassigned_packages = [package for p, package in enumerate(packages) if p not in assigned]
+    return vehicles, unassigned_packages
+
 # Total distance
-def calculate_total_distance(vehicles):
+def calculate_total_distance(vehicles, distance_matrix=None):
+    if distance_matrix is None:
+        distance_matrix = DistanceMatrix.from_packages([p for v in vehicles for p in v['assigned_packages']], dense=False)
     total_distance = 0
     for vehicle in vehicles:
-        if not vehicle['assigned_packages']:
-            continue
-        current_x, current_y = 0, 0
-        for package in vehicle['assigned_packages']:
-            next_x, next_y = package['x'], package['y']
-            distance = math.sqrt((next_x - current_x)**2 + (next_y - current_y)**2)
-            total_distance += distance
-            current_x, current_y = next_x, next_y
-        distance_back = math.sqrt(current_x**2 + current_y**2)
-        total_distance += distance_back
+        total_distance += distance_matrix.route_distance_keys([p['id'] for p in vehicle['assigned_packages']])
     return total_distance
 
 # Priority score
@@ -68,161 +101,310 @@ def calculate_priority_score(vehicles):
             score += (idx + 1) * package['priority']
     return score
 
-# Neighbor generation
-def generate_neighbor(vehicles):
-    new_vehicles = copy.deepcopy(vehicles)
-    move_type = random.choice(['move', 'swap_between', 'reorder'])
-
-    if move_type == 'move':
-        source = None
-        while True:
-            candidate = random.choice(new_vehicles)
-            if candidate['assigned_packages']:
-                source = candidate
-                break
-
-        package = random.choice(source['assigned_packages'])
+# Routes (package indices) and loads of a vehicle-dict solution over instance
+def vehicles_to_routes(vehicles, instance):
+    routes = [[instance.index_of(p['id']) for p in v['assigned_packages']] for v in vehicles]
+    loads = [v['current_load'] for v in vehicles]
+    return routes, loads
 
-        for target in new_vehicles:
-            if target['id'] != source['id'] and target['current_load'] + package['weight'] <= target['capacity']:
-                source['assigned_packages'].remove(package)
-                source['current_load'] -= package['weight']
-                target['assigned_packages'].append(package)
-                target['current_load'] += package['weight']
-                break
+# Vehicle-dict solution from routes, reusing the package dicts and the other keys of the vehicle dicts
+def routes_to_vehicles(routes, loads, vehicles, packages):
+    return [dict(v, assigned_packages=[packages[i] for i in route], current_load=load)
+            for v, route, load in zip(vehicles, routes, loads)]
 
-    elif move_type == 'swap_between':
-        v1 = v2 = None
-        attempts = 0
-        while attempts < 10:
-            v1 = random.choice(new_vehicles)
-            v2 = random.choice(new_vehicles)
-            if v1 != v2 and v1['assigned_packages'] and v2['assigned_packages']:
-                break
-            attempts += 1
-
-        if v1 and v2 and v1['assigned_packages'] and v2['assigned_packages']:
-            p1 = random.choice(v1['assigned_packages'])
-            p2 = random.choice(v2['assigned_packages'])
-
-            new_load_v1 = v1['current_load'] - p1['weight'] + p2['weight']
-            new_load_v2 = v2['current_load'] - p2['weight'] + p1['weight']
-
-            if new_load_v1 <= v1['capacity'] and new_load_v2 <= v2['capacity']:
-                v1['assigned_packages'] = [pkg for pkg in v1['assigned_packages'] if pkg['id'] != p1['id']]
-                v2['assigned_packages'] = [pkg for pkg in v2['assigned_packages'] if pkg['id'] != p2['id']]
-                v1['assigned_packages'].append(p2)
-                v2['assigned_packages'].append(p1)
-                v1['current_load'] = new_load_v1
-                v2['current_load'] = new_load_v2
-
-    elif move_type == 'reorder':
-        vehicle = random.choice(new_vehicles)
-        if len(vehicle['assigned_packages']) >= 2:
-            i, j = random.sample(range(len(vehicle['assigned_packages'])), 2)
-            vehicle['assigned_packages'][i], vehicle['assigned_packages'][j] = vehicle['assigned_packages'][j], vehicle['assigned_packages'][i]
-
-    return new_vehicles
-
-# Simulated Annealing
-def simulated_annealing(vehicles, packages, initial_temperature=1000, cooling_rate=0.95, stopping_temperature=1):
-    current_solution = copy.deepcopy(vehicles)
-    current_cost = calculate_total_distance(current_solution)
-    current_priority_score = calculate_priority_score(current_solution)
-
-    best_solution = copy.deepcopy(current_solution)
+# Neighbor generation
+def generate_neighbor(vehicles):
+    packages = [p for v in vehicles for p in v['assigned_packages']]
+    instance = Instance.from_dicts(vehicles, packages)
+    ctx = MoveContext(instance, DistanceMatrix.from_instance(instance, dense=False))
+    routes, loads = vehicles_to_routes(vehicles, instance)
+    move, _, _ = propose_move(routes, loads, ctx)
+    apply_move(move, routes, loads, ctx)
+    return routes_to_vehicles(routes, loads, copy.deepcopy(vehicles), copy.deepcopy(packages))
+
+# Temperature at which about INITIAL_ACCEPTANCE of the worsening moves would be accepted, estimated
+# from moves proposed (not applied) moves; default when none of them is worse.
+# Returns (temperature, moves proposed).
+def calibrate_temperature(routes, loads, ctx, propose, priority_weight=0.0, default=1000, moves=CALIBRATION_MOVES):
+    worse = []
+    for _ in range(moves):
+        move, distance_change, priority_change = propose(routes, loads, ctx)
+        delta = distance_change + priority_weight * priority_change
+        if move is not None and delta > 0:
+            worse.append(delta)
+    if not worse:
+        return default, moves
+    return -sum(worse) / len(worse) / math.log(INITIAL_ACCEPTANCE), moves
+
+# Simulated annealing over an Instance, one temperature step at a time. routes (one list of package
+# indices per vehicle) and loads are edited in place. After every step it yields a progress dict with
+# the best solution so far ('best_routes' as one int array, see models.encode_routes); sending True
+# back stops the search. Returns (best_routes, best_cost, best_priority_score).
+# The search also stops once time_limit seconds or max_evaluations moves are used up, or after
+# stagnation_limit steps without a new best.
+# neighborhood 'granular' draws moves between nearby packages (moves.propose_granular_move),
+# 'random' the original uniformly random moves. polish runs moves.polish_routes on the best routes,
+# stopping at time_limit like the search.
+# neighbors replaces the neighbor lists built here (e.g. moves.LazyNeighbors) and focus restricts
+# granular moves and the polish to the listed packages (see replanning.py).
+# schedule 'geometric' runs 100 moves per step and multiplies the temperature by cooling_rate.
+# 'adaptive' calibrates the initial temperature (calibrate_temperature; initial_temperature and
+# stopping_temperature are then ignored), scales the moves per step with the instance, cools faster
+# while most moves pass, reheats when frozen (see the constants above) and, given max_evaluations,
+# fits the cooling rate so the final temperature falls on the last move.
+# priority_weight, when set, makes the objective distance + priority_weight * priority score; moves
+# are accepted and the best kept by it (the adaptive schedule uses it with weight 0 by default).
+# Otherwise a move that improves the priority score is always accepted, whatever its distance, as in
+# the original rule.
+# engine (time_windows.RouteEngine) adds time windows, service times and reload trips: the change in
+# its lateness and overload penalty, priced in O(1) from per-route prefix/suffix summaries, joins the
+# delta of every move (the weighted objective is then used, as with the adaptive schedule), the best
+# routes are the ones with the lowest distance + penalty, and the polish respects it too. The adaptive
+# schedule still calibrates on distance alone, so moves that break windows stay rare throughout.
+# initial_cost is the distance of routes when the caller already keeps it, and ctx a MoveContext it
+# keeps located on routes (both see replanning.py), saving passes over every package. ctx takes
+# focus and, when given, neighbors; the search leaves it located on its last routes, or on the
+# returned ones after a polish.
+# stats, when a dict, receives the number of evaluated moves and a (seconds, best distance) trace.
+# instrument (instrumentation.Instrumentation) counts moves by type, times the propose/apply phases
+# and records one trace row per temperature step.
+def iter_anneal_routes(instance, routes, loads, distance_matrix, initial_temperature=1000, cooling_rate=0.95,
+                       stopping_temperature=1, time_limit=None, max_evaluations=None, stagnation_limit=None,
+                       stats=None, instrument=None, neighborhood='granular', polish=False, neighbors=None,
+                       focus=None, schedule='geometric', priority_weight=None, engine=None, initial_cost=None,
+                       ctx=None):
+    start = time.time()
+    if neighborhood not in ('granular', 'random'):
+        raise ValueError(f"Unknown neighborhood '{neighborhood}' (expected 'granular' or 'random')")
+    if schedule not in ('geometric', 'adaptive'):
+        raise ValueError(f"Unknown schedule '{schedule}' (expected 'geometric' or 'adaptive')")
+    granular = neighborhood == 'granular'
+    if ctx is None:
+        if neighbors is None and (granular or polish):
+            neighbors = granular_neighbors(instance)
+        ctx = MoveContext(instance, distance_matrix, neighbors, focus)
+        if granular:
+            ctx.locate(routes)
+    else:
+        if neighbors is not None:
+            ctx.neighbors = neighbors
+        ctx.focus = focus
+    propose = propose_granular_move if granular else propose_move
+    current_penalty = 0.0
+    if engine is not None:
+        engine.load(routes)
+        current_penalty = engine.penalty
+
+    current_cost = routes_distance(routes, distance_matrix) if initial_cost is None else initial_cost
+    current_priority_score = routes_priority(routes, ctx.priorities)
+
+    best_routes = encode_routes(routes)
     best_cost = current_cost
     best_priority_score = current_priority_score
+    best_penalty = current_penalty
+    adaptive = schedule == 'adaptive'
+    weighted = priority_weight is not None or adaptive or engine is not None
+    weight = priority_weight or 0.0
+    best_objective = best_cost + weight * best_priority_score + best_penalty
 
     T = initial_temperature
+    evaluations = 0
+    stagnant_steps = 0
+    trace = [(0.0, best_cost)]
+    moves_per_step = 100
+    if adaptive:
+        moves_per_step = min(max(round(MOVES_PER_PACKAGE * len(ctx.weights)), MIN_MOVES_PER_STEP), MAX_MOVES_PER_STEP)
+        # Calibration takes at most half of a move budget
+        calibration_moves = CALIBRATION_MOVES if max_evaluations is None else min(CALIBRATION_MOVES,
+                                                                                   max_evaluations // 2)
+        initial_temperature, evaluations = calibrate_temperature(routes, loads, ctx, propose, weight,
+                                                                 initial_temperature, calibration_moves)
+        T = initial_temperature
+        stopping_temperature = initial_temperature * FINAL_TEMPERATURE_RATIO
+        if max_evaluations is not None:
+            steps = max((max_evaluations - evaluations) / moves_per_step, 1)
+            cooling_rate = FINAL_TEMPERATURE_RATIO ** (1 / steps)
+        frozen_steps = 0
+        reheats = 0
 
     while T > stopping_temperature:
-        for _ in range(100):
-            neighbor_solution = generate_neighbor(current_solution)
-            neighbor_cost = calculate_total_distance(neighbor_solution)
-            neighbor_priority_score = calculate_priority_score(neighbor_solution)
-
-            delta_distance = current_cost - neighbor_cost
-            delta_priority = current_priority_score - neighbor_priority_score
-
-            if delta_distance > 0:
-                current_solution = neighbor_solution
-                current_cost = neighbor_cost
-                current_priority_score = neighbor_priority_score
-
-                if current_cost < best_cost or (current_cost == best_cost and current_priority_score < best_priority_score):
-                    best_solution = copy.deepcopy(current_solution)
+        if time_limit is not None and time.time() - start >= time_limit:
+            break
+        moves = moves_per_step if max_evaluations is None else min(moves_per_step, max_evaluations - evaluations)
+        if moves <= 0:
+            break
+        evaluations += moves
+        improved = False
+        uphill = uphill_accepted = 0
+        if instrument is not None:
+            accepted_before = sum(instrument.accepted.values())
+        for _ in range(moves):
+            if instrument is not None:
+                t0 = time.perf_counter()
+            move, distance_change, priority_change = propose(routes, loads, ctx)
+
+            if weighted:
+                delta = distance_change + weight * priority_change
+                if engine is not None:
+                    penalty_change = engine.penalty_change(move, routes)
+                    delta += penalty_change
+                if delta <= 0:
+                    accept = True
+                else:
+                    uphill += 1
+                    accept = random.random() < math.exp(-delta / T)
+                    uphill_accepted += accept
+            else:
+                delta_distance = -distance_change
+                delta_priority = -priority_change
+
+                if delta_distance > 0 or delta_priority > 0:
+                    accept = True
+                else:
+                    acceptance_probability = math.exp(delta_distance / T)
+                    accept = random.uniform(0, 1) < acceptance_probability
+                    if delta_distance < 0:
+                        uphill += 1
+                        uphill_accepted += accept
+
+            if instrument is not None:
+                t1 = time.perf_counter()
+                instrument.add_time('propose', t1 - t0)
+                instrument.count_move(move[0] if move is not None else 'none', accept)
+
+            if accept:
+                touched = apply_move(move, routes, loads, ctx)
+                current_cost += distance_change
+                current_priority_score += priority_change
+                if engine is not None and touched:
+                    engine.update(routes, touched)
+                    current_penalty += penalty_change
+
+                if weighted:
+                    objective = current_cost + weight * current_priority_score + current_penalty
+                    if delta < 0 and objective < best_objective - 1e-9:
+                        best_routes = encode_routes(routes)
+                        best_cost = current_cost
+                        best_priority_score = current_priority_score
+                        best_penalty = current_penalty
+                        best_objective = objective
+                        improved = True
+                elif delta_distance > 0 and (current_cost < best_cost or (current_cost == best_cost and current_priority_score < best_priority_score)):
+                    best_routes = encode_routes(routes)
                     best_cost = current_cost
                     best_priority_score = current_priority_score
-
-            elif delta_priority > 0:
-                current_solution = neighbor_solution
-                current_cost = neighbor_cost
-                current_priority_score = neighbor_priority_score
-
-            else:
-                acceptance_probability = math.exp(delta_distance / T)
-                if random.uniform(0, 1) < acceptance_probability:
-                    current_solution = neighbor_solution
-                    current_cost = neighbor_cost
-                    current_priority_score = neighbor_priority_score
-
-        T *= cooling_rate
-
+                    improved = True
+
+                if instrument is not None:
+                    instrument.add_time('apply', time.perf_counter() - t1)
+
+        elapsed = time.time() - start
+        if instrument is not None:
+            instrument.count_evaluations(moves)
+            accepted = sum(instrument.accepted.values()) - accepted_before
+            instrument.record(step=len(trace) - 1, temperature=T, elapsed=elapsed, current_cost=current_cost,
+                              best_cost=best_cost, best_priority_score=best_priority_score, accepted=accepted,
+                              rejected=moves - accepted)
+
+        if adaptive:
+            acceptance = uphill_accepted / uphill if uphill else 0.0
+            T *= cooling_rate ** HOT_SPEEDUP if acceptance > HOT_ACCEPTANCE else cooling_rate
+            frozen_steps = 0 if improved or acceptance >= FROZEN_ACCEPTANCE else frozen_steps + 1
+            if frozen_steps >= REHEAT_AFTER and reheats < MAX_REHEATS:
+                T = max(T, initial_temperature * REHEAT_FRACTION)
+                frozen_steps = 0
+                reheats += 1
+        else:
+            T *= cooling_rate
+        trace.append((elapsed, best_cost))
+        stagnant_steps = 0 if improved else stagnant_steps + 1
+
+        stop = yield {'step': len(trace) - 2, 'temperature': T, 'elapsed': elapsed, 'evaluations': evaluations,
+                      'best_routes': best_routes, 'best_cost': best_cost, 'best_priority_score': best_priority_score}
+        if stop or (stagnation_limit is not None and stagnant_steps >= stagnation_limit):
+            break
+
+    if polish:
+        if instrument is not None:
+            t0 = time.perf_counter()
+        current, routes = routes, decode_routes(best_routes)
+        # A located ctx only needs the routes where the last and the best routes differ
+        located = ctx.route_of is not None
+        if located:
+            ctx.reindex(routes, [k for k, route in enumerate(current) if route != routes[k]])
+        weights = ctx.weights
+        loads = [sum(weights[p] for p in route) for route in routes]
+        deadline = None if time_limit is None else start + time_limit
+        best_cost += polish_routes(routes, loads, ctx, packages=focus, engine=engine, deadline=deadline,
+                                   located=located)
+        best_priority_score = routes_priority(routes, ctx.priorities)
+        if engine is not None:
+            best_penalty = engine.penalty
+        best_routes = encode_routes(routes)
+        trace.append((time.time() - start, best_cost))
+        if instrument is not None:
+            instrument.add_time('polish', time.perf_counter() - t0)
+
+    if stats is not None:
+        stats['evaluations'] = evaluations
+        stats['trace'] = trace
+        if adaptive:
+            stats['initial_temperature'] = initial_temperature
+            stats['reheats'] = reheats
+        if engine is not None:
+            stats['penalty'] = best_penalty
+    return best_routes, best_cost, best_priority_score
+
+# Simulated annealing over an Instance to completion; see iter_anneal_routes for the arguments.
+# callback(progress) is called after every temperature step and can return True to stop.
+def anneal_routes(instance, routes, loads, distance_matrix, initial_temperature=1000, cooling_rate=0.95,
+                  stopping_temperature=1, time_limit=None, max_evaluations=None, stagnation_limit=None,
+                  stats=None, instrument=None, callback=None, neighborhood='granular', polish=False, neighbors=None,
+                  focus=None, schedule='geometric', priority_weight=None, engine=None, initial_cost=None,
+                  ctx=None):
+    return run_steps(iter_anneal_routes(instance, routes, loads, distance_matrix, initial_temperature, cooling_rate,
+                                        stopping_temperature, time_limit, max_evaluations, stagnation_limit, stats,
+                                        instrument, neighborhood, polish, neighbors, focus, schedule,
+                                        priority_weight, engine, initial_cost, ctx), callback)
+
+# Simulated Annealing on the vehicle/package dicts; the search itself runs on anneal_routes
+# (callback receives the progress dicts of iter_anneal_routes)
+def simulated_annealing(vehicles, packages, initial_temperature=1000, cooling_rate=0.95, stopping_temperature=1,
+                        distance_matrix=None, time_limit=None, stats=None, instrument=None, max_evaluations=None,
+                        stagnation_limit=None, callback=None, neighborhood='granular', polish=False,
+                        schedule='geometric', priority_weight=None):
+    instance = Instance.from_dicts(vehicles, packages)
+    if distance_matrix is None:
+        distance_matrix = DistanceMatrix.from_instance(instance)
+
+    routes, loads = vehicles_to_routes(vehicles, instance)
+    best_routes, best_cost, best_priority_score = anneal_routes(instance, routes, loads, distance_matrix,
+                                                                initial_temperature, cooling_rate,
+                                                                stopping_temperature, time_limit, max_evaluations,
+                                                                stagnation_limit, stats, instrument, callback,
+                                                                neighborhood, polish, None, None, schedule,
+                                                                priority_weight)
+    best_routes = decode_routes(best_routes)
+    weights = instance.weight.tolist()
+    best_loads = [sum(weights[p] for p in route) for route in best_routes]
+    best_solution = routes_to_vehicles(best_routes, best_loads, vehicles, packages)
     return best_solution, best_cost, best_priority_score
 
-# Drawing
-def draw_solution(vehicles, filename='vehicle_routes.png'):
-    fig, ax = plt.subplots(figsize=(12, 10))
-    fig.patch.set_facecolor('black')
-    ax.set_facecolor('black')
-
-    colors = ['red', 'cyan', 'lime', 'yellow', 'orange', 'magenta', 'white', 'pink']
-    color_idx = 0
-
-    plt.scatter(0, 0, c='white', marker='s', s=150, label='Shop (0,0)')
-    plt.text(2, 2, 'Shop', fontsize=10, color='white')
-
-    for vehicle in vehicles:
-        if not vehicle['assigned_packages']:
-            continue
-
-        path_x = [0]
-        path_y = [0]
-
-        for package in vehicle['assigned_packages']:
-            path_x.append(package['x'])
-            path_y.append(package['y'])
-
-        path_x.append(0)
-        path_y.append(0)
-
-        for i in range(len(path_x) - 1):
-            plt.arrow(
-                path_x[i], path_y[i],
-                path_x[i+1] - path_x[i],
-                path_y[i+1] - path_y[i],
-                color=colors[color_idx % len(colors)],
-                length_includes_head=True,
-                head_width=2, head_length=3, alpha=0.8
-            )
-
-        for package in vehicle['assigned_packages']:
-            plt.scatter(package['x'], package['y'], color=colors[color_idx % len(colors)], s=70)
-            plt.text(package['x'] + 1, package['y'] + 1, f"Pkg {package['id']}", fontsize=8, color='white')
-
-        color_idx += 1
-
-    plt.title('Vehicle Delivery Routes', fontsize=16, color='white')
-    plt.xlabel('X Coordinate (km)', fontsize=14, color='white')
-    plt.ylabel('Y Coordinate (km)', fontsize=14, color='white')
-    plt.legend(facecolor='black', edgecolor='white', labelcolor='white')
-    plt.grid(True, color='gray', linestyle='--', alpha=0.3)
-    plt.xlim(-5, 105)
-    plt.ylim(-5, 105)
-    plt.savefig(filename, facecolor='black')
-    print(f"Plot saved as '{filename}' successfully ")
-    plt.show()
+# Drawing (matplotlib is only imported when a plot is requested). The plot is built by
+# rendering.RouteRenderer; without show it stays on a headless Agg figure.
+# max_points decimates the routes of very large solutions (see RouteRenderer). The confirmation goes
+# to stderr, so it never mixes with a result printed on stdout.
+def draw_solution(vehicles, filename='vehicle_routes.png', show=True, max_points=None):
+    from rendering import RouteRenderer
+
+    renderer = RouteRenderer(headless=not show, max_points=max_points)
+    renderer.draw_vehicles(vehicles)
+    renderer.save(filename)
+    print(f"Plot saved as '{filename}' successfully ", file=sys.stderr)
+    if show:
+        import matplotlib.pyplot as plt
+        plt.show()
+        renderer.close()
 
 # Main
 def run_simulated_annealing():
@@ -263,18 +445,19 @@ def run_simulated_annealing():
         {'id': 7, 'x': 10.0, 'y': 50.0, 'weight': 9.0, 'priority': 5}
     ]
 
+    distance_matrix = DistanceMatrix.from_packages(packages)
     vehicles, _ = assign_packages_randomly(vehicles, packages)
     for v in vehicles:
         print(f"Vehicle {v['id']} (Load: {v['current_load']} / {v['capacity']} kg)")
         for p in v['assigned_packages']:
             print(f"  Package {p['id']} at ({p['x']},{p['y']}) weight={p['weight']} priority={p['priority']}")
         print()
-    initial_cost = calculate_total_distance(vehicles)
+    initial_cost = calculate_total_distance(vehicles, distance_matrix)
     initial_priority_score = calculate_priority_score(vehicles)
     print(f"\nInitial total traveled distance: {initial_cost:.2f} km")
     print(f"Initial total priority score: {initial_priority_score}")
 
-    best_solution, best_cost, best_priority_score = simulated_annealing(vehicles, packages)
+    best_solution, best_cost, best_priority_score = simulated_annealing(vehicles, packages, distance_matrix=distance_matrix)
 
     print("\nFinal Best Solution After Simulated Annealing:")
     for v in best_solution:
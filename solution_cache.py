@@ -0,0 +1,195 @@
+import copy
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+
+from models import Instance
+from replanning import Replanner
+from solver import load_instance, normalize_instance, solve
+
+# Defaults for the two tiers: entries kept in memory, bytes of result JSON kept on disk
+MEMORY_ENTRIES = 128
+DISK_BYTES = 64 * 1024 * 1024
+# Largest share of differing packages for which a cached solution is still used as a warm start
+NEAR_MISS_FRACTION = 0.2
+# Cached solutions of the same fleet and parameters compared against a new instance
+NEAR_MISS_CANDIDATES = 8
+
+
+def _digest(data):
+    return hashlib.sha256(json.dumps(data, sort_keys=True, separators=(',', ':')).encode()).hexdigest()
+
+
+# Packages as sorted [id, x, y, weight, priority] rows: the same package list in any order gives the same rows
+def package_rows(instance):
+    return sorted([p['id'], p['x'], p['y'], p['weight'], p['priority']] for p in instance['packages'])
+
+
+# Canonical hashes of a solve: (key, family). key covers the packages, vehicles and solver settings
+# and is the same whatever order packages and vehicles are listed in; family leaves the packages out,
+# so solves that only differ in some packages share it (see SolutionCache.near_miss).
+def canonical_keys(instance, algorithm='sa', params=None, time_limit=None, seed=None):
+    settings = {'vehicles': sorted([v['id'], v['capacity']] for v in instance['vehicles']), 'algorithm': algorithm,
+                'params': params or {}, 'time_limit': time_limit, 'seed': seed}
+    family = _digest(settings)
+    return _digest({'family': family, 'packages': package_rows(instance)}), family
+
+
+# Two-tier cache of solve() results: an LRU dict of recent results in memory in front of an
+# optional SQLite file (path) that drops the least recently used results beyond max_bytes.
+# stats counts memory/disk hits, near misses (warm starts), misses, stores and evictions, and
+# 'saved_seconds', the solve time of the cached results handed out on hits.
+class SolutionCache:
+    def __init__(self, path=None, max_entries=MEMORY_ENTRIES, max_bytes=DISK_BYTES,
+                 near_miss_fraction=NEAR_MISS_FRACTION):
+        self.memory = OrderedDict()  # key -> (family, package rows, result)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.near_miss_fraction = near_miss_fraction
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'near_misses': 0, 'misses': 0, 'stores': 0,
+                      'evictions': 0, 'saved_seconds': 0.0}
+        self.db = None
+        if path is not None:
+            self.db = sqlite3.connect(path)
+            self.db.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, family TEXT NOT NULL, "
+                            "packages TEXT NOT NULL, result TEXT NOT NULL, size INTEGER NOT NULL, "
+                            "accessed REAL NOT NULL)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS results_family ON results (family, accessed)")
+            self.db.commit()
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+    @property
+    def hit_rate(self):
+        hits = self.stats['memory_hits'] + self.stats['disk_hits']
+        total = hits + self.stats['near_misses'] + self.stats['misses']
+        return hits / total if total else 0.0
+
+    def _remember(self, key, family, rows, result):
+        self.memory[key] = (family, rows, result)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+    # Cached result for key, or None. A warm-start result (see cached_solve) is returned but not
+    # counted as a hit.
+    def get(self, key):
+        entry = self.memory.get(key)
+        if entry is not None:
+            self.memory.move_to_end(key)
+            if entry[2].get('cache') != 'warm':
+                self.stats['memory_hits'] += 1
+            return entry[2]
+        if self.db is not None:
+            row = self.db.execute("SELECT family, packages, result FROM results WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self.db.execute("UPDATE results SET accessed = ? WHERE key = ?", (time.time(), key))
+                self.db.commit()
+                result = json.loads(row[2])
+                self._remember(key, row[0], json.loads(row[1]), result)
+                if result.get('cache') != 'warm':
+                    self.stats['disk_hits'] += 1
+                return result
+        return None
+
+    def put(self, key, family, rows, result):
+        self._remember(key, family, rows, copy.deepcopy(result))
+        self.stats['stores'] += 1
+        if self.db is None:
+            return
+        data = json.dumps(result)
+        self.db.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)",
+                        (key, family, json.dumps(rows), data, len(data), time.time()))
+        # Size-based eviction, least recently used first
+        total = self.db.execute("SELECT SUM(size) FROM results").fetchone()[0]
+        if total > self.max_bytes:
+            for old_key, size in self.db.execute("SELECT key, size FROM results ORDER BY accessed").fetchall():
+                if total <= self.max_bytes or old_key == key:
+                    break
+                self.db.execute("DELETE FROM results WHERE key = ?", (old_key,))
+                total -= size
+                self.stats['evictions'] += 1
+        self.db.commit()
+
+    # The cached result of the same family whose packages differ least from rows, when at most
+    # near_miss_fraction of them differ; returns (result, cached rows) or None
+    def near_miss(self, family, rows):
+        candidates = [(entry[1], entry[2]) for entry in reversed(self.memory.values()) if entry[0] == family]
+        if self.db is not None and len(candidates) < NEAR_MISS_CANDIDATES:
+            query = "SELECT packages, result FROM results WHERE family = ? ORDER BY accessed DESC LIMIT ?"
+            for packages, result in self.db.execute(query, (family, NEAR_MISS_CANDIDATES)):
+                candidates.append((json.loads(packages), json.loads(result)))
+        wanted = set(map(tuple, rows))
+        best, best_changes = None, None
+        for cached_rows, result in candidates[:NEAR_MISS_CANDIDATES * 2]:
+            changes = len(wanted.symmetric_difference(map(tuple, cached_rows)))
+            if best_changes is None or changes < best_changes:
+                best, best_changes = (result, cached_rows), changes
+        if best is None or best_changes > self.near_miss_fraction * max(len(rows), 1):
+            return None
+        return best
+
+
+# solver.solve through a SolutionCache. An identical instance (packages and vehicles in any order)
+# with the same settings returns the stored result with 'cache': 'hit'. A near miss re-plans the
+# closest cached solution with replanning.Replanner: packages that are new or changed are inserted
+# and only the routes around them are re-optimised ('cache': 'warm'). Anything else is a full solve
+# ('cache': 'miss'). Both new results are stored. Other keyword arguments (stats, instrument,
+# callback) go to solve() and only take effect on a miss; a warm start uses the warm SA/GA settings
+# of Replanner.reoptimize rather than params, so a stored warm result only serves as a starting
+# point: the same request again gets a full solve, which then replaces it.
+def cached_solve(cache, instance, algorithm='sa', params=None, time_limit=None, seed=None, **kwargs):
+    if isinstance(instance, (str, os.PathLike)):
+        instance = load_instance(instance)
+    else:
+        instance = normalize_instance(instance)
+    key, family = canonical_keys(instance, algorithm, params, time_limit, seed)
+    stored = cache.get(key)
+    if stored is not None and stored.get('cache') != 'warm':
+        cache.stats['saved_seconds'] += stored.get('elapsed', 0.0)
+        return dict(copy.deepcopy(stored), cache='hit')
+
+    rows = package_rows(instance)
+    near = cache.near_miss(family, rows) if stored is None else None
+    if near is not None:
+        cached, cached_rows = near
+        start = time.time()
+        columns = Instance.from_dicts(instance['vehicles'], instance['packages'])
+        # Only packages that are still there unchanged keep their place in the cached routes;
+        # the packages on either side of a dropped one count as changed
+        kept = {row[0] for row in set(map(tuple, cached_rows)).intersection(map(tuple, rows))}
+        vehicle_index = {vid: k for k, vid in enumerate(columns.vehicle_ids.tolist())}
+        routes = [[] for _ in range(columns.n_vehicles)]
+        changed = set()
+        for r in cached['routes']:
+            route = routes[vehicle_index[r['vehicle_id']]]
+            dropped = False
+            for pid in r['packages']:
+                if pid not in kept:
+                    dropped = True
+                    continue
+                if dropped:
+                    changed.update(route[-1:])
+                    changed.add(columns.index_of(pid))
+                    dropped = False
+                route.append(columns.index_of(pid))
+            if dropped:
+                changed.update(route[-1:])
+        planner = Replanner(columns, routes)
+        planner.changed.update(changed)
+        result = planner.reoptimize(algorithm, time_limit, seed)
+        result['elapsed'] = time.time() - start
+        result['cache'] = 'warm'
+        cache.stats['near_misses'] += 1
+    else:
+        result = solve(instance, algorithm, params, time_limit, seed, **kwargs)
+        result['cache'] = 'miss'
+        cache.stats['misses'] += 1
+    cache.put(key, family, rows, result)
+    return result
@@ -0,0 +1,383 @@
+import argparse
+import asyncio
+import itertools
+import json
+import multiprocessing
+import os
+import queue
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from models import decode_routes
+from solution_cache import canonical_keys
+from solver import ALGORITHMS, normalize_instance, solve
+
+# Seconds between progress messages of one solve
+PROGRESS_INTERVAL = 0.5
+# Largest request line accepted by the socket server (bytes)
+MAX_LINE = 64 * 1024 * 1024
+
+# Progress queue and cancelled-job set of the current worker process, set once by _init_worker
+_channel = {}
+
+
+def _init_worker(progress, cancelled):
+    _channel['progress'] = progress
+    _channel['cancelled'] = cancelled
+
+
+# Best routes of a progress dict as package ids per vehicle
+def _progress_routes(progress, instance):
+    routes = decode_routes(progress['best_routes']) if 'best_routes' in progress else progress['best']
+    packages = instance['packages']
+    return [{'vehicle_id': v['id'], 'packages': [packages[p]['id'] for p in route]}
+            for v, route in zip(instance['vehicles'], routes)]
+
+
+# Runs in a worker process: solver.solve with a callback that reports the best solution every
+# PROGRESS_INTERVAL seconds and stops the solve once the job is cancelled
+def _run_job(job_id, instance, algorithm, params, time_limit, seed):
+    progress_queue = _channel['progress']
+    cancelled = _channel['cancelled']
+    last = [0.0]
+
+    def callback(progress):
+        if job_id in cancelled:
+            return True
+        now = time.time()
+        if now - last[0] >= PROGRESS_INTERVAL:
+            last[0] = now
+            best = progress['best_cost'] if 'best_cost' in progress else progress['best_fitness']
+            progress_queue.put((job_id, {'type': 'progress', 'elapsed': progress['elapsed'],
+                                         'evaluations': progress['evaluations'], 'best': best,
+                                         'routes': _progress_routes(progress, instance)}))
+        return False
+
+    result = solve(instance, algorithm, params, time_limit, seed, callback=callback)
+    result['cancelled'] = job_id in cancelled
+    return result
+
+
+# One solve shared by every client that asked for the same instance and settings
+class Job:
+    def __init__(self, job_id, key):
+        self.id = job_id
+        self.key = key
+        self.result = asyncio.get_running_loop().create_future()
+        self.listeners = []  # asyncio.Queue per subscriber, fed progress and the final message
+        self.latest = None  # last progress message, replayed to late subscribers
+        self.subscribers = 0
+        self.future = None  # concurrent.futures.Future of the worker task
+
+
+# Handle given to a client for one submitted solve
+class JobHandle:
+    def __init__(self, service, job):
+        self.service = service
+        self.job = job
+        self.id = job.id
+        self.messages = asyncio.Queue()
+        self.cancelled = False
+        job.listeners.append(self.messages)
+        if job.latest is not None:
+            self.messages.put_nowait(job.latest)
+        if job.result.done():
+            self.messages.put_nowait(self.service._final_message(job))
+
+    # Progress messages ({'type': 'progress', ...}), ending with the final 'result' or 'error' message
+    async def updates(self):
+        while True:
+            message = await self.messages.get()
+            yield message
+            if message['type'] != 'progress':
+                return
+
+    async def result(self):
+        return await asyncio.shield(self.job.result)
+
+    # Stop waiting for this solve; the solve itself stops once no other client is waiting for it
+    def cancel(self):
+        if not self.cancelled:
+            self.cancelled = True
+            self.service._unsubscribe(self.job, self.messages)
+
+
+# Asyncio solve service: requests are queued on a process pool running solver.solve (and with it
+# simulated_annealing / evolve), identical requests in flight share one solve, progress is streamed
+# to every subscriber and cancelled solves stop at their next step and return their best so far.
+# Use it in-process (LocalClient) or serve it over a local socket (serve / ServiceClient).
+class SolveService:
+    def __init__(self, workers=None):
+        self.workers = workers or os.cpu_count()
+        self.jobs = {}  # key -> Job in flight
+        self.by_id = {}  # job id -> Job in flight
+        self.stats = {'submitted': 0, 'coalesced': 0, 'completed': 0, 'cancelled': 0, 'failed': 0}
+        self._ids = itertools.count(1)
+        self._manager = None
+
+    async def start(self):
+        self._manager = multiprocessing.Manager()
+        self._progress = self._manager.Queue()
+        self._cancelled = self._manager.dict()
+        self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                             initargs=(self._progress, self._cancelled))
+        self._pump = asyncio.create_task(self._pump_progress())
+        return self
+
+    async def close(self):
+        for job in list(self.jobs.values()):
+            self._cancel_job(job)
+        await asyncio.get_running_loop().run_in_executor(None, self._executor.shutdown)
+        self._pump.cancel()
+        self._manager.shutdown()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    # Queue a solve and return its JobHandle; a request identical to one in flight joins it
+    async def submit(self, instance, algorithm='sa', params=None, time_limit=None, seed=None):
+        if algorithm not in ALGORITHMS:
+            raise ValueError(f"Unknown algorithm '{algorithm}' (expected one of {', '.join(ALGORITHMS)})")
+        instance = normalize_instance(instance)
+        key, _ = canonical_keys(instance, algorithm, params, time_limit, seed)
+        self.stats['submitted'] += 1
+        job = self.jobs.get(key)
+        if job is not None:
+            self.stats['coalesced'] += 1
+        else:
+            job = self.jobs[key] = Job(next(self._ids), key)
+            self.by_id[job.id] = job
+            job.future = self._executor.submit(_run_job, job.id, instance, algorithm, params, time_limit, seed)
+            job.future.add_done_callback(
+                lambda future, loop=asyncio.get_running_loop(): loop.call_soon_threadsafe(self._finish, job))
+        job.subscribers += 1
+        return JobHandle(self, job)
+
+    def _final_message(self, job):
+        if job.result.cancelled():
+            return {'type': 'error', 'error': 'cancelled'}
+        if job.result.exception() is not None:
+            error = job.result.exception()
+            return {'type': 'error', 'error': f"{type(error).__name__}: {error}"}
+        return {'type': 'result', 'result': job.result.result()}
+
+    # Forget a job in flight, so that new requests for the same key start a new solve
+    def _forget(self, job):
+        if self.jobs.get(job.key) is job:
+            del self.jobs[job.key]
+        self.by_id.pop(job.id, None)
+
+    def _finish(self, job):
+        self._forget(job)
+        self._cancelled.pop(job.id, None)
+        if job.future.cancelled():
+            job.result.cancel()
+            self.stats['cancelled'] += 1
+        elif job.future.exception() is not None:
+            job.result.set_exception(job.future.exception())
+            self.stats['failed'] += 1
+        else:
+            result = job.future.result()
+            job.result.set_result(result)
+            self.stats['cancelled' if result['cancelled'] else 'completed'] += 1
+        message = self._final_message(job)
+        for listener in job.listeners:
+            listener.put_nowait(message)
+
+    def _cancel_job(self, job):
+        # A queued solve never starts; a running one stops at its next step, and its truncated
+        # result goes to nobody new
+        self._forget(job)
+        if not job.future.cancel():
+            self._cancelled[job.id] = True
+
+    def _unsubscribe(self, job, listener):
+        if listener in job.listeners:
+            job.listeners.remove(listener)
+        job.subscribers -= 1
+        if job.subscribers <= 0 and not job.result.done():
+            self._cancel_job(job)
+
+    # Move progress messages from the workers' queue to the subscribers of each job
+    async def _pump_progress(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                job_id, message = await loop.run_in_executor(None, self._progress.get, True, PROGRESS_INTERVAL)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                return
+            job = self.by_id.get(job_id)
+            if job is None:
+                continue
+            job.latest = message
+            for listener in job.listeners:
+                listener.put_nowait(message)
+
+
+# In-process client with the same interface as ServiceClient, for tests and single-process use
+class LocalClient:
+    def __init__(self, service):
+        self.service = service
+
+    # Solve and return the result; on_progress(message) is called for every progress message
+    async def solve(self, instance, algorithm='sa', params=None, time_limit=None, seed=None, on_progress=None):
+        handle = await self.service.submit(instance, algorithm, params, time_limit, seed)
+        try:
+            async for message in handle.updates():
+                if message['type'] == 'progress' and on_progress is not None:
+                    on_progress(message)
+                elif message['type'] == 'error':
+                    raise RuntimeError(message['error'])
+            return await handle.result()
+        except asyncio.CancelledError:
+            handle.cancel()
+            raise
+
+
+# Serve a SolveService over a local TCP socket, one JSON object per line. Requests:
+#   {"op": "solve", "request": id, "instance": {...}, "algorithm", "params", "time_limit", "seed"}
+#   {"op": "cancel", "request": id}
+# Replies carry the client's request id: {"type": "accepted", "job": n}, then any number of
+# {"type": "progress", ...}, then {"type": "result", "result": {...}} or {"type": "error", "error": ...}.
+# One connection may have several solves in flight; closing it cancels them.
+async def serve(service, host='127.0.0.1', port=8765):
+    async def handle_connection(reader, writer):
+        handles = {}  # request id -> JobHandle
+        streams = {}  # request id -> task forwarding its messages
+
+        async def send(message):
+            writer.write(json.dumps(message).encode() + b'\n')
+            await writer.drain()
+
+        async def stream(request, handle):
+            async for message in handle.updates():
+                await send(dict(message, request=request))
+            handles.pop(request, None)
+            streams.pop(request, None)
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                request = None
+                try:
+                    message = json.loads(line)
+                    request = message.get('request')
+                    if message['op'] == 'solve':
+                        handle = await service.submit(message['instance'], message.get('algorithm', 'sa'),
+                                                      message.get('params'), message.get('time_limit'),
+                                                      message.get('seed'))
+                        handles[request] = handle
+                        await send({'type': 'accepted', 'request': request, 'job': handle.id})
+                        streams[request] = asyncio.create_task(stream(request, handle))
+                    elif message['op'] == 'cancel':
+                        if request in handles:
+                            handles.pop(request).cancel()
+                            streams.pop(request).cancel()
+                            await send({'type': 'error', 'request': request, 'error': 'cancelled'})
+                    else:
+                        raise ValueError(f"Unknown op '{message['op']}' (expected 'solve' or 'cancel')")
+                except (ValueError, KeyError, TypeError, AttributeError) as e:
+                    await send({'type': 'error', 'request': request, 'error': f"{type(e).__name__}: {e}"})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            for handle in handles.values():
+                handle.cancel()
+            for task in streams.values():
+                task.cancel()
+            writer.close()
+
+    return await asyncio.start_server(handle_connection, host, port, limit=MAX_LINE)
+
+
+# Client for a service started with serve(); same interface as LocalClient
+class ServiceClient:
+    def __init__(self, host='127.0.0.1', port=8765):
+        self.host = host
+        self.port = port
+        self.reader = self.writer = None
+        self._requests = itertools.count(1)
+        self._pending = {}  # request id -> asyncio.Queue of replies
+        self._reader_task = None
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port, limit=MAX_LINE)
+        self._reader_task = asyncio.create_task(self._read())
+        return self
+
+    async def close(self):
+        self.writer.close()
+        self._reader_task.cancel()
+
+    async def __aenter__(self):
+        return await self.connect()
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def _read(self):
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                break
+            message = json.loads(line)
+            replies = self._pending.get(message.get('request'))
+            if replies is not None:
+                replies.put_nowait(message)
+        for replies in self._pending.values():
+            replies.put_nowait({'type': 'error', 'error': 'connection closed'})
+
+    async def _send(self, message):
+        self.writer.write(json.dumps(message).encode() + b'\n')
+        await self.writer.drain()
+
+    async def solve(self, instance, algorithm='sa', params=None, time_limit=None, seed=None, on_progress=None):
+        request = next(self._requests)
+        replies = self._pending[request] = asyncio.Queue()
+        try:
+            await self._send({'op': 'solve', 'request': request, 'instance': instance, 'algorithm': algorithm,
+                              'params': params, 'time_limit': time_limit, 'seed': seed})
+            while True:
+                message = await replies.get()
+                if message['type'] == 'progress' and on_progress is not None:
+                    on_progress(message)
+                elif message['type'] == 'result':
+                    return message['result']
+                elif message['type'] == 'error':
+                    raise RuntimeError(message['error'])
+        except asyncio.CancelledError:
+            await self._send({'op': 'cancel', 'request': request})
+            raise
+        finally:
+            del self._pending[request]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the solve service on a local TCP socket (JSON lines).")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('-w', '--workers', type=int)
+    args = parser.parse_args(argv)
+
+    async def run():
+        async with SolveService(args.workers) as service:
+            server = await serve(service, args.host, args.port)
+            print(f"Solve service listening on {args.host}:{args.port}")
+            async with server:
+                await server.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
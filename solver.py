@@ -0,0 +1,124 @@
+import csv
+import json
+import os
+import random
+import time
+
+from distance_matrix import DistanceMatrix
+from models import Instance
+from simulated_annealing_module import (assign_packages_randomly, assign_packages_constructed, simulated_annealing,
+                                        calculate_total_distance, calculate_priority_score)
+from genetic_algorithm_module import initialize_population, evolve, convert_solution_to_vehicles
+
+ALGORITHMS = ('sa', 'ga')
+PACKAGE_FIELDS = ('id', 'x', 'y', 'weight', 'priority')
+# Optional package fields for delivery time windows (see time_windows.py), kept when present
+WINDOW_FIELDS = ('ready', 'due', 'service')
+
+
+# Read an instance {'vehicles': [{'id', 'capacity'}], 'packages': [{'id', 'x', 'y', 'weight', 'priority'}]}
+# from a JSON file, or from a CSV file with columns type,id,x,y,weight,priority,capacity
+# where type is 'vehicle' or 'package'. Packages may also have ready, due and service (time_windows.py).
+def load_instance(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.json':
+        with open(path) as f:
+            return normalize_instance(json.load(f))
+    if ext == '.csv':
+        vehicles, packages = [], []
+        with open(path, newline='') as f:
+            for row in csv.DictReader(f):
+                kind = row['type'].strip().lower()
+                if kind == 'vehicle':
+                    vehicles.append({'id': row['id'], 'capacity': row['capacity']})
+                elif kind == 'package':
+                    packages.append({k: row[k] for k in PACKAGE_FIELDS + WINDOW_FIELDS if row.get(k) not in (None, '')})
+                else:
+                    raise ValueError(f"Unknown row type '{row['type']}' in {path}")
+        return normalize_instance({'vehicles': vehicles, 'packages': packages})
+    raise ValueError(f"Unsupported instance format '{ext}' (expected .json or .csv)")
+
+
+# Coerce the fields of an instance to the types the solvers expect
+def normalize_instance(instance):
+    vehicles = [{'id': int(v['id']), 'capacity': float(v['capacity'])} for v in instance['vehicles']]
+    packages = [{'id': int(p['id']), 'x': float(p['x']), 'y': float(p['y']), 'weight': float(p['weight']),
+                 'priority': int(p['priority']), **{k: float(p[k]) for k in WINDOW_FIELDS if k in p}}
+                for p in instance['packages']]
+    if not vehicles:
+        raise ValueError("Instance has no vehicles")
+    return {'vehicles': vehicles, 'packages': packages}
+
+
+# Structured, JSON-serialisable summary of a solution in the vehicle-dict format
+def solution_result(solution, packages, distance_matrix=None):
+    assigned = {p['id'] for v in solution for p in v['assigned_packages']}
+    return {
+        'routes': [{'vehicle_id': v['id'], 'capacity': v['capacity'], 'load': float(v['current_load']),
+                    'packages': [p['id'] for p in v['assigned_packages']]} for v in solution],
+        'distance': float(calculate_total_distance(solution, distance_matrix)),
+        'priority_score': calculate_priority_score(solution),
+        'unassigned': [p['id'] for p in packages if p['id'] not in assigned],
+    }
+
+
+# Rebuild the vehicle-dict solution of a result, e.g. for draw_solution
+def result_vehicles(result, instance):
+    by_id = {p['id']: p for p in instance['packages']}
+    return [{'id': r['vehicle_id'], 'capacity': r['capacity'], 'current_load': r['load'],
+             'assigned_packages': [by_id[i] for i in r['packages']]} for r in result['routes']]
+
+
+# Solve an instance (dict or path) with 'sa' or 'ga' without any interaction or plotting.
+# params are passed to simulated_annealing / evolve; the GA also takes 'population_size'.
+# 'initial' picks the SA start ('random' or a construction heuristic: 'savings', 'sweep',
+# 'nearest_neighbor') and 'seed_fraction' the share of heuristic individuals in the GA population.
+# stats, when a dict, receives the solver's evaluation count and best-cost trace;
+# instrument (instrumentation.Instrumentation) is passed on to the solver.
+# callback(progress) is called after every temperature step / generation and can return True to stop.
+# params may include 'max_evaluations' and 'stagnation_limit' for an anytime run.
+def solve(instance, algorithm='sa', params=None, time_limit=None, seed=None, stats=None, instrument=None,
+          callback=None):
+    if isinstance(instance, (str, os.PathLike)):
+        instance = load_instance(instance)
+    else:
+        instance = normalize_instance(instance)
+    if algorithm not in ALGORITHMS:
+        raise ValueError(f"Unknown algorithm '{algorithm}' (expected one of {', '.join(ALGORITHMS)})")
+    params = dict(params or {})
+    if seed is not None:
+        random.seed(seed)
+
+    if stats is None:
+        stats = {}
+
+    start = time.time()
+    packages = instance['packages']
+    columns = Instance.from_dicts(instance['vehicles'], packages)
+    distance_matrix = DistanceMatrix.from_instance(columns)
+
+    if algorithm == 'sa':
+        vehicles = [{'id': v['id'], 'capacity': v['capacity'], 'assigned_packages': [], 'current_load': 0}
+                    for v in instance['vehicles']]
+        initial = params.pop('initial', 'random')
+        if initial == 'random':
+            vehicles, _ = assign_packages_randomly(vehicles, packages)
+        else:
+            vehicles, _ = assign_packages_constructed(vehicles, packages, initial, distance_matrix)
+        solution, _, _ = simulated_annealing(vehicles, packages, distance_matrix=distance_matrix,
+                                             time_limit=time_limit, stats=stats, instrument=instrument, callback=callback,
+                                             **params)
+    else:
+        population_size = params.pop('population_size', 30)
+        seed_fraction = params.pop('seed_fraction', 0.0)
+        population = initialize_population(columns, population_size, seed_fraction, distance_matrix)
+        best = evolve(population, columns, distance_matrix=distance_matrix, time_limit=time_limit, stats=stats,
+                      instrument=instrument, callback=callback, **params)
+        solution = convert_solution_to_vehicles(columns, best)
+
+    elapsed = time.time() - start
+    result = {'algorithm': algorithm}
+    result.update(solution_result(solution, packages, distance_matrix))
+    result['elapsed'] = elapsed
+    result['evaluations'] = stats.get('evaluations', 0)
+    return result
@@ -0,0 +1,130 @@
+import heapq
+import math
+
+
+# Uniform grid over a set of points (package destinations) for nearest-neighbor queries.
+# Points are referred to by their position in xs/ys. A query only visits the rings of cells
+# around the query point until no unvisited cell can hold anything closer, so with a few
+# points per cell it costs about the same at 100 or 10,000 packages.
+class GridIndex:
+    def __init__(self, xs, ys, cell_size=None):
+        self.xs = [float(x) for x in xs]
+        self.ys = [float(y) for y in ys]
+        self.fixed_cell_size = cell_size
+        self._build(range(len(self.xs)))
+
+    def _build(self, points):
+        points = list(points)
+        n = len(points)
+        xs = [self.xs[i] for i in points]
+        ys = [self.ys[i] for i in points]
+        self.x0 = min(xs) if n else 0.0
+        self.y0 = min(ys) if n else 0.0
+        width = max(xs) - self.x0 if n else 0.0
+        height = max(ys) - self.y0 if n else 0.0
+
+        # Default cell size puts about two points in each cell
+        cell_size = self.fixed_cell_size
+        if cell_size is None:
+            cell_size = math.sqrt(max(width, 1e-9) * max(height, 1e-9) * 2 / max(n, 1))
+            cell_size = max(cell_size, (width + height) / max(n, 1), 1e-9)
+        self.cell_size = cell_size
+        # Range of cell columns / rows that can hold points
+        self.cols = (0, int(width // cell_size))
+        self.rows = (0, int(height // cell_size))
+
+        self.cells = {}
+        for i in points:
+            self.cells.setdefault(self._cell(self.xs[i], self.ys[i]), []).append(i)
+        self.count = self.built_count = n
+
+    def __len__(self):
+        return self.count
+
+    def _cell(self, x, y):
+        return int((x - self.x0) // self.cell_size), int((y - self.y0) // self.cell_size)
+
+    # Add point i at (x, y); i is either a new point (len(xs)) or one that was removed.
+    # The grid is rebuilt once it holds four times the points it was built for.
+    def insert(self, i, x, y):
+        if i == len(self.xs):
+            self.xs.append(float(x))
+            self.ys.append(float(y))
+        else:
+            self.xs[i], self.ys[i] = float(x), float(y)
+        col, row = cell = self._cell(self.xs[i], self.ys[i])
+        self.cells.setdefault(cell, []).append(i)
+        self.cols = (min(self.cols[0], col), max(self.cols[1], col))
+        self.rows = (min(self.rows[0], row), max(self.rows[1], row))
+        self.count += 1
+        if self.fixed_cell_size is None and self.count > 4 * max(self.built_count, 4):
+            self._build(i for cell in self.cells.values() for i in cell)
+
+    # Take a point out of the index. Once most points are gone the grid is rebuilt with bigger
+    # cells, so queries do not crawl through rings of empty cells.
+    def remove(self, i):
+        cell = self._cell(self.xs[i], self.ys[i])
+        self.cells[cell].remove(i)
+        if not self.cells[cell]:
+            del self.cells[cell]
+        self.count -= 1
+        if self.fixed_cell_size is None and 16 <= self.count * 4 <= self.built_count:
+            self._build(i for cell in self.cells.values() for i in cell)
+
+    # Cells at Chebyshev distance r from (cx, cy) that hold points
+    def _ring(self, cx, cy, r):
+        cells = self.cells
+        if r == 0:
+            cell = cells.get((cx, cy))
+            if cell:
+                yield cell
+            return
+        for x in range(cx - r, cx + r + 1):
+            for y in (cy - r, cy + r):
+                cell = cells.get((x, y))
+                if cell:
+                    yield cell
+        for y in range(cy - r + 1, cy + r):
+            for x in (cx - r, cx + r):
+                cell = cells.get((x, y))
+                if cell:
+                    yield cell
+
+    # Up to k points closest to (x, y), nearest first; accept(i) can rule points out
+    def nearest(self, x, y, k=1, accept=None):
+        if not self.count:
+            return []
+        cx, cy = self._cell(x, y)
+        last_ring = max(cx - self.cols[0], self.cols[1] - cx, cy - self.rows[0], self.rows[1] - cy)
+        xs, ys = self.xs, self.ys
+        best = []  # max-heap of the k best as (-distance, i)
+        for r in range(last_ring + 1):
+            if r and (2 * r + 1) ** 2 > 4 * len(self.cells):
+                # The rings have covered far more cells than are occupied: scan what is left directly
+                cells = [cell for (col, row), cell in self.cells.items() if max(abs(col - cx), abs(row - cy)) >= r]
+                last_ring = r
+            else:
+                cells = self._ring(cx, cy, r)
+            for cell in cells:
+                for i in cell:
+                    if accept is not None and not accept(i):
+                        continue
+                    d = math.hypot(xs[i] - x, ys[i] - y)
+                    if len(best) < k:
+                        heapq.heappush(best, (-d, i))
+                    elif d < -best[0][0]:
+                        heapq.heapreplace(best, (-d, i))
+            # Every point in ring r + 1 or beyond is at least r cells away
+            if r == last_ring or len(best) == k and -best[0][0] <= r * self.cell_size:
+                break
+        return [i for _, i in sorted(best, key=lambda item: -item[0])]
+
+    # The k nearest other points of every point
+    def neighbor_lists(self, k):
+        lists = []
+        for i in range(len(self.xs)):
+            found = self.nearest(self.xs[i], self.ys[i], k + 1)
+            if i in found:
+                found.remove(i)
+            lists.append(found[:k])
+        return lists
@@ -0,0 +1,40 @@
+import numpy as np
+
+from decomposition import vehicle_groups, partition, solve_decomposed
+from models import Instance
+
+
+def test_vehicle_groups_cover_every_cluster_with_demand():
+    assert vehicle_groups([20000, 5000, 5000], [12000, 12000, 600]) == [[0], [1], [2]]
+    assert vehicle_groups([5, 5, 5, 5, 30], [10, 0, 40]) == [[0, 2], [], [1, 3, 4]]
+    # More clusters with demand than vehicles: the largest demands come first
+    assert vehicle_groups([1], [3, 4]) == [[], [0]]
+
+
+# Two heavy blobs and a light one, with one large and two small vehicles: capacity 30,000 for a
+# demand of 24,600, split unevenly by k-means
+def uneven_instance():
+    rng = np.random.default_rng(7)
+    centers = [(-500, 0)] * 120 + [(500, 0)] * 120 + [(0, 800)] * 6
+    x = np.array([c[0] for c in centers]) + rng.normal(0, 20, len(centers))
+    y = np.array([c[1] for c in centers]) + rng.normal(0, 20, len(centers))
+    n = len(centers)
+    return Instance(np.arange(1, n + 1), x, y, np.full(n, 100.0), rng.integers(1, 6, n), np.arange(1, 4),
+                    [20000, 5000, 5000])
+
+
+def test_uneven_kmeans_split_gives_every_cluster_vehicles():
+    instance = uneven_instance()
+    clusters = partition(instance, 'kmeans', cluster_size=100, seed=0)
+    assert len(clusters) == 3
+    assert all(vehicles for packages, vehicles in clusters if len(packages))
+
+
+def test_uneven_kmeans_split_solves():
+    instance = uneven_instance()
+    result = solve_decomposed(instance, method='kmeans', cluster_size=100, workers=1, seed=0, max_evaluations=2000)
+    assigned = [p for route in result['routes'] for p in route]
+    assert len(assigned) == len(set(assigned))
+    assert len(assigned) + result['unassigned'] == instance.n_packages
+    for route, capacity in zip(result['routes'], instance.capacity.tolist()):
+        assert instance.weight[route].sum() <= capacity
@@ -0,0 +1,111 @@
+import copy
+import random
+import time
+
+import numpy as np
+import pytest
+
+from distance_matrix import DistanceMatrix
+from models import Instance
+from moves import MoveContext, granular_neighbors, propose_move, propose_granular_move, apply_move, polish_routes
+from time_windows import TimeWindows, RouteEngine, with_reloads, place_reloads, TIME_WARP_PENALTY, OVERLOAD_PENALTY
+
+N_PACKAGES = 60
+CAPACITIES = [40, 40, 60, 30]
+TRIPS = 3
+
+
+@pytest.fixture
+def problem():
+    random.seed(1)
+    rng = np.random.default_rng(1)
+    n, m = N_PACKAGES, len(CAPACITIES)
+    instance = Instance(np.arange(1, n + 1), rng.uniform(-50, 50, n), rng.uniform(-50, 50, n), rng.uniform(1, 10, n),
+                        rng.integers(1, 6, n), np.arange(1, m + 1), CAPACITIES)
+    ready = rng.uniform(0, 200, n)
+    windows = TimeWindows(ready, ready + rng.uniform(10, 100, n), rng.uniform(0, 5, n), speed=1.5, reload_time=7,
+                          horizon=400)
+    extended = with_reloads(instance, TRIPS)
+    distance_matrix = DistanceMatrix.from_instance(extended)
+    engine = RouteEngine(extended, windows, distance_matrix, instance.capacity)
+    order = list(range(n))
+    random.shuffle(order)
+    routes = place_reloads([order[k::m] for k in range(m)], engine, extended.n_packages - n)
+    weights = extended.weight.tolist()
+    loads = [sum(weights[p] for p in route) for route in routes]
+    ctx = MoveContext(extended, distance_matrix, granular_neighbors(extended))
+    ctx.locate(routes)
+    engine.load(routes)
+    return extended, distance_matrix, engine, routes, loads, ctx
+
+
+# Penalty of a route simulated stop by stop with schedule() and trips()
+def scheduled_penalty(engine, route, v):
+    warp = sum(late for _, _, _, late in engine.schedule(route))
+    overload = sum(max(sum(engine.weights[p] for p in trip) - engine.capacities[v], 0.0)
+                   for trip in engine.trips(route))
+    return TIME_WARP_PENALTY * warp + OVERLOAD_PENALTY * overload
+
+
+def test_load_matches_schedule(problem):
+    _, _, engine, routes, _, _ = problem
+    for v, route in enumerate(routes):
+        assert engine.penalties[v] == pytest.approx(scheduled_penalty(engine, route, v), abs=1e-6)
+        assert engine.route_penalty(route, v) == pytest.approx(engine.penalties[v], abs=1e-6)
+    assert engine.penalty > 0
+
+
+def test_moves_priced_like_schedule(problem):
+    extended, distance_matrix, engine, routes, loads, ctx = problem
+    kinds = set()
+    for k in range(5000):
+        propose = propose_granular_move if k % 2 else propose_move
+        move, _, _ = propose(routes, loads, ctx)
+        if move is None:
+            continue
+        kinds.add(move[0])
+        trial = copy.deepcopy(routes)
+        touched = apply_move(move, trial, list(loads), MoveContext(extended, distance_matrix))
+        before = sum(scheduled_penalty(engine, routes[v], v) for v in touched)
+        after = [scheduled_penalty(engine, trial[v], v) for v in touched]
+        assert engine.penalty_change(move, routes) == pytest.approx(sum(after) - before, abs=1e-6)
+        assert engine.feasible_move(move, routes) == all(penalty <= 1e-9 for penalty in after)
+        assert engine.penalty_at_stake(move) >= before - 1e-6
+        if random.random() < 0.3:
+            engine.update(routes, apply_move(move, routes, loads, ctx))
+    assert {'relocate', 'swap', '2opt', 'or_opt', '2opt_star'} <= kinds
+
+
+def test_swap_within_priced_like_schedule(problem):
+    extended, distance_matrix, engine, routes, loads, _ = problem
+    for v, route in enumerate(routes):
+        for i1 in range(len(route)):
+            for i2 in range(len(route)):
+                if i1 == i2:
+                    continue
+                move = ('swap_within', v, i1, i2)
+                trial = copy.deepcopy(routes)
+                apply_move(move, trial, list(loads), MoveContext(extended, distance_matrix))
+                change = scheduled_penalty(engine, trial[v], v) - scheduled_penalty(engine, route, v)
+                assert engine.penalty_change(move, routes) == pytest.approx(change, abs=1e-6)
+
+
+def test_polish_lowers_distance_plus_penalty(problem):
+    _, distance_matrix, engine, routes, loads, ctx = problem
+
+    def distance():
+        return sum(distance_matrix.route_distance([p + 1 for p in route]) for route in routes if route)
+
+    distance_before, penalty_before = distance(), engine.penalty
+    change = polish_routes(routes, loads, ctx, engine=engine)
+    assert distance() == pytest.approx(distance_before + change, abs=1e-6)
+    assert distance() + engine.penalty < distance_before + penalty_before
+    assert engine.penalty == pytest.approx(sum(scheduled_penalty(engine, route, v) for v, route in enumerate(routes)),
+                                           abs=1e-6)
+
+
+def test_polish_stops_at_deadline(problem):
+    _, _, engine, routes, loads, ctx = problem
+    before = copy.deepcopy(routes)
+    assert polish_routes(routes, loads, ctx, engine=engine, deadline=time.time()) == 0.0
+    assert routes == before
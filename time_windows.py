@@ -0,0 +1,480 @@
+import argparse
+import json
+import math
+import os
+import random
+import time
+
+import numpy as np
+
+from construction import construct_routes
+from distance_matrix import DistanceMatrix
+from models import Instance, decode_routes
+from simulated_annealing_module import anneal_routes
+from genetic_algorithm_module import initialize_population, evolve
+from solver import ALGORITHMS, load_instance, normalize_instance
+
+# Cost added per time unit of lateness (time warp) and per unit of weight over a trip's capacity
+TIME_WARP_PENALTY = 10.0
+OVERLOAD_PENALTY = 10.0
+
+# Time windows and multi-trip routes. Packages may carry 'ready' (earliest start of the delivery),
+# 'due' (latest start) and 'service' (time spent at the stop); travel time is distance / speed.
+# Vehicles leave the (0, 0) shop at time 0 and must be back by the horizon. With trips > 1 every
+# vehicle adds trips - 1 reload stops to a shared pool: weightless stops at the shop (package index
+# n_packages and up, see with_reloads) where the vehicle spends reload_time and starts a new trip
+# with a full capacity. The solvers move reload stops like any other package, so the move code is
+# unchanged; RouteEngine prices lateness and trip overloads on top of the distance.
+
+# Route segments are summarised as tuples (Vidal et al. 2013, concatenation of time-window
+# subsequences, extended with trip loads):
+#   first, last        matrix nodes at both ends
+#   duration           time from the start of service at first to the end of service at last
+#   warp               time warp: lateness that had to be "undone" to reach every stop in its window
+#   earliest, latest   window for the start of service at first that keeps warp and waiting lowest
+#   head, tail         load before the first / after the last reload stop (the whole load without one)
+#   overload           weight over capacity of the complete trips inside the segment
+#   reloads            number of reload stops in the segment
+# Two summaries join in O(1), so a route's prefixes (forward) and suffixes (backward) give the cost
+# of any route made of a prefix, a few stops and a suffix without walking the route.
+
+
+# Time window columns of the packages of an instance (not of its reload stops)
+class TimeWindows:
+    def __init__(self, ready, due, service, speed=1.0, reload_time=0.0, horizon=math.inf):
+        self.ready = [float(t) for t in ready]
+        self.due = [float(t) for t in due]
+        self.service = [float(t) for t in service]
+        self.speed = float(speed)
+        self.reload_time = float(reload_time)
+        self.horizon = float(horizon)
+        if self.speed <= 0:
+            raise ValueError(f"speed must be positive (got {speed})")
+        for p, (ready_at, due_at) in enumerate(zip(self.ready, self.due)):
+            if ready_at > due_at:
+                raise ValueError(f"Package at index {p} is ready at {ready_at} after it is due at {due_at}")
+
+    # Optional 'ready', 'due' and 'service' fields of package dicts; missing ones leave the
+    # package open from 0 to the horizon with no service time
+    @classmethod
+    def from_dicts(cls, packages, speed=1.0, reload_time=0.0, horizon=math.inf):
+        return cls([p.get('ready', 0.0) for p in packages], [p.get('due', horizon) for p in packages],
+                   [p.get('service', 0.0) for p in packages], speed, reload_time, horizon)
+
+    @property
+    def n_packages(self):
+        return len(self.ready)
+
+
+# instance with the reload stops of trips trips per vehicle appended: trips - 1 per vehicle, ids -1,
+# -2, ... at the shop, weightless and without priority. Vehicle capacities are multiplied by trips,
+# so the capacity checks of the move code bound a route by trips full loads; the capacity of every
+# single trip is checked by RouteEngine.
+def with_reloads(instance, trips):
+    if trips < 1:
+        raise ValueError(f"trips must be at least 1 (got {trips})")
+    count = instance.n_vehicles * (trips - 1)
+    zeros = np.zeros(count)
+    return Instance(np.concatenate((instance.package_ids, -np.arange(1, count + 1))),
+                    np.concatenate((instance.x, zeros)), np.concatenate((instance.y, zeros)),
+                    np.concatenate((instance.weight, zeros)),
+                    np.concatenate((instance.priority, zeros.astype(np.int64))),
+                    instance.vehicle_ids, instance.capacity * trips)
+
+
+# Time-window and trip-capacity penalties of routes, kept per route as prefix and suffix summaries.
+# instance is the instance the routes index (with its reload stops, see with_reloads), windows the
+# TimeWindows of its packages and capacities the capacity of a single trip of every vehicle.
+# load(routes) sets up every route and update(routes, vehicles) the routes a move touched (O(route
+# length) each); penalty_change and feasible_move then price a move of moves.py in O(1) for moves
+# between routes, and in O(length of the changed stretch) for moves inside a route.
+class RouteEngine:
+    def __init__(self, instance, windows, distance_matrix, capacities=None,
+                 time_warp_penalty=TIME_WARP_PENALTY, overload_penalty=OVERLOAD_PENALTY):
+        self.windows = windows
+        self.distance = distance_matrix.distance
+        self.speed = windows.speed
+        self.n_packages = windows.n_packages
+        self.capacities = (instance.capacity if capacities is None else np.asarray(capacities, dtype=float)).tolist()
+        self.time_warp_penalty = time_warp_penalty
+        self.overload_penalty = overload_penalty
+        self.weights = instance.weight.tolist()
+        horizon = windows.horizon
+        self.stops = [(p + 1, p + 1, service, 0.0, ready, due, weight, weight, 0.0, 0)
+                      for p, (ready, due, service, weight) in enumerate(zip(windows.ready, windows.due,
+                                                                            windows.service, self.weights))]
+        self.stops += [(p + 1, p + 1, windows.reload_time, 0.0, 0.0, horizon, 0.0, 0.0, 0.0, 1)
+                       for p in range(self.n_packages, instance.n_packages)]
+        self.depot = (0, 0, 0.0, 0.0, 0.0, horizon, 0.0, 0.0, 0.0, 0)
+        self.forward = []
+        self.backward = []
+        self.penalties = []
+
+    # Is package index p a reload stop
+    def is_reload(self, p):
+        return p >= self.n_packages
+
+    def join(self, a, b, capacity):
+        if a is None:
+            return b
+        if b is None:
+            return a
+        a_first, a_last, a_duration, a_warp, a_earliest, a_latest, a_head, a_tail, a_overload, a_reloads = a
+        b_first, b_last, b_duration, b_warp, b_earliest, b_latest, b_head, b_tail, b_overload, b_reloads = b
+        travel = self.distance(a_last, b_first) / self.speed
+        delta = a_duration - a_warp + travel
+        wait = max(b_earliest - delta - a_latest, 0.0)
+        warp = max(a_earliest + delta - b_latest, 0.0)
+        if not b_reloads:
+            head = a_head if a_reloads else a_head + b_head
+            tail = a_tail + b_head
+            overload = a_overload
+        elif not a_reloads:
+            head = a_head + b_head
+            tail = b_tail
+            overload = b_overload
+        else:
+            head = a_head
+            tail = b_tail
+            overload = a_overload + b_overload + max(a_tail + b_head - capacity, 0.0)
+        return (a_first, b_last, a_duration + b_duration + travel + wait, a_warp + b_warp + warp,
+                max(b_earliest - delta, a_earliest) - wait, min(b_latest - delta, a_latest) + warp,
+                head, tail, overload, a_reloads + b_reloads)
+
+    # Summary of the stops (package indices) in order, None when there are none
+    def chain(self, packages, capacity):
+        summary = None
+        stops = self.stops
+        for p in packages:
+            summary = self.join(summary, stops[p], capacity)
+        return summary
+
+    # Penalty of a route that starts with the summary prefix (beginning at the shop) and is closed
+    # by the return to the shop
+    def close(self, prefix, capacity):
+        route = self.join(prefix, self.depot, capacity)
+        overload = route[8] + max(route[6] - capacity, 0.0)
+        if route[9]:
+            overload += max(route[7] - capacity, 0.0)
+        return self.time_warp_penalty * route[3] + self.overload_penalty * overload
+
+    # Penalty of a whole route of vehicle v, worked out from scratch
+    def route_penalty(self, route, v):
+        capacity = self.capacities[v]
+        return self.close(self.join(self.depot, self.chain(route, capacity), capacity), capacity)
+
+    # Total penalty of routes (one per vehicle) without touching the stored summaries, e.g. for the GA
+    def routes_penalty(self, routes):
+        return sum(self.route_penalty(route, v) for v, route in enumerate(routes) if route)
+
+    def load(self, routes):
+        m = len(routes)
+        self.forward = [None] * m
+        self.backward = [None] * m
+        self.penalties = [0.0] * m
+        self.update(routes, range(m))
+
+    def update(self, routes, vehicles):
+        join, stops = self.join, self.stops
+        for v in vehicles:
+            route = routes[v]
+            capacity = self.capacities[v]
+            forward = [self.depot]
+            for p in route:
+                forward.append(join(forward[-1], stops[p], capacity))
+            backward = [None] * (len(route) + 1)
+            for k in range(len(route) - 1, -1, -1):
+                backward[k] = join(stops[route[k]], backward[k + 1], capacity)
+            self.forward[v] = forward
+            self.backward[v] = backward
+            self.penalties[v] = self.close(forward[-1], capacity)
+
+    @property
+    def penalty(self):
+        return sum(self.penalties)
+
+    # Summary of the suffix of route s from k on, for use in route t: the stored one unless it holds
+    # complete trips priced with a different capacity
+    def _suffix(self, routes, s, k, t):
+        suffix = self.backward[s][k]
+        if suffix is not None and suffix[9] > 1 and self.capacities[s] != self.capacities[t]:
+            suffix = self.chain(routes[s][k:], self.capacities[t])
+        return suffix
+
+    # (vehicle, penalty after the move) for every route the move changes
+    def evaluate(self, move, routes):
+        kind = move[0]
+        forward, backward, stops, capacities = self.forward, self.backward, self.stops, self.capacities
+        join, close, chain = self.join, self.close, self.chain
+
+        if kind in ('relocate', 'move'):
+            s, i, t = move[1:4]
+            p = routes[s][i]
+            cs, ct = capacities[s], capacities[t]
+            pos = move[4] if kind == 'relocate' else len(routes[t])
+            return [(s, close(join(forward[s][i], backward[s][i + 1], cs), cs)),
+                    (t, close(join(join(forward[t][pos], stops[p], ct), backward[t][pos], ct), ct))]
+
+        if kind in ('swap', 'swap_between'):
+            _, s, i, t, j = move
+            p, q = routes[s][i], routes[t][j]
+            cs, ct = capacities[s], capacities[t]
+            if kind == 'swap':
+                return [(s, close(join(join(forward[s][i], stops[q], cs), backward[s][i + 1], cs), cs)),
+                        (t, close(join(join(forward[t][j], stops[p], ct), backward[t][j + 1], ct), ct))]
+            return [(s, close(join(join(forward[s][i], backward[s][i + 1], cs), stops[q], cs), cs)),
+                    (t, close(join(join(forward[t][j], backward[t][j + 1], ct), stops[p], ct), ct))]
+
+        if kind == '2opt_star':
+            _, s, i, t, j = move
+            cs, ct = capacities[s], capacities[t]
+            return [(s, close(join(forward[s][i + 1], self._suffix(routes, t, j, s), cs), cs)),
+                    (t, close(join(forward[t][j], self._suffix(routes, s, i + 1, t), ct), ct))]
+
+        # Moves inside one route: the prefix and suffix around the changed stretch, which is chained
+        v = move[1]
+        route, capacity = routes[v], capacities[v]
+        if kind == '2opt':
+            _, _, lo, hi = move
+            middle, a, b = route[lo:hi][::-1], lo, hi
+        elif kind == 'reorder':
+            _, _, i, j = move
+            a, b = min(i, j), max(i, j) + 1
+            middle = [route[b - 1]] + route[a + 1:b - 1] + [route[a]]
+        elif kind == 'or_opt':
+            _, _, i, length, j = move
+            segment = route[i:i + length]
+            if j < i:
+                middle, a, b = segment + route[j + 1:i], j + 1, i + length
+            else:
+                middle, a, b = route[i + length:j + 1] + segment, i, j + 1
+        else:  # 'swap_within'
+            _, _, i1, i2 = move
+            a, b = min(i1, i2), len(route)
+            middle = [p for k, p in enumerate(route[a:], a) if k != i1 and k != i2] + [route[i2], route[i1]]
+        return [(v, close(join(join(forward[v][a], chain(middle, capacity), capacity), backward[v][b], capacity),
+                          capacity))]
+
+    # Change in the total penalty if move (from moves.py, not yet applied) were made
+    def penalty_change(self, move, routes):
+        if move is None:
+            return 0.0
+        penalties = self.penalties
+        return sum(penalty - penalties[v] for v, penalty in self.evaluate(move, routes))
+
+    # Current penalty of the routes move would change: no move lowers the total penalty by more, so
+    # a move whose distance change minus this cannot beat another one need not be priced
+    def penalty_at_stake(self, move):
+        penalties = self.penalties
+        if move[0] in ('relocate', 'move', 'swap', 'swap_between', '2opt_star'):
+            return penalties[move[1]] + penalties[move[3]]
+        return penalties[move[1]]
+
+    # Would every route the move changes keep to its time windows and trip capacities
+    def feasible_move(self, move, routes):
+        return move is None or all(penalty <= 1e-9 for _, penalty in self.evaluate(move, routes))
+
+    # Timetable of a route: per stop (package index, arrival, start of service, lateness),
+    # then the return to the shop as (None, arrival, arrival, lateness)
+    def schedule(self, route):
+        windows, n = self.windows, self.n_packages
+        rows = []
+        now = 0.0
+        node = 0
+        for p in route + [None]:
+            target = 0 if p is None else p + 1
+            arrival = now + self.distance(node, target) / self.speed
+            if p is None:
+                ready, due, service = 0.0, windows.horizon, 0.0
+            elif p >= n:
+                ready, due, service = 0.0, windows.horizon, windows.reload_time
+            else:
+                ready, due, service = windows.ready[p], windows.due[p], windows.service[p]
+            start = max(arrival, ready)
+            late = max(start - due, 0.0)
+            rows.append((p, arrival, start, late))
+            now = start - late + service
+            node = target
+        return rows
+
+    # Trips of a route: its packages cut at the reload stops, empty trips dropped
+    def trips(self, route):
+        trips = [[]]
+        for p in route:
+            if p >= self.n_packages:
+                trips.append([])
+            else:
+                trips[-1].append(p)
+        return [trip for trip in trips if trip]
+
+
+# Spread the reload stops of instance over routes: each route, taken without its reload stops, gets
+# one before every package that would overload the current trip, while the pool lasts; the stops
+# left over go to the ends of the routes in turn. Returns the new routes.
+def place_reloads(routes, engine, n_stops):
+    n = engine.n_packages
+    weights, capacities = engine.weights, engine.capacities
+    pool = list(range(n + n_stops - 1, n - 1, -1))
+    placed = []
+    for v, route in enumerate(routes):
+        new_route = []
+        load = 0.0
+        for p in route:
+            if p >= n:
+                continue
+            if load and load + weights[p] > capacities[v] and pool:
+                new_route.append(pool.pop())
+                load = 0.0
+            new_route.append(p)
+            load += weights[p]
+        placed.append(new_route)
+    for k, stop in enumerate(reversed(pool)):
+        placed[k % len(placed)].append(stop)
+    return placed
+
+
+# Start for time windows: packages by due time (then ready time), each appended to the route where
+# distance + penalty grow least, priced in O(1) from the routes' end summaries. A vehicle whose
+# trip would overflow goes back to the shop first while reload stops are left; stops left over go
+# to the ends of the routes in turn. Returns one route per vehicle.
+def due_date_routes(engine, n_stops, n_vehicles):
+    n = engine.n_packages
+    windows, weights, capacities, stops = engine.windows, engine.weights, engine.capacities, engine.stops
+    join, close, d = engine.join, engine.close, engine.distance
+    pool = list(range(n + n_stops - 1, n - 1, -1))
+    routes = [[] for _ in range(n_vehicles)]
+    ends = [engine.depot] * n_vehicles
+    penalties = [0.0] * n_vehicles
+    trip_loads = [0.0] * n_vehicles
+    for p in sorted(range(n), key=lambda p: (windows.due[p], windows.ready[p])):
+        best = None
+        for v in range(n_vehicles):
+            capacity = capacities[v]
+            end, last = ends[v], ends[v][1]
+            reload = bool(pool) and trip_loads[v] > 0 and trip_loads[v] + weights[p] > capacity
+            if reload:
+                end = join(end, stops[pool[-1]], capacity)
+            end = join(end, stops[p], capacity)
+            penalty = close(end, capacity)
+            cost = d(last, p + 1) + d(p + 1, 0) - d(last, 0) + penalty - penalties[v]
+            if best is None or cost < best[0]:
+                best = (cost, v, end, penalty, reload)
+        _, v, ends[v], penalties[v], reload = best
+        if reload:
+            routes[v].append(pool.pop())
+            trip_loads[v] = 0.0
+        routes[v].append(p)
+        trip_loads[v] += weights[p]
+    for k, stop in enumerate(reversed(pool)):
+        routes[k % n_vehicles].append(stop)
+    return routes
+
+
+# Solve an instance (dict or path) whose packages may carry 'ready', 'due' and 'service' fields,
+# with trips trips per vehicle (see with_reloads), with SA ('sa') or the GA ('ga'). The SA starts
+# from params['initial']: 'due' (due_date_routes, the default) or a construction heuristic whose
+# routes get their reload stops from place_reloads; the GA population is seeded with the 'due'
+# routes plus params['seed_fraction'] of heuristic ones. Both search with a RouteEngine: its
+# penalty is added to every SA move's delta and to the GA fitness, and the SA polish only makes
+# moves that pay off including it. Other params go to anneal_routes / evolve (the GA also takes
+# 'population_size' and 'seed_fraction'). The result follows solver.solve, with every route's trips
+# and arrival times, and the lateness, overload and feasibility of the solution.
+def solve_with_windows(instance, algorithm='sa', params=None, time_limit=None, seed=None, trips=1, speed=1.0,
+                       reload_time=0.0, horizon=math.inf, stats=None, callback=None):
+    if isinstance(instance, (str, os.PathLike)):
+        instance = load_instance(instance)
+    else:
+        instance = normalize_instance(instance)
+    if algorithm not in ALGORITHMS:
+        raise ValueError(f"Unknown algorithm '{algorithm}' (expected one of {', '.join(ALGORITHMS)})")
+    params = dict(params or {})
+    if seed is not None:
+        random.seed(seed)
+    if stats is None:
+        stats = {}
+
+    start = time.time()
+    packages = instance['packages']
+    columns = Instance.from_dicts(instance['vehicles'], packages)
+    windows = TimeWindows.from_dicts(packages, speed, reload_time, horizon)
+    extended = with_reloads(columns, trips)
+    n_stops = extended.n_packages - columns.n_packages
+    distance_matrix = DistanceMatrix.from_instance(extended)
+    engine = RouteEngine(extended, windows, distance_matrix, columns.capacity)
+
+    if algorithm == 'sa':
+        initial = params.pop('initial', 'due')
+        if initial == 'due':
+            routes = due_date_routes(engine, n_stops, columns.n_vehicles)
+        else:
+            routes = place_reloads(construct_routes(extended, initial, distance_matrix), engine, n_stops)
+        weights = extended.weight.tolist()
+        loads = [sum(weights[p] for p in route) for route in routes]
+        best_routes, _, _ = anneal_routes(extended, routes, loads, distance_matrix, time_limit=time_limit,
+                                          stats=stats, callback=callback, engine=engine, **params)
+        routes = decode_routes(best_routes)
+    else:
+        population = initialize_population(extended, params.pop('population_size', 30),
+                                           params.pop('seed_fraction', 0.0), distance_matrix)
+        population = [due_date_routes(engine, n_stops, columns.n_vehicles)] + [
+            place_reloads(individual, engine, n_stops) for individual in population[1:]]
+        routes = evolve(population, extended, distance_matrix=distance_matrix, time_limit=time_limit, stats=stats,
+                        callback=callback, engine=engine, **params)
+    return windows_result(algorithm, routes, columns, engine, distance_matrix, time.time() - start,
+                          stats.get('evaluations', 0))
+
+
+# Result dict of solve_with_windows for routes over the instance with reload stops
+def windows_result(algorithm, routes, columns, engine, distance_matrix, elapsed, evaluations):
+    ids = columns.package_ids.tolist()
+    weights = engine.weights
+    capacities = engine.capacities
+    result_routes = []
+    distance = warp = overload = 0.0
+    assigned = set()
+    for v, route in enumerate(routes):
+        trips = engine.trips(route)
+        timetable = engine.schedule(route)
+        finish = timetable[-1][1]
+        trip_loads = [sum(weights[p] for p in trip) for trip in trips]
+        warp += sum(late for _, _, _, late in timetable)
+        overload += sum(max(load - capacities[v], 0.0) for load in trip_loads)
+        distance += distance_matrix.route_distance([p + 1 for p in route]) if route else 0.0
+        assigned.update(p for trip in trips for p in trip)
+        result_routes.append({'vehicle_id': columns.vehicle_ids.item(v), 'capacity': capacities[v],
+                              'load': float(sum(trip_loads)), 'packages': [ids[p] for trip in trips for p in trip],
+                              'trips': [[ids[p] for p in trip] for trip in trips], 'trip_loads': trip_loads,
+                              'arrivals': [arrival for p, arrival, _, _ in timetable if p is not None
+                                           and not engine.is_reload(p)],
+                              'finish': finish if route else 0.0})
+    return {'algorithm': algorithm, 'routes': result_routes, 'distance': float(distance),
+            'time_warp': warp, 'overload': overload, 'feasible': warp <= 1e-9 and overload <= 1e-9,
+            'unassigned': [ids[p] for p in range(columns.n_packages) if p not in assigned],
+            'elapsed': elapsed, 'evaluations': evaluations}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Solve an instance with delivery time windows and reload trips.")
+    parser.add_argument('instance', help="instance file (.json or .csv); packages may have ready, due and service")
+    parser.add_argument('-a', '--algorithm', choices=['sa', 'ga'], default='sa')
+    parser.add_argument('-p', '--params', default='{}', help="solver parameters as a JSON object")
+    parser.add_argument('-t', '--time-limit', type=float, help="wall-clock budget in seconds")
+    parser.add_argument('-s', '--seed', type=int)
+    parser.add_argument('--trips', type=int, default=1, help="trips per vehicle, reloading at the shop")
+    parser.add_argument('--speed', type=float, default=1.0, help="distance units per time unit")
+    parser.add_argument('--reload-time', type=float, default=0.0, help="time spent reloading at the shop")
+    parser.add_argument('--horizon', type=float, default=math.inf, help="time by which vehicles are back")
+    parser.add_argument('-o', '--output', help="write the result JSON here instead of stdout")
+    args = parser.parse_args(argv)
+
+    result = solve_with_windows(args.instance, args.algorithm, json.loads(args.params), args.time_limit, args.seed,
+                                args.trips, args.speed, args.reload_time, args.horizon)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+    else:
+        print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
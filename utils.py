@@ -1,16 +1,24 @@
 import math
+from distance_matrix import DistanceMatrix, package_key
 
 #between two locations is calculated using the Euclidean distance formula
 def EulideanDistance (p1,p2):
     return math.sqrt((p1[0] -p2[0] )**2 + (p1[1] - p2[1]) **2)
 
-def TotalRouteDistance(route,start=(0,0)):
+def TotalRouteDistance(route,start=(0,0),distance_matrix=None):
 
-    distance=0.0
-    prev=start
-    for pkg in route:
-        distance+= EulideanDistance(prev,pkg.destination)
-        prev= pkg.destination
-    distance+= EulideanDistance(prev,start)
-    return distance
+    if distance_matrix is None:
+        distance_matrix = DistanceMatrix.from_packages(route, depot=start, dense=False)
+    return distance_matrix.route_distance_keys([package_key(pkg) for pkg in route])
 
+# Run a solver generator (simulated_annealing_module.iter_anneal_routes,
+# genetic_algorithm_module.iter_evolve_population) to the end,
+# passing every progress dict to callback; a callback returning True stops the search early.
+def run_steps(steps, callback=None):
+    stop = None
+    while True:
+        try:
+            progress = steps.send(stop)
+        except StopIteration as done:
+            return done.value
+        stop = bool(callback(progress)) if callback is not None else None